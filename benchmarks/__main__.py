@@ -0,0 +1,61 @@
+"""
+运行基准测试并与保存的基准对比
+
+    # 运行所有用例并保存为基准
+    python -m benchmarks run -o baseline.json
+    # 只运行名称包含wsgi或error的用例
+    python -m benchmarks run -k wsgi -k error
+    # 运行并与基准对比，有用例变慢超过10%时返回1
+    python -m benchmarks run -o current.json --compare baseline.json --threshold 10
+    # 对比两个已保存的结果
+    python -m benchmarks compare baseline.json current.json --threshold 10
+
+bench_*.py为对比某项优化前后的单独脚本，用python -m benchmarks.bench_xxx运行
+"""
+import argparse
+import sys
+
+from benchmarks.suite import compare, load, run, save
+
+
+def report(rows: list, threshold: float, out=sys.stdout) -> bool:
+    """输出对比结果，返回是否没有超出threshold的用例"""
+    ok = True
+    for name, before, after, change, regressed in rows:
+        mark = ' REGRESSION' if regressed else ''
+        out.write(f'{name:32} {before:12.0f} ns -> {after:12.0f} ns {change:+7.1f}%{mark}\n')
+        ok = ok and not regressed
+    out.write(f'{"OK" if ok else "FAILED"} (threshold {threshold}%)\n')
+    return ok
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='运行用例')
+    run_parser.add_argument('-k', dest='names', action='append', help='只运行名称包含此字符串的用例')
+    run_parser.add_argument('-o', '--output', help='保存结果的json文件')
+    run_parser.add_argument('--min-time', type=float, default=0.2, help='每轮测量的最短时间（秒）')
+    run_parser.add_argument('--repeat', type=int, default=5, help='测量轮数，取最短的一轮')
+    run_parser.add_argument('--compare', help='与此基准对比')
+    run_parser.add_argument('--threshold', type=float, default=10.0, help='允许变慢的百分比')
+    compare_parser = commands.add_parser('compare', help='对比两个已保存的结果')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help='允许变慢的百分比')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        current = run(args.names, args.min_time, args.repeat)
+        if args.output:
+            save(current, args.output)
+        if not args.compare:
+            return 0
+        baseline = load(args.compare)
+    else:
+        baseline, current = load(args.baseline), load(args.current)
+    return 0 if report(compare(baseline, current, args.threshold), args.threshold) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
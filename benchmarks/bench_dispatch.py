@@ -0,0 +1,45 @@
+"""
+对比[api_response, api_cors]与api_view每次请求的额外开销
+
+    python -m benchmarks.bench_dispatch
+"""
+import timeit
+
+from flask import Flask
+
+from flask_apikit import APIKit
+from flask_apikit.decorators import api_cors, api_response, api_view
+
+
+VIEWS = {
+    'dict': lambda: {'hello': 'apikit'},
+    'tuple': lambda: ({'hello': 'apikit'}, 201, {'X-Custom-Header': 'APIKIT'}),
+    'none': lambda: None,
+}
+
+
+def main():
+    app = Flask(__name__)
+    APIKit(app)
+    for name, view in VIEWS.items():
+        app.add_url_rule(f'/stacked/{name}', f'stacked_{name}', api_cors(api_response(view)))
+        app.add_url_rule(f'/fused/{name}', f'fused_{name}', api_view(view))
+    number = 20000
+    for headers in ({'Origin': 'https://example.com'}, {}):
+        print(f'headers: {headers}')
+        for name in VIEWS:
+            costs = []
+            for kind in ('stacked', 'fused'):
+                endpoint = f'{kind}_{name}'
+                with app.test_request_context(f'/{kind}/{name}', headers=headers):
+                    # 只计算视图函数及Flask dispatch中的make_response，不含路由和WSGI
+                    func = app.view_functions[endpoint]
+                    costs.append(min(timeit.repeat(
+                        lambda: app.make_response(func()),
+                        number=number, repeat=5)) / number)
+            print(f'  {name:6} stacked {costs[0] * 1e6:7.2f} us  fused {costs[1] * 1e6:7.2f} us'
+                  f'  saved {(costs[0] - costs[1]) * 1e6:6.2f} us')
+
+
+if __name__ == '__main__':
+    main()
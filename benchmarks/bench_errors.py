@@ -0,0 +1,74 @@
+"""
+对比错误响应的几种方式的耗时
+
+    python -m benchmarks.bench_errors
+
+- old: 原来的方式，raise错误，每次json化响应体
+- raise: raise错误，由api_error_handler使用缓存的响应体
+- return: return错误实例，不生成traceback
+- singleton: return预先创建的错误实例
+"""
+import timeit
+
+from flask import Flask, jsonify
+
+from flask_apikit import APIKit
+from flask_apikit.decorators import api_error_handler, api_view
+from flask_apikit.exceptions import APIError
+
+
+class NeedLogin(APIError):
+    status_code = 401
+    code = 100
+    message = 'Need Login'
+
+
+NEED_LOGIN = NeedLogin()
+
+
+def check(depth: int):
+    """模拟在几层函数调用内发现错误"""
+    if depth:
+        return check(depth - 1)
+    raise NeedLogin('token expired')
+
+
+def old_view():
+    try:
+        check(3)
+    except NeedLogin as e:
+        # 原来的APIError.__init__与to_tuple
+        message = f'{NeedLogin._message}: token expired'
+        return jsonify({'error': 'NeedLogin', 'code': e.code, 'message': message}), e.status_code
+
+
+VIEWS = {
+    'old': old_view,
+    'raise': api_view(lambda: check(3)),
+    'return': api_view(lambda: NeedLogin('token expired')),
+    'singleton': api_view(lambda: NEED_LOGIN),
+}
+
+
+def respond(app, view):
+    """与Flask处理请求相同：视图抛出的APIError交给APIKit注册的api_error_handler"""
+    try:
+        rv = view()
+    except APIError as e:
+        return api_error_handler(e)
+    return app.make_response(rv)
+
+
+def main():
+    app = Flask(__name__)
+    APIKit(app)
+    number = 20000
+    with app.test_request_context('/'):
+        for name, view in VIEWS.items():
+            cost = min(timeit.repeat(lambda: respond(app, view),
+                                     number=number, repeat=5)) / number
+            print(f'{name:10} {cost * 1e6:7.2f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+对比get_json在大请求体下不同json解码器的耗时
+
+    python -m benchmarks.bench_json_decoder
+"""
+import io
+import json
+import timeit
+
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+
+from flask_apikit import APIKit
+from flask_apikit.utils.body import JSON_DECODERS, load_json
+
+
+def make_body(size: int) -> bytes:
+    """生成约size字节的json文档"""
+    item = {'id': 123456, 'name': '名称 name', 'score': 98.5, 'tags': ['a', 'b', 'c'], 'active': True}
+    per_item = len(json.dumps(item).encode())
+    return json.dumps({'items': [item] * (size // per_item)}).encode()
+
+
+def bench(app, body: bytes, decoder, zero_copy: bool, number: int) -> float:
+    environ = EnvironBuilder(method='POST', data=body, content_type='application/json').get_environ()
+
+    def run():
+        env = dict(environ)
+        env['wsgi.input'] = io.BytesIO(body)
+        with app.request_context(env):
+            load_json(decoder=decoder, zero_copy=zero_copy)
+
+    return min(timeit.repeat(run, number=number, repeat=5)) / number
+
+
+def main():
+    app = Flask(__name__)
+    APIKit(app)
+    for size in (200 * 1024, 500 * 1024):
+        body = make_body(size)
+        print(f'body: {len(body) // 1024} KB')
+        for decoder in [None, *JSON_DECODERS]:
+            for zero_copy in (False, True):
+                cost = bench(app, body, decoder, zero_copy, number=20)
+                print(f'  {str(decoder or "flask"):8} zero_copy={zero_copy!s:5} {cost * 1000:8.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+对比记录一个span的耗时
+
+    python -m benchmarks.bench_tracing
+
+- empty: 空的上下文管理器，作为参照
+- off: 没有开启tracing时的span
+- on: 开启tracing时的span（只计入放入队列的开销，导出在后台线程进行）
+"""
+import timeit
+from collections import deque
+
+from flask_apikit.tracing import current_trace, span, Trace
+
+
+class Empty:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def empty():
+    with Empty():
+        pass
+
+
+def traced():
+    with span('db'):
+        pass
+
+
+def main():
+    number = 200000
+    trace = Trace('0' * 32, deque(maxlen=number))
+    for name, func, value in (('empty', empty, None), ('off', traced, None), ('on', traced, trace)):
+        token = current_trace.set(value)
+        cost = min(timeit.repeat(func, number=number, repeat=5)) / number
+        current_trace.reset(token)
+        print(f'{name:10} {cost * 1e9:7.0f} ns')
+
+
+if __name__ == '__main__':
+    main()
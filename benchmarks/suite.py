@@ -0,0 +1,302 @@
+"""
+APIKit各热点路径的基准测试
+
+每个用例的setup(stack)返回一个无参函数，测量其每次调用的耗时（纳秒）
+stack为contextlib.ExitStack，用于在测量结束后退出请求上下文等
+
+- client.*: 通过Flask测试客户端发送完整请求
+- wsgi.*: 直接调用app.wsgi_app，不含测试客户端的开销
+- 其它: 在请求上下文中直接调用，只包含APIKit本身的开销
+
+运行和对比见benchmarks/__main__.py
+"""
+import json
+import platform
+import sys
+import timeit
+from contextlib import ExitStack
+from io import BytesIO
+
+import flask
+import marshmallow
+from flask import current_app, Flask
+from marshmallow import Schema, fields
+from werkzeug.test import EnvironBuilder
+
+from flask_apikit import APIKit
+from flask_apikit.decorators import api_cors, api_response, api_view
+from flask_apikit.exceptions import APIError
+from flask_apikit.responses import APIResponse, Pagination
+from flask_apikit.utils import QueryParser
+from flask_apikit.views import APIView
+
+# {用例名: setup(stack)，返回被测函数}
+CASES = {}
+ORIGIN = {'Origin': 'https://example.com'}
+PAYLOAD = {'name': 'apikit', 'age': 3, 'tags': ['a', 'b', 'c'], 'profile': {'city': 'x' * 32}}
+
+
+def case(name: str):
+    """注册一个用例"""
+    def decorator(setup):
+        CASES[name] = setup
+        return setup
+
+    return decorator
+
+
+class NeedLogin(APIError):
+    status_code = 401
+    code = 100
+    message = 'Need Login'
+
+
+class UserSchema(Schema):
+    name = fields.Str(required=True)
+    age = fields.Int()
+    tags = fields.List(fields.Str())
+    profile = fields.Dict()
+
+
+class QuerySchema(Schema):
+    page = fields.Int()
+    names = fields.List(fields.Str())
+
+
+class JSONView(APIView):
+    def post(self):
+        return self.get_json()
+
+
+class JSONSchemaView(APIView):
+    def post(self):
+        return self.get_json(UserSchema())
+
+
+class QueryView(APIView):
+    def get(self):
+        return self.get_query({'page': QueryParser.int, 'names': []})
+
+
+class QuerySchemaView(APIView):
+    def get(self):
+        return self.get_query({'page': QueryParser.int, 'names': []}, QuerySchema())
+
+
+def hello():
+    return {'hello': 'apikit'}
+
+
+def make_app() -> Flask:
+    app = Flask(__name__)
+    APIKit(app)
+    app.add_url_rule('/cors', 'cors', api_cors(api_response(hello)), methods=['GET', 'OPTIONS'])
+    app.add_url_rule('/view', 'view', api_view(hello), methods=['GET', 'OPTIONS'])
+    app.add_url_rule('/json', view_func=JSONView.as_view('json'))
+    app.add_url_rule('/json-schema', view_func=JSONSchemaView.as_view('json_schema'))
+    app.add_url_rule('/query', view_func=QueryView.as_view('query'))
+    app.add_url_rule('/query-schema', view_func=QuerySchemaView.as_view('query_schema'))
+    return app
+
+
+def wsgi(app: Flask, *args, **kwargs):
+    """直接调用WSGI app，参数与EnvironBuilder相同"""
+    builder = EnvironBuilder(*args, **kwargs)
+    environ = builder.get_environ()
+    body = builder.input_stream.read() if builder.input_stream is not None else b''
+    builder.close()
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def run():
+        env = environ.copy()
+        env['wsgi.input'] = BytesIO(body)
+        app_iter = app.wsgi_app(env, start_response)
+        try:
+            b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    return run
+
+
+def in_request(stack: ExitStack, func, *args, **kwargs):
+    """在请求上下文中调用func，参数与test_request_context相同"""
+    stack.enter_context(make_app().test_request_context(*args, **kwargs))
+    return func
+
+
+# === 完整请求 ===
+@case('client.cors_simple')
+def client_cors_simple(stack):
+    client = make_app().test_client()
+    return lambda: client.get('/cors', headers=ORIGIN)
+
+
+@case('client.cors_preflight')
+def client_cors_preflight(stack):
+    client = make_app().test_client()
+    headers = dict(ORIGIN, **{'Access-Control-Request-Method': 'GET'})
+    return lambda: client.options('/cors', headers=headers)
+
+
+@case('wsgi.cors_simple')
+def wsgi_cors_simple(stack):
+    return wsgi(make_app(), '/cors', headers=ORIGIN)
+
+
+@case('wsgi.cors_preflight')
+def wsgi_cors_preflight(stack):
+    headers = dict(ORIGIN, **{'Access-Control-Request-Method': 'GET'})
+    return wsgi(make_app(), '/cors', method='OPTIONS', headers=headers)
+
+
+@case('wsgi.api_view')
+def wsgi_api_view(stack):
+    return wsgi(make_app(), '/view', headers=ORIGIN)
+
+
+@case('wsgi.get_json')
+def wsgi_get_json(stack):
+    return wsgi(make_app(), '/json', method='POST', json=PAYLOAD)
+
+
+@case('wsgi.get_json_schema')
+def wsgi_get_json_schema(stack):
+    return wsgi(make_app(), '/json-schema', method='POST', json=PAYLOAD)
+
+
+@case('wsgi.get_query')
+def wsgi_get_query(stack):
+    return wsgi(make_app(), '/query?page=2&names=a&names=b')
+
+
+@case('wsgi.get_query_schema')
+def wsgi_get_query_schema(stack):
+    return wsgi(make_app(), '/query-schema?page=2&names=a&names=b')
+
+
+# === api_response的各种返回值 ===
+RETURN_VALUES = {
+    'dict': lambda: {'hello': 'apikit'},
+    'list': lambda: [1, 2, 'go'],
+    'none': lambda: None,
+    'tuple': lambda: ({'hello': 'apikit'}, 201, {'X-Custom-Header': 'APIKit'}),
+    'api_response': lambda: APIResponse({'hello': 'apikit'}, 201),
+    'pagination': lambda: Pagination().set_data([1, 2, 3], 95),
+    'error': lambda: NeedLogin(),
+}
+
+
+def _register_return_value(name, view):
+    @case(f'api_response.{name}')
+    def setup(stack):
+        func = in_request(stack, api_response(view), '/?page=2')
+        return lambda: current_app.make_response(func())
+
+
+for _name, _view in RETURN_VALUES.items():
+    _register_return_value(_name, _view)
+
+
+# === 每个请求都会创建的对象 ===
+@case('response.construct')
+def response_construct(stack):
+    return lambda: APIResponse({'hello': 'apikit'}, 201)
+
+
+@case('error.construct')
+def error_construct(stack):
+    return NeedLogin
+
+
+@case('error.construct_detail')
+def error_construct_detail(stack):
+    return lambda: NeedLogin('token expired').message
+
+
+@case('pagination.set_data')
+def pagination_set_data(stack):
+    return in_request(stack, lambda: Pagination().set_data([], 95), '/?page=2&limit=10')
+
+
+# === APIError ===
+@case('error.to_tuple')
+def error_to_tuple(stack):
+    return in_request(stack, lambda: NeedLogin().to_tuple(), '/')
+
+
+@case('error.to_tuple_detail')
+def error_to_tuple_detail(stack):
+    return in_request(stack, lambda: NeedLogin('token expired').to_tuple(), '/')
+
+
+# === Pagination ===
+@case('pagination.construct')
+def pagination_construct(stack):
+    return in_request(stack, Pagination, '/?page=2&limit=10')
+
+
+@case('pagination.headers')
+def pagination_headers(stack):
+    return in_request(stack, lambda: Pagination().set_data([], 95).to_tuple(), '/?page=2&limit=10')
+
+
+def measure(setup, min_time: float = 0.2, repeat: int = 5) -> float:
+    """返回被测函数每次调用的最短耗时（纳秒）"""
+    with ExitStack() as stack:
+        timer = timeit.Timer(setup(stack))
+        number, _ = timer.autorange()
+        number = max(1, int(number * min_time / 0.2))
+        return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def run(names: list = None, min_time: float = 0.2, repeat: int = 5, out=sys.stdout) -> dict:
+    """运行用例，返回可以保存为基准的结果"""
+    results = {}
+    for name, setup in CASES.items():
+        if names and not any(n in name for n in names):
+            continue
+        results[name] = measure(setup, min_time, repeat)
+        out.write(f'{name:32} {results[name]:12.0f} ns\n')
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'flask': flask.__version__,
+            'marshmallow': marshmallow.__version__,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = 10.0) -> list:
+    """
+    对比两次结果
+
+    :param baseline: 基准结果
+    :param current: 本次结果
+    :param threshold: 允许变慢的百分比
+    :return: [(用例名, 基准耗时, 本次耗时, 变化百分比, 是否超出threshold)]，只包含两者都有的用例
+    """
+    rows = []
+    for name, before in baseline['results'].items():
+        after = current['results'].get(name)
+        if after is None:
+            continue
+        change = (after - before) / before * 100
+        rows.append((name, before, after, change, change > threshold))
+    return rows
+
+
+def load(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save(result: dict, path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
@@ -1,3 +1,78 @@
+import gc
+import importlib
+
+from flask import current_app
+
+from flask_apikit.decorators import _preflight_response, api_error_handler, PREFLIGHT_CACHE_KEY
+from flask_apikit.exceptions import APIError, ERROR_CACHE_KEY
+from flask_apikit.metrics import BUCKETS, init_metrics
+from flask_apikit.settings import build_settings, configure_blueprint, current_settings
+
+# 开启时才导入的功能：(开关配置, 模块, 初始化函数)，关闭的功能不会被导入，减少冷启动时间
+_FEATURES = (
+    ('APIKIT_MEMORY_ENABLED', 'flask_apikit.memory', 'init_memory'),
+    ('APIKIT_PROFILE_ENABLED', 'flask_apikit.profiling', 'init_profiling'),
+    ('APIKIT_WATCHDOG_ENABLED', 'flask_apikit.watchdog', 'init_watchdog'),
+    ('APIKIT_TRACING_ENABLED', 'flask_apikit.tracing', 'init_tracing'),
+    ('APIKIT_RECORD_ENABLED', 'flask_apikit.recording', 'init_recording'),
+    ('APIKIT_BATCH_ENABLED', 'flask_apikit.batch', 'init_batch'),
+)
+# 在第一次访问时才导入的属性：{属性名: 模块}
+_LAZY_ATTRS = {
+    'init_batch': 'flask_apikit.batch',
+    'init_memory': 'flask_apikit.memory',
+    'init_profiling': 'flask_apikit.profiling',
+    'init_recording': 'flask_apikit.recording',
+    'REDACT_HEADERS': 'flask_apikit.recording',
+    'init_tracing': 'flask_apikit.tracing',
+    'init_watchdog': 'flask_apikit.watchdog',
+}
+_SUBMODULES = {
+    'batch', 'bench', 'decorators', 'exceptions', 'memory', 'metrics', 'profiling', 'recording',
+    'responses', 'settings', 'tracing', 'utils', 'views', 'watchdog'
+}
+
+
+# APIKit.warmup()时导入的延迟导入模块
+_WARMUP_MODULES = ('marshmallow', 'flask_apikit.views', 'flask_apikit.utils.bulk',
+                   'flask_apikit.utils.upload')
+# 生成带参数路由的示例路径时尝试的参数值
+_SAMPLE_VALUES = ('1', 'x')
+
+
+def _subclasses(cls):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _subclasses(sub)
+
+
+def _sample_path(rule) -> str:
+    """生成可以匹配到rule的路径，无法生成时返回None"""
+    if rule.subdomain or rule.host:
+        return None
+    for value in _SAMPLE_VALUES:
+        try:
+            built = rule.build(dict.fromkeys(rule.arguments, value), append_unknown=False)
+        except Exception:
+            continue
+        if built is not None:
+            return built[1]
+    return None
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRS.get(name)
+    if module is not None:
+        return getattr(importlib.import_module(module), name)
+    if name in _SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS) | _SUBMODULES)
+
+
 class APIKit:
     def __init__(self, app=None):
         self.app = app
@@ -18,14 +93,152 @@ class APIKit:
         app.config.setdefault('APIKIT_PAGINATION_HEADER_LIMIT_KEY', 'X-Pagination-Limit')  # 每页个数
         app.config.setdefault('APIKIT_PAGINATION_HEADER_COUNT_KEY', 'X-Pagination-Count')  # 元素总个数
         app.config.setdefault('APIKIT_PAGINATION_HEADER_PAGE_COUNT_KEY', 'X-Pagination-Page-Count')  # 总页数
+        # === 请求体限制 ===
+        app.config.setdefault('APIKIT_MAX_JSON_BYTES', 0)  # get_json读取请求体的最大字节数，设为0则为不限制
+        app.config.setdefault('APIKIT_MAX_JSON_DEPTH', 0)  # get_json解析后json的最大嵌套深度，设为0则为不限制
+        # === JSON解码 ===
+        app.config.setdefault('APIKIT_JSON_DECODER', None)  # get_json所用的解码器：None(Flask)/'stdlib'/'orjson'/'auto'/函数
+        app.config.setdefault('APIKIT_JSON_ZERO_COPY', False)  # 有Content-Length时将请求体直接读入预分配的缓冲区
+        # === 文件上传 ===
+        app.config.setdefault('APIKIT_UPLOAD_MAX_BYTES', 0)  # get_files整个请求体的最大字节数，设为0则为不限制
+        app.config.setdefault('APIKIT_UPLOAD_MAX_FILE_BYTES', 0)  # get_files单个文件的最大字节数，设为0则为不限制
+        app.config.setdefault('APIKIT_UPLOAD_MAX_FORM_BYTES', 500 * 1024)  # get_files非文件字段的最大字节数
+        app.config.setdefault('APIKIT_UPLOAD_MEMORY_THRESHOLD', 512 * 1024)  # 文件超过此大小后写入临时文件
+        app.config.setdefault('APIKIT_UPLOAD_ALLOWED_TYPES', None)  # 允许的文件Content-Type列表，如['image/*']，为None则不限制
+        # === 批量验证 ===
+        app.config.setdefault('APIKIT_BULK_CHUNK_SIZE', 1000)  # verify_many每批验证的数量
+        app.config.setdefault('APIKIT_BULK_MAX_ERRORS', 100)  # verify_many最多返回的错误个数，设为0则为不限制
+        app.config.setdefault('APIKIT_BULK_EXECUTOR', None)  # verify_many并行验证所用的Executor，如ProcessPoolExecutor
+        app.config.setdefault('APIKIT_BULK_OFFLOAD_MIN_ITEMS', 5000)  # 数据个数达到此值才交给APIKIT_BULK_EXECUTOR
+        # === 错误响应 ===
+        app.config.setdefault('APIKIT_ERROR_CACHE_SIZE', 512)  # 缓存的APIError响应体（按错误类和message区分）最大个数
+        # === 性能统计 ===
+        app.config.setdefault('APIKIT_METRICS_ENABLED', False)  # 统计每个endpoint各阶段（parse/validate/handler/serialize/cors）的耗时
+        app.config.setdefault('APIKIT_METRICS_BUCKETS', BUCKETS)  # 耗时直方图的桶上界（秒）
+        app.config.setdefault('APIKIT_METRICS_PATH', None)  # 以Prometheus文本格式返回统计数据的路径，如'/metrics'，为None则不注册
+        app.config.setdefault('APIKIT_SERVER_TIMING', False)  # 在响应中加入各阶段耗时的Server-Timing头
+        app.config.setdefault('APIKIT_SERVER_TIMING_SAMPLE_RATE', 1.0)  # 加入Server-Timing头的请求比例
+        app.config.setdefault('APIKIT_SERVER_TIMING_ORIGINS', None)  # 只对这些Origin的请求加入Server-Timing头，为None则不限制
+        # === Profile ===
+        app.config.setdefault('APIKIT_PROFILE_ENABLED', False)  # 对采样的请求进行cProfile
+        app.config.setdefault('APIKIT_PROFILE_SAMPLE_RATE', 0.0)  # 采样率
+        app.config.setdefault('APIKIT_PROFILE_ENDPOINTS', None)  # 单独设置采样率的endpoint，如{'user.list': 0.01}，为None则都使用APIKIT_PROFILE_SAMPLE_RATE
+        app.config.setdefault('APIKIT_PROFILE_DIR', None)  # 保存.pstats文件的目录，为None则使用系统临时目录下的apikit-profiles
+        app.config.setdefault('APIKIT_PROFILE_MAX_BYTES', 100 * 1024 * 1024)  # 目录中文件的最大总大小，超出时删除最早的文件
+        app.config.setdefault('APIKIT_PROFILE_TRACEMALLOC', False)  # 同时保存tracemalloc快照
+        app.config.setdefault('APIKIT_PROFILE_SECRET', None)  # 用于验证X-APIKit-Profile请求头的密钥，为None则不能通过请求头触发
+        # === 慢请求监控 ===
+        app.config.setdefault('APIKIT_WATCHDOG_ENABLED', False)  # 启动watchdog线程，记录超出耗时预算的请求的调用栈
+        app.config.setdefault('APIKIT_WATCHDOG_BUDGET', 5.0)  # 默认的耗时预算（秒），设为0则不检查
+        app.config.setdefault('APIKIT_WATCHDOG_BUDGETS', {})  # 单独设置耗时预算的endpoint（request.endpoint，蓝本中为'蓝本名.name'），如{'upload': 60}
+        app.config.setdefault('APIKIT_WATCHDOG_INTERVAL', 1.0)  # 检查间隔（秒）
+        app.config.setdefault('APIKIT_WATCHDOG_MAX_REPORTS', 10)  # 每分钟最多记录的次数
+        # === Tracing ===
+        app.config.setdefault('APIKIT_TRACING_ENABLED', False)  # 为每个请求生成trace，记录tracing.span的耗时
+        app.config.setdefault('APIKIT_TRACING_HEADER', 'X-Trace-Id')  # 传入和返回trace id的请求头（也支持W3C traceparent），为None则不返回
+        app.config.setdefault('APIKIT_TRACING_EXPORTER', None)  # 导出span的对象（有export(spans)方法）或函数，为None则写入APIKIT_TRACING_FILE
+        app.config.setdefault('APIKIT_TRACING_FILE', None)  # 写入span的JSONL文件，为None则使用系统临时目录下的apikit-traces.jsonl
+        app.config.setdefault('APIKIT_TRACING_BATCH_SIZE', 512)  # 每次导出的最大span个数
+        app.config.setdefault('APIKIT_TRACING_INTERVAL', 1.0)  # 导出间隔（秒）
+        app.config.setdefault('APIKIT_TRACING_MAX_QUEUE', 10000)  # 等待导出的span最大个数，超出时丢弃最早的span
+        # === 内存统计 ===
+        app.config.setdefault('APIKIT_MEMORY_ENABLED', False)  # 对采样的请求开启tracemalloc，按endpoint统计内存分配、响应体大小和RSS变化
+        app.config.setdefault('APIKIT_MEMORY_SAMPLE_RATE', 0.01)  # 采样率，当前进程中有其它请求同时处理时不采样
+        app.config.setdefault('APIKIT_MEMORY_TOP', 10)  # 每个endpoint报告的分配位置个数
+        app.config.setdefault('APIKIT_MEMORY_FRAMES', 1)  # tracemalloc保存的调用栈深度
+        app.config.setdefault('APIKIT_MEMORY_DUMP', None)  # 写入统计数据的json文件，可包含{pid}，如'/tmp/apikit-memory-{pid}.json'，为None则不写入
+        # === 请求录制 ===
+        app.config.setdefault('APIKIT_RECORD_ENABLED', False)  # 录制采样的请求，可用python -m flask_apikit.recording重放
+        app.config.setdefault('APIKIT_RECORD_SAMPLE_RATE', 0.01)  # 采样率
+        app.config.setdefault('APIKIT_RECORD_FILE', None)  # 写入的文件，可包含{pid}，以.gz结尾时使用gzip压缩，为None则使用系统临时目录下的apikit-requests.jsonl.gz
+        app.config.setdefault('APIKIT_RECORD_MAX_BODY', 64 * 1024)  # 录制的请求体最大字节数，超出时不录制请求体
+        app.config.setdefault('APIKIT_RECORD_MAX_QUEUE', 10000)  # 等待写入的请求最大个数，超出时丢弃
+        app.config.setdefault('APIKIT_RECORD_REDACT_HEADERS', None)  # 不录制的请求头，为None则使用recording.REDACT_HEADERS
+        # === 批量请求 ===
+        app.config.setdefault('APIKIT_BATCH_ENABLED', False)  # 注册批量请求的路由，在一次请求中执行多个API调用
+        app.config.setdefault('APIKIT_BATCH_PATH', '/batch')  # 批量请求的路径
+        app.config.setdefault('APIKIT_BATCH_MAX_REQUESTS', 20)  # 一次批量请求中子请求的最大个数
+        app.config.setdefault('APIKIT_BATCH_MAX_BYTES', 1024 * 1024)  # 批量请求的请求体最大字节数，设为0则为不限制
+        app.config.setdefault('APIKIT_BATCH_WORKERS', 4)  # 并发执行子请求的线程数（所有批量请求共用），设为0则按顺序执行（此时APIKIT_BATCH_TIMEOUT不能中断正在执行的子请求）
+        app.config.setdefault('APIKIT_BATCH_TIMEOUT', 10.0)  # 整个批量请求的最长时间（秒），超出时未完成的子请求返回504
         # === CORS配置 ===
         app.config.setdefault('APIKIT_ACCESS_CONTROL_MAX_AGE', 600)
         app.config.setdefault('APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN', '*')
         app.config.setdefault('APIKIT_ACCESS_CONTROL_ALLOW_HEADERS', ['Authorization', 'Content-Type'])
         app.config.setdefault('APIKIT_ACCESS_CONTROL_ALLOW_CREDENTIALS', False)
         app.config.setdefault('APIKIT_ACCESS_CONTROL_EXPOSE_HEADERS', [])
+        # 处理请求时读取的配置只在这里（和reload_config时）读取一次
+        build_settings(app)
+        # 所有路由抛出的APIError都由APIKit处理
+        app.register_error_handler(APIError, api_error_handler)
+        init_metrics(app)
+        for flag, module, init in _FEATURES:
+            if app.config[flag]:
+                getattr(importlib.import_module(module), init)(app)
         app.teardown_appcontext(self.teardown)
 
+    def warmup(self, app=None, freeze: bool = False) -> dict:
+        """
+        预先生成处理请求时按需生成的数据，在prefork服务器（如gunicorn --preload）的master进程fork前调用：
+
+        - 导入延迟导入的模块（marshmallow、APIView、批量验证、文件上传）
+        - 整理路由表，生成每个路由的Preflight响应头
+        - 生成所有APIError子类的响应体
+        - 调用每个注册了路由的APIView子类的warmup()
+
+        worker启动后不必在最初的请求中再生成，这些对象所在的内存页也可以在worker间共享
+
+        :param app: 为None则使用APIKit(app)传入的app
+        :param freeze: 最后调用gc.freeze()，使gc不再遍历（写入）已有的对象，避免共享的内存页被复制
+        :return: {'preflight': 生成的Preflight响应头个数, 'errors': APIError子类个数, 'views': APIView子类个数}
+        """
+        app = app or self.app
+        for module in _WARMUP_MODULES:
+            importlib.import_module(module)
+        from flask_apikit.views import APIView
+        app.url_map.update()
+        result = {'preflight': 0, 'errors': 0, 'views': 0}
+        # === Preflight响应头 ===
+        for rule in app.url_map.iter_rules():
+            if 'OPTIONS' not in rule.methods:
+                continue
+            path = _sample_path(rule)
+            if path is None:
+                continue
+            with app.test_request_context(path, method='OPTIONS'):
+                _preflight_response(current_settings())
+        result['preflight'] = len(app.extensions.get(PREFLIGHT_CACHE_KEY, ()))
+        with app.app_context():
+            # === APIError响应体 ===
+            for cls in _subclasses(APIError):
+                try:
+                    cls().to_response()
+                except Exception:
+                    continue
+                result['errors'] += 1
+            # === APIView ===
+            views = {getattr(view, 'view_class', None) for view in app.view_functions.values()}
+            for view_class in views:
+                if isinstance(view_class, type) and issubclass(view_class, APIView):
+                    view_class.warmup(app)
+                    result['views'] += 1
+        if freeze and hasattr(gc, 'freeze'):
+            gc.collect()
+            gc.freeze()
+        return result
+
+    def reload_config(self, app=None):
+        """
+        修改app.config后重新生成app和蓝本的Settings，并清空根据旧配置生成的Preflight响应头和错误响应体
+        只对处理请求时读取的配置（settings.CONFIG_KEYS）有效，APIKIT_*_ENABLED等功能开关仍需在init_app前设置
+
+        :param app: 为None则使用APIKit(app)传入的app或current_app
+        """
+        app = app or self.app or current_app._get_current_object()
+        build_settings(app)
+        app.extensions.pop(PREFLIGHT_CACHE_KEY, None)
+        app.extensions.pop(ERROR_CACHE_KEY, None)
+
     def teardown(self, exception):
         """暂时没有什么资源需要释放"""
         pass
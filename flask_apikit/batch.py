@@ -0,0 +1,215 @@
+"""
+批量请求：在一次请求中执行多个API调用
+
+开启APIKIT_BATCH_ENABLED后注册APIKIT_BATCH_PATH（默认/batch），POST一个子请求列表：
+
+    POST /batch
+    [
+        {"method": "GET", "path": "/users", "query": {"page": 2}},
+        {"method": "POST", "path": "/users", "body": {"name": "apikit"}},
+        {"path": "/users/1", "headers": {"Accept-Language": "zh"}}
+    ]
+
+按顺序返回每个子请求的结果：
+
+    [{"status": 200, "headers": {...}, "body": [...]}, ...]
+
+JSON响应的body为解析后的数据，其它响应为文本；不是UTF-8文本的响应（如文件下载）body为base64编码，
+并带有"encoding": "base64"
+
+- 每个子请求在独立的请求上下文中经过完整的Flask处理（before_request、错误处理、after_request等）
+- 子请求继承批量请求的请求头（Authorization、Cookie等），但不含Origin，不再设置CORS响应头
+- 连续的GET/HEAD/OPTIONS子请求在线程池中并发执行；其它方法的子请求会等待之前的子请求完成后单独执行，
+  保证写操作按顺序进行
+- 超出APIKIT_BATCH_TIMEOUT后，未完成的子请求返回504（已经开始的子请求仍会在后台执行完）；
+  APIKIT_BATCH_WORKERS为0时按顺序在当前线程执行，只在子请求之间检查超时，不能中断正在执行的子请求
+"""
+import base64
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from time import monotonic
+
+from flask import current_app, request
+from werkzeug.test import EnvironBuilder
+
+from flask_apikit.exceptions import BatchTimeout, PayloadTooLarge, ValidateError
+from flask_apikit.views import APIView
+
+# 子请求在WSGI environ中的标记，子请求中不能再发起批量请求
+BATCH_KEY = 'flask_apikit.batch'
+# app.extensions中线程池的key
+BATCH_EXECUTOR_KEY = 'apikit_batch'
+# 可以并发执行的方法
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+# 子请求不继承的请求头（不区分大小写）
+_SKIP_HEADERS = frozenset(('origin', 'content-type', 'content-length', 'transfer-encoding',
+                           'access-control-request-method', 'access-control-request-headers'))
+_FIELDS = frozenset(('method', 'path', 'query', 'body', 'headers'))
+
+
+def dispatch(app, environ: dict) -> dict:
+    """在新的请求上下文中处理一个子请求，返回{'status', 'headers', 'body'}"""
+    ctx = app.request_context(environ)
+    error = None
+    try:
+        try:
+            ctx.push()
+            resp = app.full_dispatch_request()
+        except Exception as e:
+            error = e
+            resp = app.handle_exception(e)
+        try:
+            result = {
+                'status': resp.status_code,
+                'headers': {key: value for key, value in resp.headers.items() if key != 'Content-Length'},
+            }
+            if resp.is_json:
+                result['body'] = resp.get_json()
+            else:
+                data = resp.get_data()
+                try:
+                    result['body'] = data.decode()
+                except UnicodeDecodeError:
+                    result['body'] = base64.b64encode(data).decode('ascii')
+                    result['encoding'] = 'base64'
+        finally:
+            resp.close()
+        return result
+    finally:
+        ctx.auto_pop(error)
+
+
+def _run(app, environ: dict) -> dict:
+    # 每个子请求在空的contextvars.Context中执行，不会与批量请求或线程池中的其它子请求共用ContextVar
+    return contextvars.Context().run(dispatch, app, environ)
+
+
+def _timeout_result() -> dict:
+    error = BatchTimeout()
+    return {'status': error.status_code, 'headers': {}, 'body': error.to_dict()}
+
+
+class BatchView(APIView):
+    """批量请求的视图，由init_batch注册"""
+    def __init__(self, executor: ThreadPoolExecutor = None, max_requests: int = 20,
+                 timeout: float = 10.0, max_bytes: int = None):
+        """
+        :param executor: 并发执行子请求的线程池，为None则按顺序执行
+        :param max_requests: 子请求的最大个数
+        :param timeout: 整个批量请求的最长时间（秒），executor为None时只在子请求之间检查
+        :param max_bytes: 请求体的最大字节数，为None则使用APIKIT_MAX_JSON_BYTES
+        """
+        self.executor = executor
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.max_json_bytes = max_bytes
+
+    def _validate(self, items) -> list:
+        """检查子请求列表，返回每个子请求的(method, path, query, body, headers)"""
+        if not isinstance(items, list):
+            raise ValidateError({'_schema': ['Invalid input type.']}, replace=True)
+        if len(items) > self.max_requests:
+            raise PayloadTooLarge(f'at most {self.max_requests} requests in a batch')
+        errors = {}
+        parsed = []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors[index] = {'_schema': ['Invalid input type.']}
+                continue
+            error = {}
+            for key in item.keys() - _FIELDS:
+                error[key] = ['Unknown field.']
+            method = item.get('method', 'GET')
+            if not isinstance(method, str) or not method.isalpha():
+                error['method'] = ['Not a valid method.']
+            path = item.get('path')
+            if not isinstance(path, str) or not path.startswith('/'):
+                error['path'] = ['Not a valid path.']
+            query = item.get('query')
+            if query is not None and not isinstance(query, (str, dict)):
+                error['query'] = ['Not a valid query.']
+            elif query and isinstance(path, str) and '?' in path:
+                error['query'] = ['Query is already defined in the path.']
+            headers = item.get('headers')
+            if headers is not None and not (isinstance(headers, dict) and all(
+                    isinstance(v, str) for v in headers.values())):
+                error['headers'] = ['Not a valid mapping of strings.']
+            if error:
+                errors[index] = error
+                continue
+            parsed.append((method.upper(), path, query, item.get('body'), headers))
+        if errors:
+            raise ValidateError(errors, replace=True)
+        return parsed
+
+    @staticmethod
+    def _environ(method: str, path: str, query, body, headers: dict) -> dict:
+        """根据批量请求和子请求生成子请求的WSGI environ"""
+        inherited = [(key, value) for key, value in request.headers.items()
+                     if key.lower() not in _SKIP_HEADERS]
+        builder = EnvironBuilder(
+            path=path,
+            base_url=request.url_root,
+            method=method,
+            query_string=query,
+            headers=inherited,
+            json=body,
+            environ_base={'REMOTE_ADDR': request.remote_addr, BATCH_KEY: True})
+        if headers:
+            for key, value in headers.items():
+                builder.headers[key] = value
+        return builder.get_environ()
+
+    def post(self):
+        if request.environ.get(BATCH_KEY):
+            raise ValidateError('batch requests cannot be nested')
+        requests = self._validate(self.get_json())
+        app = current_app._get_current_object()
+        deadline = monotonic() + self.timeout
+        results = [None] * len(requests)
+        # 已提交到线程池的子请求：[(下标, future)]
+        running = []
+        for index, (method, path, query, body, headers) in enumerate(requests):
+            environ = self._environ(method, path, query, body, headers)
+            # 其它方法的子请求需要等待之前的子请求完成
+            if method not in SAFE_METHODS:
+                self._wait(running, results, deadline)
+            if monotonic() >= deadline:
+                results[index] = _timeout_result()
+            elif self.executor is None:
+                results[index] = _run(app, environ)
+            else:
+                running.append((index, self.executor.submit(_run, app, environ)))
+                if method not in SAFE_METHODS:
+                    self._wait(running, results, deadline)
+        self._wait(running, results, deadline)
+        return results
+
+    @staticmethod
+    def _wait(running: list, results: list, deadline: float):
+        """等待线程池中的子请求，超时的子请求返回504"""
+        for index, future in running:
+            try:
+                results[index] = future.result(timeout=max(0.0, deadline - monotonic()))
+            except FutureTimeoutError:
+                future.cancel()
+                results[index] = _timeout_result()
+        running.clear()
+
+
+def init_batch(app):
+    """开启APIKIT_BATCH_ENABLED时注册批量请求的路由"""
+    if not app.config['APIKIT_BATCH_ENABLED']:
+        return
+    workers = app.config['APIKIT_BATCH_WORKERS']
+    executor = None
+    if workers:
+        # 线程在第一次提交子请求时才启动，可以在fork前调用
+        executor = app.extensions[BATCH_EXECUTOR_KEY] = ThreadPoolExecutor(
+            workers, thread_name_prefix='apikit-batch')
+    view = BatchView.as_view('apikit_batch',
+                             executor=executor,
+                             max_requests=app.config['APIKIT_BATCH_MAX_REQUESTS'],
+                             timeout=app.config['APIKIT_BATCH_TIMEOUT'],
+                             max_bytes=app.config['APIKIT_BATCH_MAX_BYTES'])
+    app.add_url_rule(app.config['APIKIT_BATCH_PATH'], view_func=view, methods=['POST', 'OPTIONS'])
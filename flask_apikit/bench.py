@@ -0,0 +1,272 @@
+"""
+在本机用多进程压测使用APIKit的app
+
+    python -m flask_apikit.bench myapp:app --workers 4 --clients 4 --duration 10
+    # 使用录制的请求（每行一个json，见load_mix），并修改app配置进行对比
+    python -m flask_apikit.bench myapp:create_app() --mix requests.jsonl -c APIKIT_JSON_DECODER='"orjson"'
+
+服务端为fork出的多个Werkzeug WSGI server进程，共用一个监听socket；
+客户端为多个进程，通过loopback循环发送请求，最后汇总RPS、延迟分位数和错误率
+只在Linux等支持fork的系统上使用
+"""
+import argparse
+import http.client
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from urllib.parse import urlencode
+
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from flask_apikit import APIKit
+from flask_apikit.recording import decode_body, read_records
+from flask_apikit.settings import SETTINGS_KEY
+
+# 合成请求所用的Origin
+ORIGINS = ('https://example.com', 'https://app.example.com', None)
+# 合成请求所用的json
+BODIES = ({'name': 'apikit'}, {'name': 'apikit', 'age': 3, 'tags': ['a', 'b', 'c']}, [1, 2, 'go'])
+
+
+class _QuietHandler(WSGIRequestHandler):
+    """不输出访问日志"""
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def load_app(spec: str):
+    """
+    根据'模块:变量'或'模块:工厂函数()'导入app
+
+    :param spec: 如'myapp:app'或'myapp:create_app()'
+    """
+    module_name, _, attr = spec.partition(':')
+    module = importlib.import_module(module_name)
+    attr = attr or 'app'
+    if attr.endswith('()'):
+        return getattr(module, attr[:-2])()
+    return getattr(module, attr)
+
+
+def load_mix(path: str) -> list:
+    """
+    读取请求列表，每行一个json（以.gz结尾时使用gzip，如APIKIT_RECORD_FILE录制的文件）：
+    {"method": "POST", "path": "/users?page=2", "headers": {"Origin": "..."}, "json": {...}}
+    也可以用"body"（字符串）或"body_b64"代替"json"
+    """
+    return read_records(path)
+
+
+def synthetic_mix(app, size: int = 100) -> list:
+    """
+    根据app的路由生成请求列表，只使用没有参数的路由：
+    GET带分页参数，POST/PUT/PATCH带json，带Origin的请求中部分为CORS预检
+    """
+    page_key = app.config.get('APIKIT_PAGINATION_PAGE_KEY', 'page')
+    limit_key = app.config.get('APIKIT_PAGINATION_LIMIT_KEY', 'limit')
+    templates = []
+    for rule in app.url_map.iter_rules():
+        if rule.arguments or rule.endpoint == 'static':
+            continue
+        for method in sorted(rule.methods - {'HEAD'}):
+            templates.append((method, rule.rule))
+    if not templates:
+        raise ValueError('no routes without arguments to benchmark')
+    mix = []
+    variants = itertools.count()
+    for method, path in itertools.islice(itertools.cycle(templates), size):
+        i = next(variants)
+        origin = ORIGINS[i % len(ORIGINS)]
+        headers = {} if origin is None else {'Origin': origin}
+        if method == 'OPTIONS':
+            if origin is None:
+                continue
+            headers['Access-Control-Request-Method'] = 'GET'
+            mix.append({'method': method, 'path': path, 'headers': headers})
+        elif method in ('POST', 'PUT', 'PATCH'):
+            mix.append({'method': method, 'path': path, 'headers': headers,
+                        'json': BODIES[i % len(BODIES)]})
+        else:
+            query = urlencode({page_key: i % 5 + 1, limit_key: (10, 20, 50)[i % 3]})
+            mix.append({'method': method, 'path': f'{path}?{query}', 'headers': headers})
+    return mix
+
+
+def _prepare(mix: list) -> list:
+    """转换为(method, path, body, headers)，避免在压测中重复json化"""
+    prepared = []
+    for item in mix:
+        headers = {k: v for k, v in (item.get('headers') or {}).items()
+                   if k.lower() not in ('host', 'content-length')}
+        body = decode_body(item)
+        if 'json' in item:
+            body = json.dumps(item['json'])
+            headers.setdefault('Content-Type', 'application/json')
+        prepared.append((item.get('method', 'GET').upper(), item['path'], body, headers))
+    return prepared
+
+
+def _serve(app, fd: int):
+    """worker进程：在共用的监听socket上处理请求"""
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    server = make_server('127.0.0.1', 0, app, request_handler=_QuietHandler, fd=fd)
+    server.serve_forever()
+
+
+def _client(args: tuple) -> tuple:
+    """客户端进程：循环发送请求，返回(延迟列表（秒）, {状态码: 个数}, 异常个数)"""
+    port, mix, offset, warmup, duration = args
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies = []
+    statuses = {}
+    failures = 0
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+    for method, path, body, headers in itertools.islice(itertools.cycle(mix), offset, None):
+        begin = time.perf_counter()
+        if begin >= deadline:
+            break
+        try:
+            conn.request(method, path, body, headers)
+            resp = conn.getresponse()
+            resp.read()
+            status = resp.status
+            if resp.will_close:
+                conn.close()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            status = None
+        if begin < measure_from:
+            continue
+        latencies.append(time.perf_counter() - begin)
+        if status is None:
+            failures += 1
+        else:
+            statuses[status] = statuses.get(status, 0) + 1
+    conn.close()
+    return latencies, statuses, failures
+
+
+def percentile(values: list, p: float) -> float:
+    """values需已排序"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+def run_bench(app, mix: list = None, workers: int = 2, clients: int = 2,
+              duration: float = 10.0, warmup: float = 1.0) -> dict:
+    """
+    压测app并返回结果
+
+    :param app: WSGI app
+    :param mix: 请求列表（见load_mix），为None则根据路由生成
+    :param workers: 服务端进程数
+    :param clients: 客户端进程数
+    :param duration: 统计的时长（秒）
+    :param warmup: 开始统计前的预热时长（秒）
+    :return: {'requests', 'rps', 'p50', 'p95', 'p99'（毫秒）, 'error_rate', 'statuses'}
+    """
+    if mix is None:
+        mix = synthetic_mix(app)
+    prepared = _prepare(mix)
+    ctx = multiprocessing.get_context('fork')
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1024)
+    listener.set_inheritable(True)
+    port = listener.getsockname()[1]
+    servers = [ctx.Process(target=_serve, args=(app, listener.fileno()), daemon=True)
+               for _ in range(workers)]
+    for server in servers:
+        server.start()
+    try:
+        step = max(1, len(prepared) // clients)
+        with ctx.Pool(clients) as pool:
+            results = pool.map(_client, [(port, prepared, i * step, warmup, duration)
+                                         for i in range(clients)])
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.join()
+        listener.close()
+
+    latencies = sorted(itertools.chain.from_iterable(r[0] for r in results))
+    statuses = {}
+    failures = 0
+    for _, client_statuses, client_failures in results:
+        failures += client_failures
+        for status, count in client_statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    total = len(latencies)
+    errors = failures + sum(count for status, count in statuses.items() if status >= 500)
+    return {
+        'requests': total,
+        'rps': total / duration,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'error_rate': errors / total if total else 0.0,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def _parse_config(items: list) -> dict:
+    config = {}
+    for item in items or ():
+        key, _, value = item.partition('=')
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m flask_apikit.bench',
+                                     description='在本机用多进程压测APIKit app')
+    parser.add_argument('app', help="'模块:变量'或'模块:工厂函数()'")
+    parser.add_argument('--mix', help='请求列表文件（每行一个json），默认根据路由生成')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() // 2 or 1,
+                        help='服务端进程数')
+    parser.add_argument('--clients', type=int, default=os.cpu_count() // 2 or 1, help='客户端进程数')
+    parser.add_argument('-d', '--duration', type=float, default=10.0, help='统计的时长（秒）')
+    parser.add_argument('--warmup', type=float, default=1.0, help='预热时长（秒）')
+    parser.add_argument('-c', '--config', action='append', metavar='KEY=VALUE',
+                        help='修改app.config并调用APIKit.reload_config()（只对settings.CONFIG_KEYS中的配置有效），'
+                             'VALUE按json解析，失败则作为字符串')
+    parser.add_argument('--json', action='store_true', help='以json输出结果')
+    args = parser.parse_args(argv)
+
+    app = load_app(args.app)
+    config = _parse_config(args.config)
+    if config:
+        app.config.update(config)
+        if SETTINGS_KEY in app.extensions:
+            APIKit().reload_config(app)
+    mix = load_mix(args.mix) if args.mix else None
+    result = run_bench(app, mix, workers=args.workers, clients=args.clients,
+                       duration=args.duration, warmup=args.warmup)
+    if args.json:
+        print(json.dumps(result))
+        return
+    print(f'requests   {result["requests"]}')
+    print(f'rps        {result["rps"]:.1f}')
+    print(f'latency    p50 {result["p50"]:.2f} ms  p95 {result["p95"]:.2f} ms  '
+          f'p99 {result["p99"]:.2f} ms')
+    print(f'error rate {result["error_rate"] * 100:.2f}%')
+    print(f'statuses   {result["statuses"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,137 @@
 from functools import wraps
+from threading import get_ident
+from time import monotonic, perf_counter_ns
 
-from flask import jsonify, make_response, request, current_app, Response
+from flask import jsonify, make_response, request, current_app, Response, _request_ctx_stack
 
+from flask_apikit import watchdog
 from flask_apikit.exceptions import APIError
+from flask_apikit.metrics import current_timings, record
 from flask_apikit.responses import APIResponse
+from flask_apikit.settings import current_settings
+
+# app.extensions中缓存Preflight响应头的key：{(路由规则, endpoint): [(name, value)]}
+# 第一次Preflight Request（或APIKit.warmup）时生成，APIKit.reload_config()时清空
+PREFLIGHT_CACHE_KEY = 'apikit_preflight'
+
+
+def preflight_headers(settings, methods) -> list:
+    """
+    生成Preflight Request的响应头
+
+    :param settings: 当前请求的Settings
+    :param methods: 允许的方法（add_url_rule中定义的methods，会自动加上HEAD方法）
+    """
+    allow = ', '.join(sorted(methods))
+    # Flask默认的Options Response只有Allow头
+    # ==> Access-Control-Allow-Methods
+    headers = [('Allow', allow), ('Access-Control-Allow-Methods', allow)]
+    # ==> Access-Control-Allow-Headers
+    if settings.allow_headers:
+        headers.append(('Access-Control-Allow-Headers', settings.allow_headers))
+    # ==> Access-Control-Max-Age
+    if settings.access_control_max_age:
+        headers.append(('Access-Control-Max-Age', str(settings.access_control_max_age)))
+    return headers
+
+
+def _preflight_response(settings) -> Response:
+    """生成Preflight Request的响应，响应头按路由缓存"""
+    rule = request.url_rule
+    key = None if rule is None else (rule.rule, rule.endpoint)
+    cache = current_app.extensions.setdefault(PREFLIGHT_CACHE_KEY, {})
+    headers = cache.get(key)
+    if headers is None:
+        methods = _request_ctx_stack.top.url_adapter.allowed_methods()
+        headers = preflight_headers(settings, methods)
+        # 只有一个路由匹配当前路径时才缓存，否则允许的方法取决于具体的路径
+        if key is not None and set(methods) == rule.methods:
+            cache[key] = headers
+    return current_app.response_class(headers=headers)
+
+
+def _set_expose_headers(resp: Response, settings):
+    """Actual Request的响应头"""
+    h = resp.headers
+    expose_headers = settings.expose_headers
+    # 本次请求会加入Server-Timing头
+    timings = current_timings.get()
+    if timings is not None and timings.server_timing:
+        expose_headers = f'{expose_headers}, SERVER-TIMING' if expose_headers else 'SERVER-TIMING'
+    # ==> Access-Control-Expose-Headers
+    if expose_headers:
+        # 如果已有Expose-Headers，同时有值，则加一个逗号
+        if 'Access-Control-Expose-Headers' in h and h[
+                'Access-Control-Expose-Headers']:
+            h['Access-Control-Expose-Headers'] += ', '
+        else:
+            h['Access-Control-Expose-Headers'] = ''
+        h['Access-Control-Expose-Headers'] += expose_headers
+
+
+def _set_cors_headers(resp: Response, origin: str, settings):
+    """Preflight Request和Actual Request公用的响应头"""
+    h = resp.headers
+    allow_origin = settings.access_control_allow_origin
+    # ==> Access-Control-Allow-Credentials
+    if settings.access_control_allow_credentials is True:
+        h['Access-Control-Allow-Credentials'] = 'true'
+    # ==> Access-Control-Allow-Origin
+    # 设置为"*"，表示允许所有Origin访问
+    if allow_origin == '*':
+        # 如果允许请求附带身份凭证则必须返回与Origin相同的值
+        # See also：[MDN CORS](https://developer.mozilla.org/en-US/docs/Web/HTTP/CORS#Requests_with_credentials)
+        if settings.access_control_allow_credentials is True:
+            h['Access-Control-Allow-Origin'] = origin
+        # 其他情况直接返回"*"通配符
+        else:
+            h['Access-Control-Allow-Origin'] = '*'
+    # 设置了其他参数
+    else:
+        # 设置为字符串，表示允许一个域名，与请求头的Origin一致则返回
+        if isinstance(allow_origin, str):
+            if origin.lower() == allow_origin.lower():
+                h['Access-Control-Allow-Origin'] = origin
+        # 设置为列表，表示允许多个域名，包含请求头的Origin则返回
+        elif settings.allow_origins is not None:
+            if origin.lower() in settings.allow_origins:
+                h['Access-Control-Allow-Origin'] = origin
+
+
+def _convert_rv(resp):
+    """将视图返回的值处理为flask.app.make_response所用的元组（参数rv），并将数据部分json化"""
+    # 如果发现返回数据为None，则返回204
+    if resp is None:
+        resp = '', 204
+    # 如果是字典或列表，转换为json后返回
+    elif isinstance(resp, (dict, list)):
+        resp = jsonify(resp)
+    # 如果是有两个元素以上的元组，且第一个值为字典或列表，则将第一个值转换为json（P.S. 后两个是状态码，HTTP头）
+    elif isinstance(resp, tuple) and len(resp) > 1 and isinstance(
+            resp[0], (dict, list)):
+        resp = (jsonify(resp[0]), *resp[1:])
+    # APIResponse直接返回
+    elif isinstance(resp, APIResponse):
+        resp = resp.to_tuple()
+    # 直接返回（而不是抛出）的APIError
+    elif isinstance(resp, APIError):
+        resp = resp.to_tuple()
+    return resp
+
+
+def _make_response(rv) -> Response:
+    """将视图返回的值直接生成唯一的Response对象"""
+    # 最常见的情况：字典或列表，jsonify生成的Response不需要再经过make_response
+    if isinstance(rv, (dict, list)):
+        return jsonify(rv)
+    if rv is None:
+        return current_app.response_class('', 204)
+    if isinstance(rv, Response):
+        return rv
+    # 直接返回（而不是抛出）的APIError，不会生成traceback
+    if isinstance(rv, APIError):
+        return rv.to_response()
+    return current_app.make_response(_convert_rv(rv))
 
 
 def api_cors(func):
@@ -20,71 +148,16 @@ def api_cors(func):
         if not origin:
             return make_response(func(*args, **kwargs))
 
+        settings = current_settings()
         # === Preflight Request ===
         if request.method == 'OPTIONS':
-            # 生成Flask默认的Options Response
-            resp = current_app.make_default_options_response()
-            h = resp.headers
-            # ==> Access-Control-Allow-Methods
-            h['Access-Control-Allow-Methods'] = resp.headers.get('allow')  # add_url_rule中定义的methods，会自动加上HEAD方法
-            # ==> Access-Control-Allow-Headers
-            if current_app.config['APIKIT_ACCESS_CONTROL_ALLOW_HEADERS']:
-                h['Access-Control-Allow-Headers'] = ', '.join(
-                    x.upper() for x in
-                    current_app.config['APIKIT_ACCESS_CONTROL_ALLOW_HEADERS'])
-            # ==> Access-Control-Max-Age
-            if current_app.config['APIKIT_ACCESS_CONTROL_MAX_AGE']:
-                h['Access-Control-Max-Age'] = current_app.config[
-                    'APIKIT_ACCESS_CONTROL_MAX_AGE']
+            resp = _preflight_response(settings)
         # === Actual Request ===
         else:
             resp = make_response(func(*args, **kwargs))
-            h = resp.headers
-            # ==> Access-Control-Expose-Headers
-            if current_app.config['APIKIT_ACCESS_CONTROL_EXPOSE_HEADERS']:
-                # 如果已有Expose-Headers，同时有值，则加一个逗号
-                if 'Access-Control-Expose-Headers' in h and h[
-                        'Access-Control-Expose-Headers']:
-                    h['Access-Control-Expose-Headers'] += ', '
-                else:
-                    h['Access-Control-Expose-Headers'] = ''
-                h['Access-Control-Expose-Headers'] += ', '.join(
-                    x.upper() for x in
-                    current_app.config['APIKIT_ACCESS_CONTROL_EXPOSE_HEADERS'])
+            _set_expose_headers(resp, settings)
         # === 其他公用的响应头 ===
-        # ==> Access-Control-Allow-Credentials
-        if current_app.config[
-                'APIKIT_ACCESS_CONTROL_ALLOW_CREDENTIALS'] is True:
-            h['Access-Control-Allow-Credentials'] = 'true'
-        # ==> Access-Control-Allow-Origin
-        # 设置为"*"，表示允许所有Origin访问
-        if current_app.config['APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN'] == '*':
-            # 如果允许请求附带身份凭证则必须返回与Origin相同的值
-            # See also：[MDN CORS](https://developer.mozilla.org/en-US/docs/Web/HTTP/CORS#Requests_with_credentials)
-            if current_app.config[
-                    'APIKIT_ACCESS_CONTROL_ALLOW_CREDENTIALS'] is True:
-                h['Access-Control-Allow-Origin'] = origin
-            # 其他情况直接返回"*"通配符
-            else:
-                h['Access-Control-Allow-Origin'] = '*'
-        # 设置了其他参数
-        else:
-            # 设置为字符串，表示允许一个域名，与请求头的Origin一致则返回
-            if isinstance(
-                    current_app.config['APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN'],
-                    str):
-                if origin.lower() == current_app.config[
-                        'APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN'].lower():
-                    h['Access-Control-Allow-Origin'] = origin
-            # 设置为列表，表示允许多个域名，包含请求头的Origin则返回
-            elif isinstance(
-                    current_app.config['APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN'],
-                    list):
-                if origin.lower() in [
-                        o.lower() for o in current_app.
-                        config['APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN']
-                ]:
-                    h['Access-Control-Allow-Origin'] = origin
+        _set_cors_headers(resp, origin, settings)
         return resp
 
     return wrapper
@@ -107,19 +180,104 @@ def api_response(func):
             return e.to_tuple()
         # 没有错误
         else:
-            # 如果发现返回数据为None，则返回204
-            if resp is None:
-                resp = '', 204
-            # 如果是字典或列表，转换为json后返回
-            elif isinstance(resp, (dict, list)):
-                resp = jsonify(resp)
-            # 如果是有两个元素以上的元组，且第一个值为字典或列表，则将第一个值转换为json（P.S. 后两个是状态码，HTTP头）
-            elif isinstance(resp, tuple) and len(resp) > 1 and isinstance(
-                    resp[0], (dict, list)):
-                resp = (jsonify(resp[0]), *resp[1:])
-            # APIResponse直接返回
-            elif isinstance(resp, APIResponse):
-                resp = resp.to_tuple()
-            return resp
+            return _convert_rv(resp)
 
     return wrapper
+
+
+def api_error_handler(e: APIError) -> Response:
+    """
+    APIError的应用级错误处理器，由APIKit.init_app注册
+    任何路由（包括没有使用api_view的视图和蓝本）抛出的APIError都会返回json，并设置CORS响应头
+    """
+    start = perf_counter_ns()
+    resp = e.to_response()
+    record('serialize', start)
+    origin = request.headers.get('Origin')
+    if origin:
+        start = perf_counter_ns()
+        _actual_cors(resp, origin)
+        record('cors', start)
+    return resp
+
+
+def api_view(func):
+    """
+    合并api_response与api_cors：在一层调用中转换返回值并设置CORS响应头
+    只生成一个Response对象，结果与[api_response, api_cors]相同
+    抛出的APIError不在这里捕获，而是由APIKit注册的api_error_handler处理
+
+    也可以直接用于普通的视图函数：
+
+        @app.route('/', methods=['GET', 'OPTIONS'])
+        @api_view
+        def index():
+            return {'hello': 'apikit'}
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        requests = watchdog.inflight
+        # 没有开启APIKIT_WATCHDOG_ENABLED
+        if requests is None:
+            return _dispatch(func, args, kwargs)
+        key = next(watchdog.ids)
+        requests[key] = (monotonic(), request.endpoint, get_ident())
+        try:
+            return _dispatch(func, args, kwargs)
+        finally:
+            del requests[key]
+
+    return wrapper
+
+
+def _preflight(origin: str) -> Response:
+    """Preflight Request的响应"""
+    settings = current_settings()
+    resp = _preflight_response(settings)
+    _set_cors_headers(resp, origin, settings)
+    return resp
+
+
+def _actual_cors(resp: Response, origin: str) -> Response:
+    """设置Actual Request的CORS响应头"""
+    settings = current_settings()
+    _set_expose_headers(resp, settings)
+    _set_cors_headers(resp, origin, settings)
+    return resp
+
+
+def _phase(timed: bool, phase: str, func, *args):
+    """调用func(*args)，开启计时时记录为phase阶段的耗时"""
+    if not timed:
+        return func(*args)
+    start = perf_counter_ns()
+    try:
+        return func(*args)
+    finally:
+        record(phase, start)
+
+
+def _dispatch(func, args, kwargs) -> Response:
+    """
+    api_view的实际处理
+    开启了APIKIT_METRICS_ENABLED或APIKIT_SERVER_TIMING时，同时记录handler/serialize/cors各阶段的耗时
+    """
+    timed = current_timings.get() is not None
+    origin = request.headers.get('Origin')
+    # === Preflight Request ===
+    if origin and request.method == 'OPTIONS':
+        return _phase(timed, 'cors', _preflight, origin)
+    # === Actual Request ===
+    if timed:
+        start = perf_counter_ns()
+        try:
+            rv = func(*args, **kwargs)
+        finally:
+            record('handler', start)
+    else:
+        rv = func(*args, **kwargs)
+    resp = _phase(timed, 'serialize', _make_response, rv)
+    # 请求不含有Origin，则直接返回，不进行CORS处理
+    if not origin:
+        return resp
+    return _phase(timed, 'cors', _actual_cors, resp, origin)
@@ -1,35 +1,128 @@
-from flask import jsonify
+import threading
+
+from flask import current_app, jsonify, Response
+
+from flask_apikit.settings import SETTINGS_KEY
+
+# app.extensions中缓存错误响应体的key
+ERROR_CACHE_KEY = 'apikit_error_bodies'
+# 写入错误响应体缓存时加锁（只在未命中时），避免多个线程同时丢弃和插入
+_cache_lock = threading.Lock()
+
+
+class _Message:
+    """
+    APIError.message描述符
+
+    在类上读取时返回类定义的message；
+    实例的附加message在首次读取（通常是生成响应体）时才格式化为'原message: 附加message'
+    """
+    def __get__(self, instance, owner):
+        if instance is None:
+            return owner._message
+        try:
+            return instance._formatted
+        except AttributeError:
+            pass
+        # 没有附加message时不设置_detail，减少创建实例的开销
+        detail = getattr(instance, '_detail', None)
+        message = owner._message if detail is None else f'{owner._message}: {detail}'
+        instance._formatted = message
+        return message
+
+    def __set__(self, instance, value):
+        instance._formatted = value
 
 
 class APIError(Exception):
     """
     所有API抛出的错误需继承自此错误,才能被捕捉,并返回给前端
     1-99为APIKit所用的code
+
+    错误较频繁的地方，可以在视图中直接return错误实例（而不是raise），由api_view生成响应，
+    这样不会生成traceback；不带附加message的实例可以预先创建并重复使用：
+
+        NEED_LOGIN = NeedLogin()
+
+        class UserAPI(APIView):
+            def get(self):
+                if not current_user:
+                    return NEED_LOGIN
     """
+    # 附加message和格式化后的message保存在slot中，不需要为每个实例创建__dict__
+    __slots__ = ('_detail', '_formatted')
     status_code = 400
     code = 1
-    message = 'Undefined Error'
+    message = _Message()
+    _message = 'Undefined Error'
     headers = None
 
+    def __init_subclass__(cls, **kwargs):
+        """将子类定义的message移到_message，使message描述符生效"""
+        super().__init_subclass__(**kwargs)
+        if 'message' in cls.__dict__:
+            cls._message = cls.__dict__['message']
+            delattr(cls, 'message')
+
     def __init__(self, message=None, replace=False):
         """
         :param message: 附加message
-        :param replace: 是否替换原message，为False则为'原message: 附加message'
+        :param replace: 是否替换原message，为False则为'原message: 附加message'（在读取message时才格式化）
         """
         # 如果定义了附加message，则加在原message后面
         if message:
             if replace:
                 self.message = message
             else:
-                self.message = f'{self.message}: {message}'
+                self._detail = message
 
-    def to_tuple(self):
-        """返回make_response所用的元组，并将数据部分json化"""
-        return jsonify({
+    def to_dict(self) -> dict:
+        """返回响应的数据部分"""
+        return {
             'error': self.__class__.__name__,
             'code': self.code,
             'message': self.message
-        }), self.status_code, self.headers
+        }
+
+    def to_response(self) -> Response:
+        """
+        生成Response对象
+
+        message为字符串时，响应体和响应头按(错误类, code, message)缓存在app中，之后不需要再json化；
+        message为字典等动态内容（如ValidateError）时，每次都json化
+        """
+        message = self.message
+        cls = self.__class__
+        if not isinstance(message, str) or self.headers is not cls.headers:
+            resp = jsonify(self.to_dict())
+            resp.status_code = self.status_code
+            if self.headers:
+                resp.headers.extend(self.headers)
+            return resp
+        cache = current_app.extensions.setdefault(ERROR_CACHE_KEY, {})
+        key = (cls, self.code, message)
+        cached = cache.get(key)
+        if cached is None:
+            resp = jsonify(self.to_dict())
+            headers = [('Content-Type', resp.mimetype)]
+            if self.headers:
+                headers.extend(self.headers.items() if isinstance(
+                    self.headers, dict) else self.headers)
+            cached = (resp.get_data(), headers)
+            size = current_app.extensions[SETTINGS_KEY].error_cache_size
+            # 缓存大小为0时不缓存
+            if size > 0:
+                with _cache_lock:
+                    # 超出缓存大小时丢弃最早的
+                    while len(cache) >= size:
+                        del cache[next(iter(cache))]
+                    cache[key] = cached
+        body, headers = cached
+        return current_app.response_class(body, self.status_code, headers)
+
+    def to_tuple(self):
+        """返回make_response所用的元组，并将数据部分json化"""
+        return self.to_response(), self.status_code
 
 
 class ValidateError(APIError):
@@ -63,3 +156,35 @@ class QueryParseError(APIError):
     code = 3
     message = 'Query Parse Error'
 
+
+class PayloadTooLarge(APIError):
+    """
+    @apiDefine PayloadTooLarge
+    @apiError 4 请求体过大
+    请求体大小或JSON嵌套深度超出限制
+    """
+    status_code = 413
+    code = 4
+    message = 'Payload Too Large'
+
+
+class UnsupportedMediaType(APIError):
+    """
+    @apiDefine UnsupportedMediaType
+    @apiError 5 不支持的文件类型
+    上传文件的Content-Type不在允许的列表中
+    """
+    status_code = 415
+    code = 5
+    message = 'Unsupported Media Type'
+
+
+class BatchTimeout(APIError):
+    """
+    @apiDefine BatchTimeout
+    @apiError 6 批量请求超时
+    子请求在APIKIT_BATCH_TIMEOUT内没有完成
+    """
+    status_code = 504
+    code = 6
+    message = 'Batch Timeout'
@@ -0,0 +1,306 @@
+"""
+按endpoint采样统计请求的内存分配
+
+开启APIKIT_MEMORY_ENABLED后，被采样的请求在处理期间开启tracemalloc，记录：
+
+- 请求结束时仍未释放的内存块个数和大小（按分配位置统计）
+- 处理期间tracemalloc记录的内存峰值
+- 响应体大小
+- 进程RSS的变化
+
+tracemalloc会记录进程中所有线程的分配，多线程处理请求时只采样当前进程中没有其它请求的请求：
+开始时有其它请求正在处理则不采样，采样期间有其它请求开始则丢弃本次采样；
+并发较高时大部分请求都不会被采样，可以使用每个进程一个线程的worker采样
+
+统计数据会出现在APIKIT_METRICS_PATH中，并可以写入APIKIT_MEMORY_DUMP文件，用以下命令查看：
+
+    python -m flask_apikit.memory /tmp/apikit-memory-*.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import tracemalloc
+
+from flask import request, Response
+
+from flask_apikit.metrics import _escape
+
+# 正在进行的采样在WSGI environ中的key
+MEMORY_KEY = 'flask_apikit.memory'
+# app.extensions中MemoryStats实例的key
+MEMORY_STATS_KEY = 'apikit_memory'
+# 每个endpoint保留的分配位置个数为top的倍数，避免位置过多
+SITES_FACTOR = 4
+# 不统计的分配位置
+_IGNORE = (tracemalloc.Filter(False, tracemalloc.__file__),
+           tracemalloc.Filter(False, __file__))
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):  # pragma: no cover
+    _PAGE_SIZE = 4096
+
+
+def rss() -> int:
+    """当前进程的RSS（字节），不支持时为None"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class EndpointStats:
+    """一个endpoint的内存统计"""
+    __slots__ = ('samples', 'blocks', 'size', 'peak', 'max_peak', 'response_bytes', 'rss_delta',
+                 'sites')
+
+    def __init__(self):
+        self.samples = 0
+        # 请求结束时仍未释放的内存块个数和大小
+        self.blocks = 0
+        self.size = 0
+        # 内存峰值的总和与最大值
+        self.peak = 0
+        self.max_peak = 0
+        self.response_bytes = 0
+        self.rss_delta = 0
+        # {分配位置: [未释放的大小, 内存块个数]}
+        self.sites = {}
+
+    def to_dict(self, top: int = None) -> dict:
+        sites = sorted(self.sites.items(), key=lambda x: x[1][0], reverse=True)
+        return {
+            'samples': self.samples,
+            'blocks': self.blocks,
+            'size': self.size,
+            'peak': self.peak,
+            'max_peak': self.max_peak,
+            'response_bytes': self.response_bytes,
+            'rss_delta': self.rss_delta,
+            'sites': [[site, size, count] for site, (size, count) in sites[:top]],
+        }
+
+
+class MemoryStats:
+    """按endpoint汇总的内存统计"""
+    def __init__(self, top: int = 10):
+        """
+        :param top: 每个endpoint报告的分配位置个数
+        """
+        self.top = top
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint: str, snapshot: tracemalloc.Snapshot, peak: int,
+            response_bytes: int = None, rss_delta: int = None):
+        """加入一个被采样的请求"""
+        statistics = snapshot.filter_traces(_IGNORE).statistics('lineno')
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.samples += 1
+            stats.peak += peak
+            stats.max_peak = max(stats.max_peak, peak)
+            stats.response_bytes += response_bytes or 0
+            stats.rss_delta += rss_delta or 0
+            sites = stats.sites
+            for stat in statistics:
+                stats.blocks += stat.count
+                stats.size += stat.size
+                frame = stat.traceback[0]
+                site = f'{frame.filename}:{frame.lineno}'
+                value = sites.get(site)
+                if value is None:
+                    sites[site] = [stat.size, stat.count]
+                else:
+                    value[0] += stat.size
+                    value[1] += stat.count
+            limit = self.top * SITES_FACTOR
+            if len(sites) > limit:
+                stats.sites = dict(sorted(sites.items(), key=lambda x: x[1][0], reverse=True)[:limit])
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'endpoints': {str(endpoint): stats.to_dict(self.top)
+                              for endpoint, stats in self.endpoints.items()},
+            }
+
+    def dump(self, path: str):
+        """写入json文件，path中的{pid}会被替换为进程id"""
+        path = path.format(pid=os.getpid())
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+
+    def render(self) -> str:
+        """导出为Prometheus文本格式"""
+        metrics = (
+            ('samples', 'apikit_memory_samples_total', 'Requests sampled for memory usage.'),
+            ('blocks', 'apikit_memory_retained_blocks_total',
+             'Memory blocks still allocated when sampled requests finished.'),
+            ('size', 'apikit_memory_retained_bytes_total',
+             'Bytes still allocated when sampled requests finished.'),
+            ('peak', 'apikit_memory_peak_bytes_total', 'Sum of traced memory peaks of sampled requests.'),
+            ('response_bytes', 'apikit_memory_response_bytes_total',
+             'Response body bytes of sampled requests.'),
+            ('rss_delta', 'apikit_memory_rss_delta_bytes_total', 'RSS growth during sampled requests.'),
+        )
+        endpoints = sorted(self.to_dict()['endpoints'].items())
+        lines = []
+        for key, name, help_text in metrics:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for endpoint, stats in endpoints:
+                lines.append(f'{name}{{endpoint="{_escape(endpoint)}"}} {stats[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+class MemorySampler:
+    """注册为before_request/after_request/teardown_request，按采样率统计请求的内存分配"""
+    def __init__(self, stats: MemoryStats, sample_rate: float = 0.01, frames: int = 1,
+                 dump: str = None):
+        """
+        :param stats: 写入的统计数据
+        :param sample_rate: 采样率
+        :param frames: tracemalloc保存的调用栈深度
+        :param dump: 每次采样后写入统计数据的json文件，为None则不写入
+        """
+        self.stats = stats
+        self.sample_rate = sample_rate
+        self.frames = frames
+        self.dump = dump
+        # tracemalloc是进程全局的，同一时间只采样一个请求
+        self._lock = threading.Lock()
+        # 正在处理的请求 {id(environ): None}
+        self._active = {}
+        # 正在进行的采样：[开始时的RSS, 响应体大小, 是否有其它请求同时处理]
+        self._sampling = None
+
+    def _begin(self) -> bool:
+        """开始采样，当前进程中有其它请求正在处理时返回False"""
+        if not self._lock.acquire(blocking=False):
+            return False
+        # 其它地方（如APIKIT_PROFILE_TRACEMALLOC）已经开启了tracemalloc，无法区分本请求的分配
+        if tracemalloc.is_tracing():
+            self._lock.release()
+            return False
+        # 先设置_sampling再检查，之后开始的请求都会标记本次采样
+        state = self._sampling = [rss(), None, False]
+        if len(self._active) > 1:
+            self._sampling = None
+            self._lock.release()
+            return False
+        request.environ[MEMORY_KEY] = state
+        tracemalloc.start(self.frames)
+        return True
+
+    def start(self):
+        """before_request：记录正在处理的请求，被采样的请求开启tracemalloc"""
+        self._active[id(request.environ)] = None
+        # 采样期间开始的请求，其分配也会被记录
+        sampling = self._sampling
+        if sampling is not None:
+            sampling[2] = True
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        self._begin()
+
+    def finish(self, resp: Response) -> Response:
+        """after_request：记录响应体大小"""
+        state = request.environ.get(MEMORY_KEY)
+        if state is not None:
+            state[1] = resp.calculate_content_length()
+        return resp
+
+    def teardown(self, exception=None):
+        """teardown_request：关闭tracemalloc并汇总"""
+        self._active.pop(id(request.environ), None)
+        state = request.environ.pop(MEMORY_KEY, None)
+        if state is None:
+            return
+        try:
+            self._sampling = None
+            # 采样期间有其它请求同时处理，统计不准确，丢弃
+            if state[2] or self._active:
+                tracemalloc.stop()
+                return
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            start_rss, response_bytes, _ = state
+            end_rss = rss()
+            rss_delta = None if start_rss is None or end_rss is None else end_rss - start_rss
+            self.stats.add(request.endpoint, snapshot, peak, response_bytes, rss_delta)
+            if self.dump:
+                self.stats.dump(self.dump)
+        finally:
+            self._lock.release()
+
+
+def init_memory(app):
+    """开启APIKIT_MEMORY_ENABLED时注册采样所需的钩子"""
+    if not app.config['APIKIT_MEMORY_ENABLED']:
+        return
+    stats = app.extensions[MEMORY_STATS_KEY] = MemoryStats(app.config['APIKIT_MEMORY_TOP'])
+    sampler = MemorySampler(stats,
+                            sample_rate=app.config['APIKIT_MEMORY_SAMPLE_RATE'],
+                            frames=app.config['APIKIT_MEMORY_FRAMES'],
+                            dump=app.config['APIKIT_MEMORY_DUMP'])
+    app.before_request(sampler.start)
+    app.after_request(sampler.finish)
+    app.teardown_request(sampler.teardown)
+
+
+def _merge(dumps: list) -> dict:
+    """合并多个进程的统计数据"""
+    merged = {}
+    for data in dumps:
+        for endpoint, stats in data['endpoints'].items():
+            target = merged.get(endpoint)
+            if target is None:
+                target = merged[endpoint] = dict(stats, sites={})
+            else:
+                for key in ('samples', 'blocks', 'size', 'peak', 'response_bytes', 'rss_delta'):
+                    target[key] += stats[key]
+                target['max_peak'] = max(target['max_peak'], stats['max_peak'])
+            for site, size, count in stats['sites']:
+                value = target['sites'].setdefault(site, [0, 0])
+                value[0] += size
+                value[1] += count
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m flask_apikit.memory',
+                                     description='查看APIKIT_MEMORY_DUMP写入的内存统计')
+    parser.add_argument('files', nargs='+', help='json文件，多个进程的文件会合并')
+    parser.add_argument('--top', type=int, default=10, help='每个endpoint显示的分配位置个数')
+    args = parser.parse_args(argv)
+    dumps = []
+    for path in args.files:
+        with open(path, encoding='utf-8') as f:
+            dumps.append(json.load(f))
+    out = sys.stdout
+    endpoints = sorted(_merge(dumps).items(), key=lambda x: x[1]['size'], reverse=True)
+    for endpoint, stats in endpoints:
+        samples = stats['samples'] or 1
+        out.write(f'{endpoint}  samples={stats["samples"]}'
+                  f'  retained={stats["size"] / samples:.0f}B/{stats["blocks"] / samples:.1f} blocks'
+                  f'  peak={stats["peak"] / samples:.0f}B (max {stats["max_peak"]}B)'
+                  f'  response={stats["response_bytes"] / samples:.0f}B'
+                  f'  rss_delta={stats["rss_delta"] / samples:.0f}B  (per request)\n')
+        sites = sorted(stats['sites'].items(), key=lambda x: x[1][0], reverse=True)
+        for site, (size, count) in sites[:args.top]:
+            out.write(f'    {size:>12}B {count:>8} blocks  {site}\n')
+
+
+if __name__ == '__main__':
+    main()
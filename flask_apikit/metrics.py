@@ -0,0 +1,257 @@
+import random
+import threading
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+from time import perf_counter_ns
+
+from flask import current_app, request, Response
+
+# 当前请求的计时，为None表示不计时
+# 使用ContextVar而不是request.environ，读取开销远小于通过LocalProxy访问request
+current_timings = ContextVar('apikit_timings', default=None)
+# app.extensions中Metrics实例的key
+METRICS_KEY = 'apikit_metrics'
+# 直方图的桶上界（秒）
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Timings:
+    """一个请求的计时：开始时间和各阶段的(阶段名, 耗时纳秒)"""
+    __slots__ = ('start', 'phases', 'server_timing', 'token')
+
+    def __init__(self, server_timing: bool = False):
+        self.start = perf_counter_ns()
+        self.phases = []
+        # 是否在响应中加入Server-Timing头
+        self.server_timing = server_timing
+        # 请求结束时用于还原为外层（如批量请求中的子请求）的计时
+        self.token = current_timings.set(self)
+
+
+def record(phase: str, start: int):
+    """
+    记录当前请求某个阶段的耗时，没有开启计时则忽略
+
+    :param phase: 阶段名，如parse/validate/handler/serialize/cors
+    :param start: 阶段开始时perf_counter_ns()的值
+    """
+    timings = current_timings.get()
+    if timings is not None:
+        timings.phases.append((phase, perf_counter_ns() - start))
+
+
+class timing(ContextDecorator):
+    """
+    在视图中记录自定义阶段的耗时，会出现在统计数据和Server-Timing头中
+    可以作为上下文管理器或装饰器使用：
+
+        with timing('db'):
+            rows = query_db()
+
+        @timing('cache')
+        def load_cache():
+            ...
+
+    :param name: 阶段名，需符合HTTP token的格式（字母、数字、-、_等）
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._start = None
+
+    def _recreate_cm(self):
+        # 作为装饰器时每次调用使用新的实例，以支持多线程和递归
+        return self.__class__(self.name)
+
+    def __enter__(self):
+        self._start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self._start)
+        return False
+
+
+class Metrics:
+    """
+    按(endpoint, 阶段)统计耗时的直方图
+
+    每个线程写入自己的分片，不需要加锁；只在线程第一次写入和导出时加锁
+    新线程第一次写入时将已结束线程的分片合并，每个请求一个线程时分片个数也不会一直增长
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._bounds = [int(b * 1e9) for b in self.buckets]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # [(线程, 分片)]，线程结束后其分片合并到_retired
+        self._shards = []
+        self._retired = {}
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._prune()
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _prune(self):
+        """将已结束线程的分片合并到_retired，需要持有_lock"""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._merge(self._retired, shard)
+        self._shards = alive
+
+    def observe(self, endpoint: str, phase: str, ns: int):
+        """记录一次耗时（纳秒）"""
+        self.observe_many(endpoint, ((phase, ns), ))
+
+    def observe_many(self, endpoint: str, items):
+        """记录同一endpoint的多个(阶段, 耗时纳秒)"""
+        shard = self._shard()
+        bounds = self._bounds
+        for phase, ns in items:
+            key = (endpoint, phase)
+            histogram = shard.get(key)
+            if histogram is None:
+                # 每个桶的个数，最后一项为耗时总和
+                histogram = shard[key] = [0] * (len(bounds) + 2)
+            histogram[bisect_left(bounds, ns)] += 1
+            histogram[-1] += ns
+
+    @staticmethod
+    def _merge(target: dict, shard: dict):
+        for key, histogram in list(shard.items()):
+            merged = target.get(key)
+            if merged is None:
+                target[key] = list(histogram)
+            else:
+                for i, value in enumerate(histogram):
+                    merged[i] += value
+
+    def collect(self) -> dict:
+        """合并所有线程的数据，返回{(endpoint, 阶段): [各桶个数..., 耗时总和]}"""
+        with self._lock:
+            self._prune()
+            result = {}
+            self._merge(result, self._retired)
+            for _, shard in self._shards:
+                self._merge(result, shard)
+        return result
+
+    def render(self) -> str:
+        """导出为Prometheus文本格式"""
+        lines = [
+            '# HELP apikit_phase_seconds Time spent in each phase of APIKit requests.',
+            '# TYPE apikit_phase_seconds histogram'
+        ]
+        les = [repr(b) for b in self.buckets] + ['+Inf']
+        for (endpoint, phase), histogram in sorted(self.collect().items(),
+                                                   key=lambda x: (str(x[0][0]), x[0][1])):
+            labels = f'endpoint="{_escape(endpoint)}",phase="{phase}"'
+            count = 0
+            for le, value in zip(les, histogram):
+                count += value
+                lines.append(f'apikit_phase_seconds_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f'apikit_phase_seconds_sum{{{labels}}} {histogram[-1] / 1e9}')
+            lines.append(f'apikit_phase_seconds_count{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def metrics_view():
+    """以Prometheus文本格式返回统计数据（包括APIKIT_MEMORY_ENABLED的内存统计）"""
+    from flask_apikit.memory import MEMORY_STATS_KEY
+    extensions = current_app.extensions
+    text = ''.join(extensions[key].render() for key in (METRICS_KEY, MEMORY_STATS_KEY)
+                   if key in extensions)
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+
+class RequestTimer:
+    """注册为before_request/after_request，开始和结束每个请求的计时"""
+    def __init__(self,
+                 metrics: Metrics = None,
+                 server_timing: bool = False,
+                 sample_rate: float = 1.0,
+                 origins: list = None):
+        """
+        :param metrics: 写入的统计数据，为None则不统计
+        :param server_timing: 是否在响应中加入Server-Timing头
+        :param sample_rate: 加入Server-Timing头的请求比例
+        :param origins: 只对这些Origin的请求加入Server-Timing头，为None则不限制
+        """
+        self.metrics = metrics
+        self.server_timing = server_timing
+        self.sample_rate = sample_rate
+        self.origins = None if origins is None else {o.lower() for o in origins}
+
+    def _want_server_timing(self) -> bool:
+        if not self.server_timing:
+            return False
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return False
+        if self.origins is not None:
+            return request.headers.get('Origin', '').lower() in self.origins
+        return True
+
+    def start(self):
+        """before_request：开始记录当前请求的耗时"""
+        server_timing = self._want_server_timing()
+        if self.metrics is not None or server_timing:
+            Timings(server_timing)
+
+    def finish(self, resp: Response) -> Response:
+        """after_request：将当前请求各阶段的耗时（同一阶段累加）写入直方图和Server-Timing头"""
+        timings = current_timings.get()
+        if timings is None:
+            return resp
+        totals = {'request': perf_counter_ns() - timings.start}
+        for phase, ns in timings.phases:
+            totals[phase] = totals.get(phase, 0) + ns
+        if self.metrics is not None:
+            self.metrics.observe_many(request.endpoint, totals.items())
+        if timings.server_timing:
+            resp.headers['Server-Timing'] = ', '.join(
+                f'{phase};dur={ns / 1e6:.3f}' for phase, ns in totals.items())
+        return resp
+
+    def teardown(self, exception):
+        """teardown_request：还原为外层的计时，请求抛出异常（没有执行after_request）时同样还原"""
+        timings = current_timings.get()
+        if timings is None or timings.token is None:
+            return
+        current_timings.reset(timings.token)
+        timings.token = None
+
+
+def init_metrics(app):
+    """
+    开启APIKIT_METRICS_ENABLED或APIKIT_SERVER_TIMING时注册计时所需的钩子
+    都关闭时不注册任何钩子，不产生开销
+    """
+    metrics = None
+    if app.config['APIKIT_METRICS_ENABLED']:
+        metrics = app.extensions[METRICS_KEY] = Metrics(app.config['APIKIT_METRICS_BUCKETS'])
+    if app.config['APIKIT_METRICS_PATH'] and (metrics is not None
+                                              or app.config['APIKIT_MEMORY_ENABLED']):
+        app.add_url_rule(app.config['APIKIT_METRICS_PATH'], 'apikit_metrics', metrics_view)
+    if metrics is None and not app.config['APIKIT_SERVER_TIMING']:
+        return
+    timer = RequestTimer(metrics,
+                         server_timing=app.config['APIKIT_SERVER_TIMING'],
+                         sample_rate=app.config['APIKIT_SERVER_TIMING_SAMPLE_RATE'],
+                         origins=app.config['APIKIT_SERVER_TIMING_ORIGINS'])
+    app.before_request(timer.start)
+    app.after_request(timer.finish)
+    app.teardown_request(timer.teardown)
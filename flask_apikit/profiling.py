@@ -0,0 +1,159 @@
+import cProfile
+import hashlib
+import hmac
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from flask import request
+
+# 正在进行的profile在WSGI environ中的key
+PROFILE_KEY = 'flask_apikit.profile'
+# 手动触发profile的请求头，值为'时间戳:签名'
+PROFILE_HEADER = 'X-APIKit-Profile'
+# 签名的有效时间（秒）
+SIGNATURE_TTL = 300
+
+
+def sign(secret: str, method: str, path: str, timestamp: int = None) -> str:
+    """
+    生成触发profile的请求头的值
+
+    :param secret: APIKIT_PROFILE_SECRET
+    :param method: 请求方法
+    :param path: 请求路径（不含query string）
+    :param timestamp: 时间戳，为None则使用当前时间
+    :return:
+    """
+    if timestamp is None:
+        timestamp = int(time.time())
+    message = f'{timestamp}:{method.upper()}:{path}'.encode()
+    digest = hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+    return f'{timestamp}:{digest}'
+
+
+def verify(secret: str, value: str, method: str, path: str) -> bool:
+    """验证触发profile的请求头"""
+    try:
+        timestamp = int(value.split(':', 1)[0])
+    except ValueError:
+        return False
+    if abs(time.time() - timestamp) > SIGNATURE_TTL:
+        return False
+    return hmac.compare_digest(value, sign(secret, method, path, timestamp))
+
+
+class Profiler:
+    """
+    按采样率对请求进行cProfile（可选tracemalloc），结果写入目录中的.pstats/.tracemalloc文件
+    目录中文件总大小超过max_bytes时删除最早的文件
+    """
+    def __init__(self,
+                 directory: str,
+                 sample_rate: float = 0.0,
+                 endpoints: dict = None,
+                 max_bytes: int = 100 * 1024 * 1024,
+                 trace_malloc: bool = False,
+                 secret: str = None):
+        """
+        :param directory: 保存结果的目录
+        :param sample_rate: 采样率
+        :param endpoints: {endpoint: 采样率}，为None则所有endpoint都使用sample_rate
+        :param max_bytes: 目录中文件的最大总大小
+        :param trace_malloc: 是否同时保存tracemalloc快照
+        :param secret: 用于验证PROFILE_HEADER请求头的密钥，为None则不能手动触发
+        """
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.endpoints = endpoints
+        # 只有随机数小于最大采样率时，才需要进一步查看endpoint
+        self.max_rate = max([sample_rate, *(endpoints or {}).values()])
+        self.max_bytes = max_bytes
+        self.trace_malloc = trace_malloc
+        self.secret = secret
+        # 同一时间只profile一个请求
+        self._lock = threading.Lock()
+
+    def _sampled(self) -> bool:
+        if self.secret is not None:
+            value = request.headers.get(PROFILE_HEADER)
+            if value and verify(self.secret, value, request.method, request.path):
+                return True
+        if self.max_rate <= 0 or random.random() >= self.max_rate:
+            return False
+        if self.endpoints is None:
+            return True
+        rate = self.endpoints.get(request.endpoint, self.sample_rate)
+        return rate >= self.max_rate or random.random() < rate / self.max_rate
+
+    def start(self):
+        """before_request：被采样的请求开始profile"""
+        if not self._sampled() or not self._lock.acquire(blocking=False):
+            return
+        started_tracemalloc = False
+        if self.trace_malloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracemalloc = True
+        profile = cProfile.Profile()
+        request.environ[PROFILE_KEY] = (profile, started_tracemalloc)
+        profile.enable()
+
+    def finish(self, exception=None):
+        """teardown_request：结束profile并保存结果"""
+        state = request.environ.pop(PROFILE_KEY, None)
+        if state is None:
+            return
+        profile, started_tracemalloc = state
+        try:
+            profile.disable()
+            snapshot = None
+            if self.trace_malloc and tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                if started_tracemalloc:
+                    tracemalloc.stop()
+            self._save(profile, snapshot)
+        finally:
+            self._lock.release()
+
+    def _save(self, profile: cProfile.Profile, snapshot=None):
+        os.makedirs(self.directory, exist_ok=True)
+        endpoint = re.sub(r'[^\w.-]', '_', str(request.endpoint))
+        name = os.path.join(self.directory, f'{time.time_ns()}-{endpoint}')
+        profile.dump_stats(f'{name}.pstats')
+        if snapshot is not None:
+            snapshot.dump(f'{name}.tracemalloc')
+        self._rotate()
+
+    def _rotate(self):
+        """删除最早的文件，直到总大小不超过max_bytes"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(('.pstats', '.tracemalloc')):
+                stat = entry.stat()
+                files.append((stat.st_mtime_ns, entry.name, stat.st_size, entry.path))
+        total = sum(f[2] for f in files)
+        for _, _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+def init_profiling(app):
+    """开启APIKIT_PROFILE_ENABLED时注册profile所需的钩子"""
+    if not app.config['APIKIT_PROFILE_ENABLED']:
+        return
+    directory = app.config['APIKIT_PROFILE_DIR'] or os.path.join(
+        tempfile.gettempdir(), 'apikit-profiles')
+    profiler = Profiler(directory,
+                        sample_rate=app.config['APIKIT_PROFILE_SAMPLE_RATE'],
+                        endpoints=app.config['APIKIT_PROFILE_ENDPOINTS'],
+                        max_bytes=app.config['APIKIT_PROFILE_MAX_BYTES'],
+                        trace_malloc=app.config['APIKIT_PROFILE_TRACEMALLOC'],
+                        secret=app.config['APIKIT_PROFILE_SECRET'])
+    app.before_request(profiler.start)
+    app.teardown_request(profiler.finish)
@@ -0,0 +1,371 @@
+"""
+按采样率录制请求，并在本地重放
+
+开启APIKIT_RECORD_ENABLED后，被采样的请求（方法、路径和query、去除敏感信息的请求头、请求体、
+响应状态码和耗时）放入有界队列，由后台线程批量写入gzip压缩的JSONL文件
+
+重放录制的请求并对比响应状态码：
+
+    # 按原来的时间间隔，在进程内用测试客户端重放
+    python -m flask_apikit.recording /tmp/apikit-requests.jsonl.gz --app myapp:create_app()
+    # 尽快发送到本地运行的服务
+    python -m flask_apikit.recording /tmp/apikit-requests.jsonl.gz --url http://127.0.0.1:5000 --fast
+
+录制的文件也可以作为python -m flask_apikit.bench的--mix
+"""
+import argparse
+import base64
+import gzip
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from flask import request, Response
+
+from flask_apikit.utils.body import _stream_consumed
+
+logger = logging.getLogger('flask_apikit.recording')
+
+# 正在录制的请求在WSGI environ中的key
+RECORD_KEY = 'flask_apikit.record'
+# app.extensions中RecordWriter实例的key
+RECORDER_KEY = 'apikit_recorder'
+# 默认不录制的请求头（不区分大小写）
+REDACT_HEADERS = ('Authorization', 'Proxy-Authorization', 'Cookie', 'X-Api-Key', 'X-Auth-Token',
+                  'X-APIKit-Profile')
+# 重放时不发送的请求头，由客户端重新生成
+_HOP_HEADERS = {'host', 'content-length', 'connection', 'transfer-encoding'}
+
+
+# 已启动的RecordWriter，fork出的子进程中需要重新启动写入线程
+_writers = weakref.WeakSet()
+
+
+def _after_fork():
+    # 子进程中没有父进程的线程（如在init_app之后fork的prefork/--preload部署）
+    for writer in list(_writers):
+        writer._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def open_log(path: str, mode: str = 'rt'):
+    """打开录制的文件，以.gz结尾时使用gzip"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def read_records(path: str) -> list:
+    """读取录制的请求"""
+    records = []
+    with open_log(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+def decode_body(record: dict) -> bytes:
+    """录制的请求体，不是utf-8时保存在body_b64中"""
+    if record.get('body_b64') is not None:
+        return base64.b64decode(record['body_b64'])
+    body = record.get('body')
+    return None if body is None else body.encode()
+
+
+class RecordWriter:
+    """
+    用后台线程将队列中的请求追加写入文件（每批为一个gzip member）
+
+    队列满时丢弃新的请求，不阻塞处理请求的线程
+    在start之后fork出的子进程中会自动重新启动后台线程
+    """
+    def __init__(self, path: str, max_queue: int = 10000, interval: float = 1.0):
+        """
+        :param path: 写入的文件，以.gz结尾时使用gzip压缩；可以包含{pid}，替换为写入进程的pid
+        :param max_queue: 队列的最大长度
+        :param interval: 写入间隔（秒）
+        """
+        self.path_template = path
+        self.path = path.format(pid=os.getpid())
+        self.interval = interval
+        self.queue = queue.Queue(max_queue)
+        self.dropped = 0
+        self.stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动后台线程"""
+        self._thread = threading.Thread(target=self.run, name='apikit-recorder', daemon=True)
+        self._thread.start()
+        _writers.add(self)
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _after_fork(self):
+        """在fork出的子进程中重新启动后台线程，队列中继承的请求由父进程写入"""
+        self.path = self.path_template.format(pid=os.getpid())
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.dropped = 0
+        if not self.stopped.is_set():
+            self.stopped = threading.Event()
+            self.start()
+
+    def put(self, record: dict):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """写入队列中已有的请求"""
+        lines = []
+        while True:
+            try:
+                lines.append(json.dumps(self.queue.get_nowait(), ensure_ascii=False) + '\n')
+            except queue.Empty:
+                break
+        if not lines:
+            return
+        try:
+            with open_log(self.path, 'at') as f:
+                f.writelines(lines)
+        except OSError:
+            logger.exception('failed to write %d records to %s', len(lines), self.path)
+
+    def shutdown(self):
+        """停止后台线程并写入剩余的请求"""
+        self.stopped.set()
+        if self.is_alive():
+            self._thread.join()
+        else:
+            self.flush()
+
+
+class Recorder:
+    """注册为before_request/after_request，按采样率录制请求"""
+    def __init__(self, writer: RecordWriter, sample_rate: float = 0.01,
+                 max_body: int = 64 * 1024, redact_headers=REDACT_HEADERS):
+        """
+        :param writer: 写入的RecordWriter
+        :param sample_rate: 采样率
+        :param max_body: 录制的请求体最大字节数，超出或没有Content-Length时不录制请求体
+        :param redact_headers: 不录制的请求头
+        """
+        self.writer = writer
+        self.sample_rate = sample_rate
+        self.max_body = max_body
+        self.redact_headers = {h.lower() for h in redact_headers}
+
+    def _read_body(self, environ: dict):
+        """
+        读取请求体并放回wsgi.input，返回(body, body_b64)
+        请求体已被缓存（如之前调用过request.get_data()）时使用缓存；已被读取且没有缓存时返回None
+        """
+        length = request.content_length
+        if not length or length > self.max_body or request.mimetype == 'multipart/form-data':
+            return None, None
+        data = getattr(request, '_cached_data', None)
+        if data is None:
+            if _stream_consumed():
+                return None
+            data = environ['wsgi.input'].read(length)
+            environ['wsgi.input'] = BytesIO(data)
+        try:
+            return data.decode(), None
+        except UnicodeDecodeError:
+            return None, base64.b64encode(data).decode()
+
+    def start(self):
+        """before_request：被采样的请求记录请求数据"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        environ = request.environ
+        body = self._read_body(environ)
+        # 无法得到请求体，录制的请求不能正确重放
+        if body is None:
+            logger.warning('not recording %s %s: request body was already read',
+                           request.method, request.path)
+            return
+        body, body_b64 = body
+        query = environ.get('QUERY_STRING')
+        headers = {key: value for key, value in request.headers.items()
+                   if key.lower() not in self.redact_headers}
+        environ[RECORD_KEY] = ({
+            't': time.time(),
+            'method': request.method,
+            'path': request.path + (f'?{query}' if query else ''),
+            'headers': headers,
+            'body': body,
+            'body_b64': body_b64,
+            'endpoint': request.endpoint,
+        }, time.perf_counter())
+
+    def finish(self, resp: Response) -> Response:
+        """after_request：记录响应状态码和耗时，放入写入队列"""
+        state = request.environ.pop(RECORD_KEY, None)
+        if state is not None:
+            record, start = state
+            record['status'] = resp.status_code
+            record['duration'] = (time.perf_counter() - start) * 1000
+            self.writer.put(record)
+        return resp
+
+
+def init_recording(app):
+    """开启APIKIT_RECORD_ENABLED时启动写入线程并注册录制所需的钩子"""
+    if not app.config['APIKIT_RECORD_ENABLED']:
+        return
+    path = app.config['APIKIT_RECORD_FILE'] or os.path.join(
+        tempfile.gettempdir(), 'apikit-requests.jsonl.gz')
+    writer = app.extensions[RECORDER_KEY] = RecordWriter(
+        path, max_queue=app.config['APIKIT_RECORD_MAX_QUEUE'])
+    writer.start()
+    recorder = Recorder(writer,
+                        sample_rate=app.config['APIKIT_RECORD_SAMPLE_RATE'],
+                        max_body=app.config['APIKIT_RECORD_MAX_BODY'],
+                        redact_headers=app.config['APIKIT_RECORD_REDACT_HEADERS'] or REDACT_HEADERS)
+    app.before_request(recorder.start)
+    app.after_request(recorder.finish)
+
+
+def _request_headers(record: dict) -> dict:
+    return {k: v for k, v in (record.get('headers') or {}).items() if k.lower() not in _HOP_HEADERS}
+
+
+def client_sender(app):
+    """返回在进程内用测试客户端发送请求的函数，返回状态码"""
+    client = app.test_client()
+
+    def send(record: dict) -> int:
+        path, _, query = record['path'].partition('?')
+        resp = client.open(path, method=record['method'], query_string=query,
+                           headers=_request_headers(record), data=decode_body(record))
+        return resp.status_code
+
+    return send
+
+
+def http_sender(url: str):
+    """返回向url发送请求的函数，返回状态码（连接失败为None）"""
+    parts = urlsplit(url)
+    local = threading.local()
+
+    def send(record: dict) -> int:
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80,
+                                                           timeout=30)
+        try:
+            conn.request(record['method'], parts.path.rstrip('/') + record['path'],
+                         decode_body(record), _request_headers(record))
+            resp = conn.getresponse()
+            resp.read()
+            if resp.will_close:
+                conn.close()
+            return resp.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            return None
+
+    return send
+
+
+def replay(records: list, send, speed: float = 1.0, concurrency: int = 8) -> dict:
+    """
+    重放录制的请求
+
+    :param records: 录制的请求
+    :param send: 发送请求并返回状态码的函数，见client_sender/http_sender
+    :param speed: 相对于录制时的速度，为0则不等待，尽快发送
+    :param concurrency: 同时发送的请求数
+    :return: {'requests', 'elapsed'（秒）, 'mismatches': [(method, path, 录制的状态码, 重放的状态码)],
+              'durations': {endpoint: [录制的平均耗时, 重放的平均耗时]（毫秒）}}
+    """
+    records = sorted(records, key=lambda r: r.get('t', 0))
+
+    def run(record):
+        begin = time.perf_counter()
+        status = send(record)
+        return record, status, (time.perf_counter() - begin) * 1000
+
+    start = time.perf_counter()
+    first = records[0].get('t', 0) if records else 0
+    futures = []
+    with ThreadPoolExecutor(concurrency) as executor:
+        for record in records:
+            if speed > 0:
+                delay = (record.get('t', first) - first) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(executor.submit(run, record))
+    mismatches = []
+    totals = {}
+    for future in futures:
+        record, status, duration = future.result()
+        if status != record.get('status'):
+            mismatches.append((record['method'], record['path'], record.get('status'), status))
+        total = totals.setdefault(str(record.get('endpoint')), [0, 0.0, 0.0])
+        total[0] += 1
+        total[1] += record.get('duration') or 0
+        total[2] += duration
+    return {
+        'requests': len(records),
+        'elapsed': time.perf_counter() - start,
+        'mismatches': mismatches,
+        'durations': {endpoint: [recorded / count, replayed / count]
+                      for endpoint, (count, recorded, replayed) in totals.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m flask_apikit.recording',
+                                     description='重放录制的请求并对比响应状态码')
+    parser.add_argument('file', help='录制的文件')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--app', help="在进程内重放，'模块:变量'或'模块:工厂函数()'")
+    target.add_argument('--url', help='发送到此地址，如http://127.0.0.1:5000')
+    parser.add_argument('--speed', type=float, default=1.0, help='相对于录制时的速度')
+    parser.add_argument('--fast', action='store_true', help='不保持原来的时间间隔，尽快发送')
+    parser.add_argument('--concurrency', type=int, default=8, help='同时发送的请求数')
+    args = parser.parse_args(argv)
+
+    if args.app:
+        from flask_apikit.bench import load_app
+        send = client_sender(load_app(args.app))
+    else:
+        send = http_sender(args.url)
+    result = replay(read_records(args.file), send, speed=0 if args.fast else args.speed,
+                    concurrency=args.concurrency)
+    print(f'requests    {result["requests"]} in {result["elapsed"]:.1f}s')
+    print(f'mismatches  {len(result["mismatches"])}')
+    for method, path, recorded, replayed in result['mismatches'][:20]:
+        print(f'    {method} {path}: {recorded} -> {replayed}')
+    print('duration (ms, recorded -> replayed)')
+    for endpoint, (recorded, replayed) in sorted(result['durations'].items()):
+        print(f'    {endpoint:30} {recorded:9.2f} -> {replayed:9.2f}')
+    return 1 if result['mismatches'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,21 +1,39 @@
-import math
-from flask import current_app, jsonify, request
+from flask import jsonify, request
+
+from flask_apikit.settings import current_settings, EMPTY_HEADERS, FrozenDict
 
 
 class APIResponse:
     """基础的API响应"""
+    # 每个请求都会创建，使用__slots__减小实例大小和创建开销
+    __slots__ = ('data', 'status_code', '_headers')
+
     def __init__(self, data, status_code=200, headers=None):
         self.data = data
         self.status_code = status_code
-        self.headers = headers
+        self._headers = headers
+
+    @property
+    def headers(self):
+        """响应头，为共用的默认值（FrozenDict）时，在第一次读取时复制，之后可以直接修改"""
+        headers = self._headers
+        if type(headers) is FrozenDict:
+            headers = self._headers = dict(headers)
+        return headers
+
+    @headers.setter
+    def headers(self, value):
+        self._headers = value
 
     def to_tuple(self):
         """返回make_response所用的元组，并将数据部分json化"""
-        return jsonify(self.data), self.status_code, self.headers
+        return jsonify(self.data), self.status_code, self._headers
 
 
 class Pagination(APIResponse):
     """分页的API响应"""
+    __slots__ = ('page', 'limit', 'skip', 'count', '_settings')
+
     def __init__(self,
                  default_limit: int = None,
                  max_limit: int = None,
@@ -36,28 +54,24 @@ class Pagination(APIResponse):
         """
         # 默认值
         self.count = 0
+        self._settings = settings = current_settings()
         # 从query中获取分页参数
         self._parse_query(default_limit=default_limit,
                           max_limit=max_limit,
                           page_key=page_key,
                           limit_key=limit_key)
-        # 自动加入分页所用的 Access-Control-Expose-Headers
+        # 没有其他响应头时使用共用的默认值，在set_data时才生成新的字典
         if headers is None:
-            headers = {}
-        if auto_expose_headers:
+            headers = settings.pagination_headers if auto_expose_headers else EMPTY_HEADERS
+        # 自动加入分页所用的 Access-Control-Expose-Headers
+        elif auto_expose_headers:
             # 如果已有Expose-Headers，同时有值，则将其全部大小并加一个逗号
             if 'Access-Control-Expose-Headers' in headers and headers[
                     'Access-Control-Expose-Headers']:
                 headers['Access-Control-Expose-Headers'] += ', '
             else:
                 headers['Access-Control-Expose-Headers'] = ''
-            headers['Access-Control-Expose-Headers'] += ', '.join(x.upper(
-            ) for x in [
-                current_app.config['APIKIT_PAGINATION_HEADER_PAGE_KEY'],
-                current_app.config['APIKIT_PAGINATION_HEADER_LIMIT_KEY'],
-                current_app.config['APIKIT_PAGINATION_HEADER_COUNT_KEY'],
-                current_app.config['APIKIT_PAGINATION_HEADER_PAGE_COUNT_KEY']
-            ])
+            headers['Access-Control-Expose-Headers'] += settings.pagination_expose_headers
         super().__init__([], status_code, headers)
 
     def set_data(self, data, count):
@@ -81,15 +95,15 @@ class Pagination(APIResponse):
         :return:
         """
         # 获取配置
+        settings = self._settings
         if default_limit is None:
-            default_limit = current_app.config[
-                'APIKIT_PAGINATION_DEFAULT_LIMIT']
+            default_limit = settings.pagination_default_limit
         if max_limit is None:
-            max_limit = current_app.config['APIKIT_PAGINATION_MAX_LIMIT']
+            max_limit = settings.pagination_max_limit
         if page_key is None:
-            page_key = current_app.config['APIKIT_PAGINATION_PAGE_KEY']
+            page_key = settings.pagination_page_key
         if limit_key is None:
-            limit_key = current_app.config['APIKIT_PAGINATION_LIMIT_KEY']
+            limit_key = settings.pagination_limit_key
         # 获取页数，默认1
         page = request.args.get(page_key, 1, int)
         if page < 1:
@@ -106,12 +120,15 @@ class Pagination(APIResponse):
 
     def _set_pagination_headers(self):
         """设置分页头"""
-        self.headers[current_app.
-                     config['APIKIT_PAGINATION_HEADER_PAGE_KEY']] = self.page
-        self.headers[current_app.
-                     config['APIKIT_PAGINATION_HEADER_LIMIT_KEY']] = self.limit
-        self.headers[current_app.
-                     config['APIKIT_PAGINATION_HEADER_COUNT_KEY']] = self.count
-        self.headers[current_app.config[
-            'APIKIT_PAGINATION_HEADER_PAGE_COUNT_KEY']] = math.ceil(
-                self.count / self.limit)
+        page_key, limit_key, count_key, page_count_key = self._settings.pagination_header_keys
+        limit = self.limit
+        count = self.count
+        # 向上取整的整数除法，不经过浮点数，count很大时也不会损失精度
+        pagination = {page_key: self.page, limit_key: limit, count_key: count,
+                      page_count_key: -(-count // limit)}
+        headers = self._headers
+        # 共用的默认值不能修改，与分页响应头合并为新的字典
+        if type(headers) is FrozenDict:
+            self._headers = {**headers, **pagination}
+        else:
+            headers.update(pagination)
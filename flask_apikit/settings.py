@@ -0,0 +1,187 @@
+from collections import ChainMap
+
+from flask import current_app, request
+
+# app.extensions中Settings实例的key
+SETTINGS_KEY = 'apikit'
+# app.extensions中蓝本设置的key：{蓝本名（嵌套时为'parent.child'）: (覆盖的配置, Settings)}
+BLUEPRINT_SETTINGS_KEY = 'apikit_blueprints'
+# 处理请求时读取的配置，属性名为去掉APIKIT_前缀的小写形式，如APIKIT_PAGINATION_MAX_LIMIT -> pagination_max_limit
+CONFIG_KEYS = (
+    'APIKIT_PAGINATION_DEFAULT_LIMIT',
+    'APIKIT_PAGINATION_MAX_LIMIT',
+    'APIKIT_PAGINATION_PAGE_KEY',
+    'APIKIT_PAGINATION_LIMIT_KEY',
+    'APIKIT_PAGINATION_HEADER_PAGE_KEY',
+    'APIKIT_PAGINATION_HEADER_LIMIT_KEY',
+    'APIKIT_PAGINATION_HEADER_COUNT_KEY',
+    'APIKIT_PAGINATION_HEADER_PAGE_COUNT_KEY',
+    'APIKIT_MAX_JSON_BYTES',
+    'APIKIT_MAX_JSON_DEPTH',
+    'APIKIT_JSON_DECODER',
+    'APIKIT_JSON_ZERO_COPY',
+    'APIKIT_UPLOAD_MAX_BYTES',
+    'APIKIT_UPLOAD_MAX_FILE_BYTES',
+    'APIKIT_UPLOAD_MAX_FORM_BYTES',
+    'APIKIT_UPLOAD_MEMORY_THRESHOLD',
+    'APIKIT_UPLOAD_ALLOWED_TYPES',
+    'APIKIT_BULK_CHUNK_SIZE',
+    'APIKIT_BULK_MAX_ERRORS',
+    'APIKIT_BULK_EXECUTOR',
+    'APIKIT_BULK_OFFLOAD_MIN_ITEMS',
+    'APIKIT_ERROR_CACHE_SIZE',
+    'APIKIT_ACCESS_CONTROL_MAX_AGE',
+    'APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN',
+    'APIKIT_ACCESS_CONTROL_ALLOW_HEADERS',
+    'APIKIT_ACCESS_CONTROL_ALLOW_CREDENTIALS',
+    'APIKIT_ACCESS_CONTROL_EXPOSE_HEADERS',
+)
+_FIELDS = tuple(key[len('APIKIT_'):].lower() for key in CONFIG_KEYS)
+
+
+class FrozenDict(dict):
+    """不能修改的字典，用于多个响应共用的默认响应头"""
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f'{type(self).__name__} is read-only')
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return type(self), (dict(self), )
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict.__repr__(self)})'
+
+
+# 没有响应头时共用的默认值
+EMPTY_HEADERS = FrozenDict()
+
+
+def _freeze(value):
+    """列表等可变的配置值转为元组，避免修改快照"""
+    if isinstance(value, (list, set, frozenset)):
+        return tuple(value)
+    return value
+
+
+class Settings:
+    """
+    处理请求时读取的APIKIT_*配置的只读快照，由APIKit.init_app生成，保存在app.extensions['apikit']中
+    处理请求时只读取属性，不再按key查找app.config
+
+    之后修改app.config需要调用APIKit.reload_config()重新生成
+    """
+    __slots__ = _FIELDS + (
+        # 以下为根据配置预先计算的值
+        # APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN为列表时，小写的Origin集合
+        'allow_origins',
+        # Access-Control-Allow-Headers/Access-Control-Expose-Headers响应头的值，为空则不返回
+        'allow_headers',
+        'expose_headers',
+        # 分页响应头名：(页码, 每页个数, 元素总个数, 总页数)
+        'pagination_header_keys',
+        # 分页的Access-Control-Expose-Headers的值
+        'pagination_expose_headers',
+        # Pagination默认的响应头（只有分页的Access-Control-Expose-Headers），多个响应共用
+        'pagination_headers',
+    )
+
+    def __init__(self, config):
+        """
+        :param config: app.config，或覆盖了部分配置的ChainMap
+        """
+        set_attr = object.__setattr__
+        for field, key in zip(_FIELDS, CONFIG_KEYS):
+            set_attr(self, field, _freeze(config[key]))
+        origin = self.access_control_allow_origin
+        set_attr(self, 'allow_origins', frozenset(o.lower() for o in origin) if isinstance(
+            origin, tuple) else None)
+        set_attr(self, 'allow_headers', ', '.join(
+            x.upper() for x in self.access_control_allow_headers or ()))
+        set_attr(self, 'expose_headers', ', '.join(
+            x.upper() for x in self.access_control_expose_headers or ()))
+        keys = (self.pagination_header_page_key, self.pagination_header_limit_key,
+                self.pagination_header_count_key, self.pagination_header_page_count_key)
+        set_attr(self, 'pagination_header_keys', keys)
+        set_attr(self, 'pagination_expose_headers', ', '.join(x.upper() for x in keys))
+        set_attr(self, 'pagination_headers', FrozenDict({
+            'Access-Control-Expose-Headers': self.pagination_expose_headers}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read-only, use APIKit.reload_config()')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is read-only, use APIKit.reload_config()')
+
+    def __repr__(self):
+        return f'<Settings {" ".join(f"{f}={getattr(self, f)!r}" for f in _FIELDS)}>'
+
+
+def build_settings(app):
+    """根据app.config生成app和已注册蓝本的Settings"""
+    app.extensions[SETTINGS_KEY] = Settings(app.config)
+    blueprints = app.extensions.get(BLUEPRINT_SETTINGS_KEY)
+    if blueprints:
+        for name, (overrides, _) in blueprints.items():
+            blueprints[name] = (overrides, Settings(ChainMap(overrides, app.config)))
+
+
+def _find(blueprints: dict, name: str) -> tuple:
+    """查找蓝本或最近的外层蓝本的设置"""
+    while name:
+        found = blueprints.get(name)
+        if found is not None:
+            return found
+        name = name.rpartition('.')[0]
+    return None
+
+
+def current_settings() -> Settings:
+    """
+    当前请求所用的Settings
+    请求属于用configure_blueprint设置过的蓝本（或其中嵌套的蓝本）时为蓝本的设置，否则为app的设置
+    """
+    extensions = current_app.extensions
+    blueprints = extensions.get(BLUEPRINT_SETTINGS_KEY)
+    if blueprints and request:
+        found = _find(blueprints, request.blueprint)
+        if found is not None:
+            return found[1]
+    return extensions[SETTINGS_KEY]
+
+
+def configure_blueprint(blueprint, **config):
+    """
+    为蓝本单独设置处理请求时的配置，覆盖app.config中的值：
+
+        bp = Blueprint('admin', __name__)
+        configure_blueprint(bp, APIKIT_PAGINATION_MAX_LIMIT=1000)
+
+    在蓝本注册到app时生成Settings，嵌套的蓝本会继承外层蓝本的设置
+    只能覆盖settings.CONFIG_KEYS中的配置
+
+    :param blueprint: Blueprint
+    :param config: 覆盖的配置
+    """
+    unknown = set(config) - set(CONFIG_KEYS)
+    if unknown:
+        raise ValueError(f'cannot override {", ".join(sorted(unknown))} for a blueprint')
+
+    def register(state):
+        app = state.app
+        if SETTINGS_KEY not in app.extensions:
+            raise RuntimeError('APIKit.init_app() must be called before registering blueprints '
+                               'configured with configure_blueprint()')
+        blueprints = app.extensions.setdefault(BLUEPRINT_SETTINGS_KEY, {})
+        name = f'{state.name_prefix}.{state.name}'.lstrip('.')
+        # 外层蓝本先注册，合并其覆盖的配置
+        overrides = dict(config)
+        parent = _find(blueprints, name.rpartition('.')[0])
+        if parent is not None:
+            overrides = {**parent[0], **overrides}
+        blueprints[name] = (overrides, Settings(ChainMap(overrides, app.config)))
+
+    blueprint.record(register)
@@ -0,0 +1,310 @@
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import weakref
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter_ns, time_ns
+
+from flask import request, Response
+
+logger = logging.getLogger('flask_apikit.tracing')
+
+# 当前请求的Trace，为None表示没有开启tracing（span不做任何记录）
+current_trace = ContextVar('apikit_trace', default=None)
+# app.extensions中BatchProcessor实例的key
+TRACING_KEY = 'apikit_tracing'
+# W3C Trace Context：version-trace_id-parent_id-flags
+TRACEPARENT_RE = re.compile(r'[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}')
+TRACE_ID_RE = re.compile(r'[0-9a-fA-F-]{8,64}')
+
+
+def _new_span_ids():
+    # 以随机数为起点递增，比每次生成随机数开销小
+    return itertools.count(random.getrandbits(63))
+
+
+_span_ids = _new_span_ids()
+
+
+# 已启动的BatchProcessor，fork出的子进程中需要重新启动导出线程
+_processors = weakref.WeakSet()
+
+
+def _after_fork():
+    # fork出的worker进程使用不同的起点，避免span id重复
+    global _span_ids
+    _span_ids = _new_span_ids()
+    # 子进程中没有父进程的线程（如在init_app之后fork的prefork/--preload部署）
+    for processor in list(_processors):
+        processor._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+class Trace:
+    """
+    一个请求的trace：trace id、开始时间、当前所在的span和写入span的队列
+
+    在视图中用copy_context()启动的线程共享同一个Trace，其中并发的span的父span可能不准确
+    """
+    __slots__ = ('trace_id', 'parent_id', 'wall', 'perf', 'queue', 'current', 'root', 'token')
+
+    def __init__(self, trace_id: str, queue: deque, parent_id: str = None):
+        self.trace_id = trace_id
+        # 上游服务传来的父span
+        self.parent_id = parent_id
+        # 同一时刻的墙上时间和perf_counter，用于将span的开始时间换算为墙上时间
+        self.wall = time_ns()
+        self.perf = perf_counter_ns()
+        self.queue = queue
+        # 根span（整个请求）的id，新的span以current为父span
+        self.root = self.current = next(_span_ids)
+        # 请求结束时用于还原为外层的trace
+        self.token = None
+
+
+def current_trace_id() -> str:
+    """当前请求的trace id，没有开启tracing时为None"""
+    trace = current_trace.get()
+    return None if trace is None else trace.trace_id
+
+
+class span:
+    """
+    记录视图中某个操作的耗时，结束时放入队列，由后台线程批量导出
+    可以作为上下文管理器或装饰器使用：
+
+        with span('db.query', table='user'):
+            rows = query_db()
+
+        @span('cache.get')
+        def load_cache():
+            ...
+
+    不在请求中（或没有开启APIKIT_TRACING_ENABLED）时不做任何记录
+
+    :param name: span名
+    :param attrs: 附加的属性，需可以json化
+    """
+    __slots__ = ('name', 'attrs', '_trace', '_parent', '_id', '_start')
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs or None
+        self._trace = None
+
+    def __call__(self, func):
+        # 作为装饰器时每次调用使用新的实例，以支持多线程和递归
+        name, attrs = self.name, self.attrs or {}
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **attrs):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def set(self, key: str, value):
+        """在span中途加入属性"""
+        if self.attrs is None:
+            self.attrs = {}
+        self.attrs[key] = value
+
+    def __enter__(self):
+        trace = self._trace = current_trace.get()
+        if trace is not None:
+            # 父span保存在Trace中而不是另一个ContextVar，省去ContextVar.set/reset的开销
+            self._parent = trace.current
+            self._id = trace.current = next(_span_ids)
+            self._start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        trace = self._trace
+        if trace is not None:
+            duration = perf_counter_ns() - self._start
+            trace.current = self._parent
+            # 只放入元组，转换为dict在后台线程中进行
+            trace.queue.append((trace, self._id, self._parent, self.name, self._start, duration,
+                                self.attrs, None if exc_type is None else exc_type.__name__))
+            self._trace = None
+        return False
+
+
+def _format_id(value: int) -> str:
+    return f'{value & 0xffffffffffffffff:016x}'
+
+
+def to_dict(record: tuple) -> dict:
+    """将队列中的span转换为导出的dict，时间单位为微秒"""
+    trace, span_id, parent_id, name, start, duration, attrs, error = record
+    return {
+        'trace_id': trace.trace_id,
+        'span_id': _format_id(span_id),
+        'parent_id': trace.parent_id if parent_id is None else _format_id(parent_id),
+        'name': name,
+        'start': (trace.wall + start - trace.perf) // 1000,
+        'duration': duration // 1000,
+        'attrs': attrs,
+        'error': error,
+    }
+
+
+class JSONLExporter:
+    """将span以每行一个json的格式追加写入文件"""
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: list):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(s, ensure_ascii=False, default=str) + '\n' for s in spans)
+
+
+class BatchProcessor:
+    """
+    用后台线程每隔interval秒将队列中的span按batch_size分批交给exporter
+
+    队列最多保存max_queue个span，超出时丢弃最早的span
+    在start之后fork出的子进程中会自动重新启动后台线程
+    """
+    def __init__(self, exporter, batch_size: int = 512, interval: float = 1.0,
+                 max_queue: int = 10000):
+        """
+        :param exporter: 有export(spans)方法的对象，或接受span列表的函数
+        :param batch_size: 每次导出的最大个数
+        :param interval: 导出间隔（秒）
+        :param max_queue: 队列的最大长度
+        """
+        self.export = getattr(exporter, 'export', exporter)
+        self.batch_size = batch_size
+        self.interval = interval
+        # deque的append/popleft是线程安全的，记录span时不需要加锁
+        self.queue = deque(maxlen=max_queue)
+        self.stopped = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """启动后台线程"""
+        self._thread = threading.Thread(target=self.run, name='apikit-tracing', daemon=True)
+        self._thread.start()
+        _processors.add(self)
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _after_fork(self):
+        """在fork出的子进程中重新启动后台线程，队列中继承的span由父进程导出"""
+        self.queue.clear()
+        self._flush_lock = threading.Lock()
+        if not self.stopped.is_set():
+            self.stopped = threading.Event()
+            self.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """导出队列中已有的span"""
+        queue = self.queue
+        with self._flush_lock:
+            while queue:
+                batch = []
+                try:
+                    while len(batch) < self.batch_size:
+                        batch.append(to_dict(queue.popleft()))
+                except IndexError:
+                    pass
+                try:
+                    self.export(batch)
+                except Exception:
+                    logger.exception('failed to export %d spans', len(batch))
+
+    def shutdown(self):
+        """停止后台线程并导出剩余的span"""
+        self.stopped.set()
+        if self.is_alive():
+            self._thread.join()
+        else:
+            self.flush()
+
+
+class Tracer:
+    """注册为before_request/after_request/teardown_request，开始和结束每个请求的trace"""
+    def __init__(self, processor: BatchProcessor, header: str = 'X-Trace-Id'):
+        """
+        :param processor: 写入span的BatchProcessor
+        :param header: 传入和返回trace id的请求头，为None则只使用traceparent
+        """
+        self.processor = processor
+        self.header = header
+
+    def _incoming(self) -> tuple:
+        """从请求头中获取(trace id, 父span id)，没有则生成新的trace id"""
+        headers = request.headers
+        traceparent = headers.get('traceparent')
+        if traceparent:
+            match = TRACEPARENT_RE.fullmatch(traceparent.strip())
+            if match and match.group(1) != '0' * 32:
+                return match.group(1), match.group(2)
+        if self.header:
+            trace_id = headers.get(self.header)
+            if trace_id and TRACE_ID_RE.fullmatch(trace_id):
+                return trace_id, None
+        return f'{random.getrandbits(128):032x}', None
+
+    def start(self):
+        """before_request：开始当前请求的trace，整个请求作为根span"""
+        trace_id, parent_id = self._incoming()
+        trace = Trace(trace_id, self.processor.queue, parent_id)
+        trace.token = current_trace.set(trace)
+
+    def finish(self, resp: Response) -> Response:
+        """after_request：在响应中返回trace id"""
+        trace = current_trace.get()
+        if trace is not None and self.header:
+            resp.headers[self.header] = trace.trace_id
+        return resp
+
+    def teardown(self, exception):
+        """teardown_request：记录根span并还原为外层的trace"""
+        trace = current_trace.get()
+        if trace is None or trace.token is None:
+            return
+        attrs = {'method': request.method, 'path': request.path}
+        trace.queue.append((trace, trace.root, None, request.endpoint or 'request', trace.perf,
+                            perf_counter_ns() - trace.perf, attrs,
+                            None if exception is None else type(exception).__name__))
+        current_trace.reset(trace.token)
+        trace.token = None
+
+
+def init_tracing(app):
+    """开启APIKIT_TRACING_ENABLED时启动导出线程并注册trace所需的钩子"""
+    if not app.config['APIKIT_TRACING_ENABLED']:
+        return
+    exporter = app.config['APIKIT_TRACING_EXPORTER']
+    if exporter is None:
+        exporter = JSONLExporter(app.config['APIKIT_TRACING_FILE'] or os.path.join(
+            tempfile.gettempdir(), 'apikit-traces.jsonl'))
+    processor = app.extensions[TRACING_KEY] = BatchProcessor(
+        exporter,
+        batch_size=app.config['APIKIT_TRACING_BATCH_SIZE'],
+        interval=app.config['APIKIT_TRACING_INTERVAL'],
+        max_queue=app.config['APIKIT_TRACING_MAX_QUEUE'])
+    processor.start()
+    tracer = Tracer(processor, header=app.config['APIKIT_TRACING_HEADER'])
+    app.before_request(tracer.start)
+    app.after_request(tracer.finish)
+    app.teardown_request(tracer.teardown)
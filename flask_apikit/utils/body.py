@@ -0,0 +1,168 @@
+import json
+from io import BytesIO
+
+from flask import request
+
+from flask_apikit.exceptions import PayloadTooLarge
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 可选的json解码器，均直接接受bytes/bytearray
+JSON_DECODERS = {'stdlib': json.loads}
+if orjson is not None:
+    JSON_DECODERS['orjson'] = orjson.loads
+
+
+def get_decoder(name=None):
+    """
+    获取json解码器
+
+    :param name: None为Flask的request.json_module（与request.get_json相同）；
+        'stdlib'/'orjson'为对应的库，'auto'在安装了orjson时使用orjson，否则使用stdlib；
+        也可以直接传入一个接受bytes的函数
+    :return:
+    """
+    if name is None:
+        return request.json_module.loads
+    if callable(name):
+        return name
+    if name == 'auto':
+        return JSON_DECODERS.get('orjson', json.loads)
+    try:
+        return JSON_DECODERS[name]
+    except KeyError:
+        raise RuntimeError(f'json decoder "{name}" is not available')
+
+
+def _read_into_buffer(length: int) -> bytearray:
+    """按Content-Length预先分配缓冲区，直接从wsgi.input读入，避免拼接bytes"""
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    stream = request.environ['wsgi.input']
+    readinto = getattr(stream, 'readinto', None)
+    pos = 0
+    while pos < length:
+        if readinto is not None:
+            n = readinto(view[pos:])
+        else:
+            chunk = stream.read(min(length - pos, 65536))
+            n = len(chunk)
+            view[pos:pos + n] = chunk
+        if not n:
+            break
+        pos += n
+    view.release()
+    # 客户端提前断开，丢弃未读取的部分
+    if pos < length:
+        del buffer[pos:]
+    return buffer
+
+
+def _stream_consumed() -> bool:
+    """request.stream是否已被读取或请求体已被缓存（如before_request中调用过request.get_data()或读取过表单）"""
+    d = request.__dict__
+    return 'stream' in d or 'form' in d or d.get('_cached_data') is not None
+
+
+def read_body(max_bytes: int = 0,
+              cache: bool = True,
+              zero_copy: bool = False) -> bytes:
+    """
+    读取请求体，超出max_bytes时抛出PayloadTooLarge
+
+    有Content-Length时在读取前检查，没有（如chunked）时最多只读取max_bytes+1字节
+    同时受MAX_CONTENT_LENGTH（request.max_content_length）限制
+
+    :param max_bytes: 请求体最大字节数，为0则不限制
+    :param cache: 传给request.get_data(cache=cache)
+    :param zero_copy: 有Content-Length时直接读入预分配的bytearray，cache为True时同样缓存在request中；
+        请求体已被读取或缓存时仍使用request.get_data()
+    :return:
+    """
+    content_length = request.content_length
+    max_content_length = request.max_content_length
+    if max_content_length is not None and (not max_bytes or max_content_length < max_bytes):
+        max_bytes = max_content_length
+    if max_bytes:
+        if content_length is None:
+            data = getattr(request, '_cached_data', None)
+            if data is None:
+                data = request.stream.read(max_bytes + 1)
+            if len(data) > max_bytes:
+                raise PayloadTooLarge(f'body exceeds {max_bytes} bytes')
+            # 与request.get_data相同缓存在request中，之后再次读取（如参数不同的get_json）时不会读到空的请求体
+            if cache:
+                request._cached_data = data
+            return data
+        if content_length > max_bytes:
+            raise PayloadTooLarge(f'body exceeds {max_bytes} bytes')
+    if zero_copy and content_length and not _stream_consumed():
+        data = _read_into_buffer(content_length)
+        # 与request.get_data相同：缓存时之后再次读取得到同样的请求体，否则标记为已读取
+        if cache:
+            request._cached_data = data
+        else:
+            request.__dict__['stream'] = BytesIO()
+        return data
+    return request.get_data(cache=cache)
+
+
+def check_depth(raw: bytes, data, max_depth: int):
+    """
+    检查json数据的嵌套深度，超出max_depth时抛出PayloadTooLarge
+
+    :param raw: 原始请求体，容器总数不超过max_depth时不必遍历
+    :param data: 解析后的数据
+    :param max_depth: 最大嵌套深度
+    """
+    if raw.count(b'[') + raw.count(b'{') <= max_depth:
+        return
+    stack = [(data, 1)]
+    while stack:
+        node, depth = stack.pop()
+        if depth > max_depth:
+            raise PayloadTooLarge(f'nesting depth exceeds {max_depth}')
+        children = node.values() if isinstance(node, dict) else node
+        for child in children:
+            if isinstance(child, (dict, list)):
+                stack.append((child, depth + 1))
+
+
+def load_json(max_bytes: int = 0,
+              max_depth: int = 0,
+              force: bool = False,
+              silent: bool = False,
+              cache: bool = True,
+              *,
+              decoder=None,
+              zero_copy: bool = False):
+    """
+    与request.get_json相同，但在解析前限制请求体大小，解析后限制嵌套深度
+    直接从请求体的bytes解码，不会先转为str
+
+    :param max_bytes: 请求体最大字节数，为0则不限制
+    :param max_depth: json最大嵌套深度，为0则不限制
+    :param force: 忽略mimetype，总是尝试解析
+    :param silent: 解析失败时返回None
+    :param cache: 传给request.get_data(cache=cache)
+    :param decoder: json解码器，见get_decoder
+    :param zero_copy: 见read_body
+    :return:
+    """
+    if not (force or request.is_json):
+        return None
+    raw = read_body(max_bytes, cache, zero_copy)
+    try:
+        data = get_decoder(decoder)(raw)
+    except RecursionError:
+        raise PayloadTooLarge('nesting depth exceeds decoder limit')
+    except ValueError as e:
+        if silent:
+            return None
+        return request.on_json_loading_failed(e)
+    if max_depth and isinstance(data, (dict, list)):
+        check_depth(raw, data, max_depth)
+    return data
@@ -0,0 +1,100 @@
+import pickle
+from concurrent.futures import Executor
+
+from marshmallow import Schema
+from marshmallow.exceptions import ValidationError
+
+
+def _merge_messages(messages):
+    """合并多个验证器对于同一字段的相同错误"""
+    if isinstance(messages, dict):
+        return {key: list(set(value)) if isinstance(value, list) else value
+                for key, value in messages.items()}
+    return messages
+
+
+def load_chunk(schema: Schema, items: list, context: dict = None,
+               offset: int = 0) -> tuple:
+    """
+    验证一批数据，返回(验证通过的数据列表, {全局下标: 错误信息})
+
+    validates_schema(pass_many=True)等针对整批数据的错误保留原来的key（如'_schema'），
+    此时这一批数据都不算验证通过
+
+    定义在模块顶层，以便ProcessPoolExecutor在子进程中调用
+
+    :param schema: schema实例
+    :param items: 需要验证的数据列表
+    :param context: 传递给schema使用的额外数据
+    :param offset: items[0]在整个列表中的下标
+    :return:
+    """
+    if context:
+        schema.context = context
+    errors = {}
+    # 仍需验证的数据在items中的下标
+    indexes = range(len(items))
+    while indexes:
+        try:
+            return schema.load([items[i] for i in indexes], many=True), errors
+        except ValidationError as e:
+            for key, messages in e.messages.items():
+                errors[offset + indexes[key] if isinstance(key, int) else key] = _merge_messages(messages)
+            if not e.messages or not all(isinstance(key, int) for key in e.messages):
+                return [], errors
+            # e.valid_data没有经过post_load等处理，重新验证其余的数据，使所有结果经过同样的处理
+            indexes = [i for position, i in enumerate(indexes) if position not in e.messages]
+    return [], errors
+
+
+def _picklable(*objs) -> bool:
+    try:
+        pickle.dumps(objs)
+    except Exception:
+        return False
+    return True
+
+
+def load_many(items: list,
+              schema: Schema,
+              context: dict = None,
+              chunk_size: int = 1000,
+              max_errors: int = 0,
+              executor: Executor = None,
+              offload_min_items: int = 0) -> tuple:
+    """
+    分批验证列表数据，返回(验证通过的数据列表, {下标: 错误信息})
+    针对整批数据的错误保留原来的key，见load_chunk
+
+    :param items: 需要验证的数据列表
+    :param schema: schema实例
+    :param context: 传递给schema使用的额外数据
+    :param chunk_size: 每批数量
+    :param max_errors: 最多保留的错误个数，为0则不限制
+    :param executor: 用于并行验证的Executor（如ProcessPoolExecutor），schema和context无法pickle时在当前线程验证
+    :param offload_min_items: 数据个数达到此值才交给executor
+    :return:
+    """
+    chunks = [(items[i:i + chunk_size], i)
+              for i in range(0, len(items), chunk_size)]
+    if (executor is not None and len(chunks) > 1
+            and len(items) >= offload_min_items
+            and _picklable(schema, context)):
+        futures = [executor.submit(load_chunk, schema, chunk, context, offset)
+                   for chunk, offset in chunks]
+        results = (future.result() for future in futures)
+    else:
+        results = (load_chunk(schema, chunk, context, offset)
+                   for chunk, offset in chunks)
+    valid, errors = [], {}
+    for chunk_valid, chunk_errors in results:
+        valid.extend(chunk_valid)
+        for key, messages in chunk_errors.items():
+            # 多批数据针对整批的错误合并在一起
+            if key in errors and isinstance(errors[key], list) and isinstance(messages, list):
+                errors[key] = errors[key] + [m for m in messages if m not in errors[key]]
+                continue
+            if max_errors and len(errors) >= max_errors:
+                break
+            errors[key] = messages
+    return valid, errors
@@ -0,0 +1,107 @@
+from tempfile import SpooledTemporaryFile
+
+from flask import request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import FormDataParser
+
+from flask_apikit.exceptions import PayloadTooLarge, UnsupportedMediaType
+
+
+class SpooledUpload(SpooledTemporaryFile):
+    """上传文件的容器，超过memory_threshold后写入临时文件，写入时检查文件大小"""
+    def __init__(self, memory_threshold: int, max_bytes: int = 0):
+        super().__init__(max_size=memory_threshold)
+        self.max_bytes = max_bytes
+        self.written = 0
+
+    def write(self, s):
+        self.written += len(s)
+        # 一旦超出立即中断，不再继续读取剩余的数据
+        if self.max_bytes and self.written > self.max_bytes:
+            self.close()
+            raise PayloadTooLarge(f'file exceeds {self.max_bytes} bytes')
+        return super().write(s)
+
+
+class LimitedReader:
+    """读取的字节数超出max_bytes时抛出PayloadTooLarge，用于没有Content-Length（如chunked）的请求体"""
+    def __init__(self, stream, max_bytes: int):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.read_bytes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        # 最多多读1字节，用于判断是否超出
+        remaining = self.max_bytes + 1 - self.read_bytes
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        data = self.stream.read(size)
+        self.read_bytes += len(data)
+        if self.read_bytes > self.max_bytes:
+            raise PayloadTooLarge(f'body exceeds {self.max_bytes} bytes')
+        return data
+
+
+def is_allowed_type(content_type: str, allowed_types) -> bool:
+    """
+    检查content_type是否在allowed_types中，支持'image/*'形式的通配
+
+    :param content_type: 文件的Content-Type
+    :param allowed_types: 允许的类型列表，为空则不限制
+    :return:
+    """
+    if not allowed_types:
+        return True
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    for allowed in allowed_types:
+        allowed = allowed.lower()
+        if allowed == content_type or (
+                allowed.endswith('/*') and content_type.startswith(allowed[:-1])):
+            return True
+    return False
+
+
+def parse_multipart(max_bytes: int = 0,
+                    max_file_bytes: int = 0,
+                    max_form_bytes: int = None,
+                    memory_threshold: int = 512 * 1024,
+                    allowed_types: list = None) -> tuple:
+    """
+    流式解析multipart/form-data请求，返回(form, files)两个MultiDict
+
+    文件写入SpooledUpload，内存占用不超过memory_threshold，
+    文件大小/类型在读取过程中检查，不符合时立即抛出错误；
+    没有Content-Length（如chunked）时在读取过程中检查整个请求体的大小
+
+    :param max_bytes: 整个请求体的最大字节数，为0则不限制
+    :param max_file_bytes: 单个文件的最大字节数，为0则不限制
+    :param max_form_bytes: 非文件字段的最大字节数，为None则不限制
+    :param memory_threshold: 文件超过此大小后写入临时文件
+    :param allowed_types: 允许的文件Content-Type，为空则不限制
+    :return:
+    """
+    content_length = request.content_length
+    stream = request.stream
+    if max_bytes:
+        if content_length is None:
+            stream = LimitedReader(stream, max_bytes)
+        elif content_length > max_bytes:
+            raise PayloadTooLarge(f'body exceeds {max_bytes} bytes')
+
+    def stream_factory(total_content_length, content_type, filename,
+                       content_length=None):
+        if not is_allowed_type(content_type, allowed_types):
+            raise UnsupportedMediaType(f'"{content_type}" is not allowed')
+        if max_file_bytes and content_length and content_length > max_file_bytes:
+            raise PayloadTooLarge(f'file exceeds {max_file_bytes} bytes')
+        return SpooledUpload(memory_threshold, max_file_bytes)
+
+    parser = FormDataParser(stream_factory,
+                            max_form_memory_size=max_form_bytes,
+                            max_content_length=max_bytes or None)
+    try:
+        _, form, files = parser.parse(stream, request.mimetype, content_length,
+                                      request.mimetype_params)
+    except RequestEntityTooLarge:
+        raise PayloadTooLarge()
+    return form, files
@@ -1,19 +1,90 @@
-from flask import request, current_app, _app_ctx_stack
+import sys
+from time import perf_counter_ns
+from typing import TYPE_CHECKING
+
+from flask import request, _app_ctx_stack
 from flask.views import MethodView
-from marshmallow import Schema
-from marshmallow.exceptions import ValidationError
 
-from flask_apikit.decorators import api_cors, api_response
+from flask_apikit.decorators import api_view
 from flask_apikit.exceptions import ValidateError
+from flask_apikit.metrics import record
+from flask_apikit.settings import current_settings
+from flask_apikit.utils.body import load_json
+
+# marshmallow、批量验证和文件上传在第一次用到时才导入，减少冷启动时间
+if TYPE_CHECKING:
+    from marshmallow import Schema
+
+# 请求级缓存在WSGI environ中的key，随请求结束一起释放
+REQUEST_CACHE_KEY = 'flask_apikit.cache'
+
+
+def _is_schema(schema) -> bool:
+    """是否为marshmallow的Schema实例，marshmallow还没有被导入时不可能是"""
+    marshmallow = sys.modules.get('marshmallow')
+    return marshmallow is not None and isinstance(schema, marshmallow.Schema)
+
+
+def _request_cache() -> dict:
+    """获取当前请求的缓存字典"""
+    return request.environ.setdefault(REQUEST_CACHE_KEY, {})
+
+
+def _parsers_key(parsers: dict):
+    """将parsers转为可哈希的key，无法哈希时返回None（不缓存）"""
+    if not parsers:
+        return ()
+    try:
+        return frozenset(
+            (key, tuple(parser) if isinstance(parser, list) else parser)
+            for key, parser in parsers.items())
+    except TypeError:
+        return None
 
 
 class APIView(MethodView):
-    decorators = [api_response, api_cors]
+    # api_view在一层调用中完成api_response与api_cors的处理
+    decorators = [api_view]
     # 关闭View中Flask对OPTIONS请求的默认处理
     # （以防add_url_rule时methods忘记加'OPTIONS'，OPTIONS请求被Flask的dispatch_request处理）
     provide_automatic_options = False
+    # 在同一请求内缓存get_json/get_query的结果，重复调用时直接返回
+    # 注意：重复调用返回的是同一个对象，修改返回值会影响之后的调用
+    memoize_request_data = True
+    # get_json读取请求体的最大字节数/json最大嵌套深度，为None则使用插件配置的值，为0则不限制
+    max_json_bytes = None
+    max_json_depth = None
+
+    @classmethod
+    def warmup(cls, app):
+        """
+        由APIKit.warmup()对每个注册了路由的APIView子类调用一次
+        可以在子类中预先创建schema实例、解析器等，使其在fork前生成并在worker间共享
+
+        :param app: Flask app
+        """
+        pass
+
+    def _memoize(self, key, context, additional_data, loader):
+        """
+        在请求级缓存中查找key对应的结果，没有则调用loader生成并缓存
 
-    def verify_data(self, data: dict, schema: Schema,
+        context和additional_data不要求可哈希，按相等性比较，任一不同都视为新的结果
+        """
+        if not self.memoize_request_data or key is None:
+            return loader()
+        entries = _request_cache().setdefault(key, [])
+        for entry_context, entry_additional_data, result in entries:
+            if entry_context == context and entry_additional_data == additional_data:
+                return result
+        result = loader()
+        # 保存副本，以防调用方之后修改了传入的字典
+        entries.append((dict(context) if context else context,
+                        dict(additional_data) if additional_data else additional_data,
+                        result))
+        return result
+
+    def verify_data(self, data: dict, schema: 'Schema',
                     context: dict = None) -> dict:
         """
         使用schema实例验证数据，有错误时抛出ValidateError
@@ -23,6 +94,8 @@ class APIView(MethodView):
         :param dict context: 传递给schema使用的额外数据，保存在schema的context属性中
         :return:
         """
+        from marshmallow.exceptions import ValidationError
+        start = perf_counter_ns()
         # 传递给schema使用的额外数据
         if context:
             schema.context = context
@@ -33,10 +106,50 @@ class APIView(MethodView):
             for key in e.messages.keys():
                 e.messages[key] = list(set(e.messages[key]))
             raise ValidateError(e.messages, replace=True)
+        finally:
+            record('validate', start)
         return data
 
+    def verify_many(self,
+                    data: list,
+                    schema: 'Schema',
+                    context: dict = None,
+                    chunk_size: int = None,
+                    max_errors: int = None) -> tuple:
+        """
+        分批验证列表数据，不会因为部分数据错误而整体失败
+        数据量较大时可以通过APIKIT_BULK_EXECUTOR交给进程池并行验证
+
+        :param list data: 需要验证的数据列表
+        :param Schema schema: schema实例
+        :param dict context: 传递给schema使用的额外数据，保存在schema的context属性中
+        :param int chunk_size: 每批验证的数量（为None则使用插件配置的值）
+        :param int max_errors: 最多返回的错误个数，为0则不限制（为None则使用插件配置的值）
+        :return: (验证通过的数据列表, {下标: 错误信息})
+        """
+        from flask_apikit.utils.bulk import load_many
+        if not isinstance(data, list):
+            raise ValidateError({'_schema': ['Invalid input type.']}, replace=True)
+        settings = current_settings()
+        if chunk_size is None:
+            chunk_size = settings.bulk_chunk_size
+        if max_errors is None:
+            max_errors = settings.bulk_max_errors
+        start = perf_counter_ns()
+        try:
+            return load_many(
+                data,
+                schema,
+                context,
+                chunk_size=chunk_size,
+                max_errors=max_errors,
+                executor=settings.bulk_executor,
+                offload_min_items=settings.bulk_offload_min_items)
+        finally:
+            record('validate', start)
+
     def get_json(self,
-                 schema: Schema = None,
+                 schema: 'Schema' = None,
                  context: dict = None,
                  additional_data: dict = None,
                  *args,
@@ -54,13 +167,25 @@ class APIView(MethodView):
             marshmallow可以同时支持key为'user_name'或'userName'的传入数据
             但如果两者都有，此时优先级 'user_name'>'userName'，其会优先读取字典中'user_name'进行验证，而抛弃'userName'的值
             所以如果目的是覆盖request.get_json()获取的数据，为安全性，应该使用字段名作为key，而不是load_from别名
-        :param args: 传给request.get_json(*args, **kwargs)
-        :param kwargs: 传给request.get_json(*args, **kwargs)
+        :param args: 与request.get_json(*args, **kwargs)相同（force/silent/cache）
+        :param kwargs: 与request.get_json(*args, **kwargs)相同（force/silent/cache）
         :rtype: dict
         :return:
         """
+        if not _is_schema(schema):
+            schema = context = None
+        raw_key = ('json', args, tuple(sorted(kwargs.items())))
+        return self._memoize(
+            raw_key + (schema, ), context, additional_data,
+            lambda: self._load_json(raw_key, schema, context, additional_data,
+                                    *args, **kwargs))
+
+    def _load_json(self, raw_key, schema, context, additional_data, *args,
+                   **kwargs) -> dict:
+        """get_json的实际处理，原始json数据同样按请求缓存"""
         # 从request获取json
-        json_data = request.get_json(*args, **kwargs)
+        json_data = self._memoize(raw_key, None, None,
+                                  lambda: self._read_json(*args, **kwargs))
         # json_data为None,转为空字典
         if json_data is None:
             json_data = {}
@@ -68,16 +193,36 @@ class APIView(MethodView):
         if additional_data:
             json_data = {**json_data, **additional_data}
         # 给了验证器,则进行验证
-        if isinstance(schema, Schema):
+        if schema is not None:
             data = self.verify_data(json_data, schema, context)
         # 没有验证器,直接返回
         else:
             data = json_data
         return data
 
+    def _read_json(self, *args, **kwargs):
+        """在大小/深度限制下从request读取json"""
+        settings = current_settings()
+        max_bytes = self.max_json_bytes
+        if max_bytes is None:
+            max_bytes = settings.max_json_bytes
+        max_depth = self.max_json_depth
+        if max_depth is None:
+            max_depth = settings.max_json_depth
+        start = perf_counter_ns()
+        try:
+            return load_json(max_bytes,
+                             max_depth,
+                             *args,
+                             decoder=settings.json_decoder,
+                             zero_copy=settings.json_zero_copy,
+                             **kwargs)
+        finally:
+            record('parse', start)
+
     def get_query(self,
                   parsers: dict = None,
-                  schema: Schema = None,
+                  schema: 'Schema' = None,
                   context: dict = None,
                   additional_data: dict = None) -> dict:
         """
@@ -103,6 +248,107 @@ class APIView(MethodView):
         :rtype: dict
         :return:
         """
+        if not _is_schema(schema):
+            schema = context = None
+        parsers_key = _parsers_key(parsers)
+        raw_key = None if parsers_key is None else ('query', parsers_key)
+        return self._memoize(
+            None if raw_key is None else raw_key + (schema, ), context,
+            additional_data, lambda: self._load_query(
+                raw_key, parsers, schema, context, additional_data))
+
+    def _load_query(self, raw_key, parsers, schema, context,
+                    additional_data) -> dict:
+        """get_query的实际处理，解析后的query数据同样按请求缓存"""
+        query_data = self._memoize(raw_key, None, None,
+                                   lambda: self._parse_query(parsers))
+        # 将附加的数据附加到query_data
+        if additional_data:
+            query_data = {**query_data, **additional_data}
+        # 给了验证器,则进行验证
+        if schema is not None:
+            data = self.verify_data(query_data, schema, context)
+        # 没有验证器,直接返回
+        else:
+            data = query_data
+        return data
+
+    def get_files(self,
+                  schema: 'Schema' = None,
+                  context: dict = None,
+                  additional_data: dict = None,
+                  max_file_bytes: int = None,
+                  allowed_types: list = None) -> tuple:
+        """
+        从multipart/form-data请求中流式获取表单数据和文件，返回(data, files)
+        文件超过APIKIT_UPLOAD_MEMORY_THRESHOLD后写入临时文件，大小/类型在读取过程中检查
+        表单数据与get_json一样可以使用一个验证器进行数据验证
+
+        注意：会直接读取请求体，同一请求中不要再使用request.form/request.files；
+        请求体只解析一次，同一请求中再次调用时max_file_bytes/allowed_types需与第一次相同
+
+        :param Schema schema: schema实例，使用marshmallow验证表单数据
+        :param dict context: 传递给schema使用的额外数据，保存在schema的context属性中
+        :param dict additional_data: 用于从url/args中获取的数据,将覆盖表单数据
+        :param int max_file_bytes: 单个文件的最大字节数，为0则不限制（为None则使用插件配置的值）
+        :param list allowed_types: 允许的文件Content-Type，如['image/*']（为None则使用插件配置的值）
+        :return: (表单数据字典, 以字段名为key的FileStorage MultiDict)
+        """
+        if not _is_schema(schema):
+            schema = context = None
+        settings = current_settings()
+        if max_file_bytes is None:
+            max_file_bytes = settings.upload_max_file_bytes
+        if allowed_types is None:
+            allowed_types = settings.upload_allowed_types
+        limits = (max_file_bytes, tuple(allowed_types or ()))
+        parsed_limits, (form, files) = self._memoize(
+            ('files', ), None, None,
+            lambda: (limits, self._parse_files(max_file_bytes, allowed_types)))
+        # 已按其它限制解析过的文件没有经过本次的检查
+        if parsed_limits != limits:
+            raise RuntimeError('get_files() was already called with different '
+                               'max_file_bytes/allowed_types in this request')
+        data = self._memoize(
+            ('form', schema), context, additional_data,
+            lambda: self._load_form(form, schema, context, additional_data))
+        return data, files
+
+    @staticmethod
+    def _parse_files(max_file_bytes: int = None, allowed_types: list = None) -> tuple:
+        """get_files的实际处理，在上传限制下解析请求体"""
+        from flask_apikit.utils.upload import parse_multipart
+        settings = current_settings()
+        if max_file_bytes is None:
+            max_file_bytes = settings.upload_max_file_bytes
+        if allowed_types is None:
+            allowed_types = settings.upload_allowed_types
+        start = perf_counter_ns()
+        try:
+            return parse_multipart(
+                max_bytes=settings.upload_max_bytes,
+                max_file_bytes=max_file_bytes,
+                max_form_bytes=settings.upload_max_form_bytes,
+                memory_threshold=settings.upload_memory_threshold,
+                allowed_types=allowed_types)
+        finally:
+            record('parse', start)
+
+    def _load_form(self, form, schema, context, additional_data) -> dict:
+        """将表单数据转为字典并验证"""
+        form_data = form.to_dict()
+        # 将附加的数据附加到form_data
+        if additional_data:
+            form_data = {**form_data, **additional_data}
+        # 给了验证器,则进行验证
+        if schema is not None:
+            return self.verify_data(form_data, schema, context)
+        return form_data
+
+    @staticmethod
+    def _parse_query(parsers: dict = None) -> dict:
+        """使用parsers解析request.args"""
+        start = perf_counter_ns()
         # 从request获取args
         query_data = request.args.to_dict(flat=False)
         for key in query_data:
@@ -122,13 +368,5 @@ class APIView(MethodView):
             # 没有提供处理器，将值设为列表中第一个字符串
             else:
                 query_data[key] = query_data[key][0]
-        # 将附加的数据附加到query_data
-        if additional_data:
-            query_data = {**query_data, **additional_data}
-        # 给了验证器,则进行验证
-        if isinstance(schema, Schema):
-            data = self.verify_data(query_data, schema, context)
-        # 没有验证器,直接返回
-        else:
-            data = query_data
-        return data
+        record('parse', start)
+        return query_data
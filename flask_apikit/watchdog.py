@@ -0,0 +1,145 @@
+import itertools
+import logging
+import os
+import sys
+import threading
+import traceback
+from time import monotonic
+
+logger = logging.getLogger('flask_apikit.watchdog')
+
+# 正在处理的请求 {id: (开始时间, endpoint, 线程id)}，为None表示没有开启watchdog
+# api_view进入时插入、返回时删除
+inflight = None
+# 生成inflight的key
+ids = itertools.count()
+# 当前进程的Watchdog
+_watchdog = None
+_lock = threading.Lock()
+
+
+class Watchdog(threading.Thread):
+    """
+    定期检查正在处理的请求，超出耗时预算时记录该线程的调用栈
+    每个请求只记录一次，每分钟最多记录max_reports次
+    """
+    def __init__(self,
+                 requests: dict,
+                 budget: float = 5.0,
+                 budgets: dict = None,
+                 interval: float = 1.0,
+                 max_reports: int = 10):
+        """
+        :param requests: 正在处理的请求，见inflight
+        :param budget: 默认的耗时预算（秒），为0则不检查
+        :param budgets: {endpoint: 耗时预算}
+        :param interval: 检查间隔（秒）
+        :param max_reports: 每分钟最多记录的次数
+        """
+        super().__init__(name='apikit-watchdog', daemon=True)
+        self.requests = requests
+        self.budget = budget
+        self.budgets = dict(budgets or {})
+        self.interval = interval
+        self.max_reports = max_reports
+        self.stopped = threading.Event()
+        self._reported = set()
+        self._report_times = []
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception('watchdog check failed')
+
+    def stop(self):
+        self.stopped.set()
+
+    def _allow_report(self, now: float) -> bool:
+        """限制每分钟的记录次数"""
+        self._report_times = [t for t in self._report_times if now - t < 60]
+        if len(self._report_times) >= self.max_reports:
+            return False
+        self._report_times.append(now)
+        return True
+
+    def check(self) -> list:
+        """检查一次，返回本次记录的[(endpoint, 已耗时, 调用栈)]"""
+        now = monotonic()
+        requests = list(self.requests.items())
+        # 只保留仍在处理中的请求的记录状态
+        self._reported &= {key for key, _ in requests}
+        reports = []
+        frames = None
+        for key, (start, endpoint, ident) in requests:
+            budget = self.budgets.get(endpoint, self.budget)
+            elapsed = now - start
+            if not budget or elapsed <= budget or key in self._reported:
+                continue
+            if not self._allow_report(now):
+                break
+            self._reported.add(key)
+            if frames is None:
+                frames = sys._current_frames()
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = ''.join(traceback.format_stack(frame))
+            logger.warning('request to %s exceeded %.3fs budget (%.3fs elapsed) on thread %s:\n%s',
+                           endpoint, budget, elapsed, ident, stack)
+            reports.append((endpoint, elapsed, stack))
+        return reports
+
+
+def start_watchdog(budget: float = 5.0,
+                   budgets: dict = None,
+                   interval: float = 1.0,
+                   max_reports: int = 10) -> Watchdog:
+    """开启当前进程的watchdog；已开启时只更新耗时预算"""
+    global inflight, _watchdog
+    with _lock:
+        if _watchdog is None or not _watchdog.is_alive():
+            inflight = {}
+            _watchdog = Watchdog(inflight, budget, budgets, interval, max_reports)
+            _watchdog.start()
+        else:
+            _watchdog.budget = budget
+            _watchdog.budgets.update(budgets or {})
+        return _watchdog
+
+
+def stop_watchdog():
+    """关闭当前进程的watchdog"""
+    global inflight, _watchdog
+    with _lock:
+        if _watchdog is not None:
+            _watchdog.stop()
+        inflight = _watchdog = None
+
+
+def _after_fork():
+    # fork出的子进程中没有父进程的watchdog线程（如在init_app之后fork的prefork/--preload部署），
+    # 使用相同的预算重新启动，否则inflight仍会记录请求但不再检查
+    global inflight, _watchdog, _lock
+    _lock = threading.Lock()
+    parent = _watchdog
+    if parent is not None and not parent.stopped.is_set():
+        inflight = {}
+        _watchdog = Watchdog(inflight, parent.budget, parent.budgets, parent.interval,
+                             parent.max_reports)
+        _watchdog.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def init_watchdog(app):
+    """开启APIKIT_WATCHDOG_ENABLED时启动watchdog线程"""
+    if not app.config['APIKIT_WATCHDOG_ENABLED']:
+        return
+    start_watchdog(budget=app.config['APIKIT_WATCHDOG_BUDGET'],
+                   budgets=app.config['APIKIT_WATCHDOG_BUDGETS'],
+                   interval=app.config['APIKIT_WATCHDOG_INTERVAL'],
+                   max_reports=app.config['APIKIT_WATCHDOG_MAX_REPORTS'])
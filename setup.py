@@ -16,12 +16,15 @@ setup(
     author_email='kozzzx@qq.com',
     description='Build Restful API with Flask Quickly.',
     long_description=__doc__,
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
     zip_safe=False,
     platforms='any',
     install_requires=[
         'Flask>=1.0', 'marshmallow==3.0.0b20'
     ],
+    extras_require={
+        'orjson': ['orjson']
+    },
     classifiers=[
         'Environment :: Web Environment',
         'Intended Audience :: Developers',
@@ -6,15 +6,36 @@ from flask_apikit import APIKit
 
 
 class AppTestCase(TestCase):
+    # 初始化插件前合并到app.config的配置，子类可以覆盖
+    # 需要在setUp中生成的配置（如临时目录）可以在调用super().setUp()前赋值给self.config
+    config = {}
+
     def setUp(self):
-        self.app = Flask(__name__)
-        self.app.config['SERVER_NAME'] = 'test'
+        # 初始化Flask-APIKit插件
+        self.apikit = APIKit()
+        self.app = self.create_app(self.apikit)
         self.app_context = self.app.app_context()
         self.app_context.push()
         self.client = self.app.test_client(use_cookies=True)
-        # 初始化Flask-APIKit插件
-        self.apikit = APIKit()
-        self.apikit.init_app(self.app)
+
+    def create_app(self, apikit: APIKit = None, **config) -> Flask:
+        """
+        创建app，依次合并self.config和config后初始化Flask-APIKit插件，再调用setup_app
+
+        :param apikit: 使用的APIKit对象，为None则新建一个
+        :param config: 只用于这个app的配置
+        :return:
+        """
+        app = Flask(__name__)
+        app.config['SERVER_NAME'] = 'test'
+        app.config.update(self.config)
+        app.config.update(config)
+        (apikit or APIKit()).init_app(app)
+        self.setup_app(app)
+        return app
+
+    def setup_app(self, app: Flask):
+        """在create_app创建的app中注册视图，子类可以覆盖"""
 
     def open(self, *args, **kwargs):
         # 查看是否指定client
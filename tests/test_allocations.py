@@ -0,0 +1,132 @@
+import gc
+import sys
+import tracemalloc
+import unittest
+from io import BytesIO
+
+from flask import Flask
+from marshmallow import Schema, fields
+from werkzeug.test import EnvironBuilder
+
+from flask_apikit import APIKit
+from flask_apikit.exceptions import APIError
+from flask_apikit.responses import Pagination
+from flask_apikit.views import APIView
+
+# 每个场景的内存预算：(单次请求tracemalloc记录的内存峰值（字节）, 请求1000次后增加的内存块个数)
+# 峰值按CPython 3.11、Flask 2.0的实测值留出约25%的余量；内存块个数因gc和缓存有约100的波动
+# 修改热点路径导致超出预算时，确认是预期的变化后再更新此处
+BUDGETS = {
+    'pagination': (14000, 200),
+    'schema': (15000, 200),
+    'preflight': (13500, 200),
+    'error': (9500, 200),
+}
+ORIGIN = 'https://example.com'
+
+
+class UserSchema(Schema):
+    name = fields.Str(required=True)
+    age = fields.Int()
+
+
+class NotFound(APIError):
+    status_code = 404
+    code = 404
+    message = 'Not Found'
+
+
+class Users(APIView):
+    def get(self):
+        return Pagination().set_data([{'id': i} for i in range(10)], 95)
+
+    def post(self):
+        return self.get_json(UserSchema()), 201
+
+
+class Missing(APIView):
+    def get(self):
+        raise NotFound('user 1')
+
+
+def make_app() -> Flask:
+    app = Flask(__name__)
+    APIKit(app)
+    app.add_url_rule('/users', methods=['GET', 'POST', 'OPTIONS'], view_func=Users.as_view('users'))
+    app.add_url_rule('/missing', view_func=Missing.as_view('missing'))
+    return app
+
+
+SCENARIOS = {
+    'pagination': dict(path='/users?page=2&limit=10', headers={'Origin': ORIGIN}),
+    'schema': dict(path='/users', method='POST', json={'name': 'apikit', 'age': 3},
+                   headers={'Origin': ORIGIN}),
+    'preflight': dict(path='/users', method='OPTIONS',
+                      headers={'Origin': ORIGIN, 'Access-Control-Request-Method': 'POST'}),
+    'error': dict(path='/missing', headers={'Origin': ORIGIN}),
+}
+
+
+def make_request(app: Flask, **kwargs):
+    """返回直接调用WSGI app的函数，不含测试客户端的内存分配"""
+    builder = EnvironBuilder(**kwargs)
+    environ = builder.get_environ()
+    body = builder.input_stream.read() if builder.input_stream is not None else b''
+    builder.close()
+    # 最后一次请求的状态
+    status = {}
+
+    def start_response(s, headers, exc_info=None):
+        status['status'] = s
+
+    def request():
+        env = environ.copy()
+        env['wsgi.input'] = BytesIO(body)
+        app_iter = app.wsgi_app(env, start_response)
+        try:
+            return b''.join(app_iter)
+        finally:
+            app_iter.close()
+
+    return request, status
+
+
+def measure(request, number: int = 1000) -> tuple:
+    """返回(单次请求内存峰值的最大值, 请求number次后增加的内存块个数)"""
+    # 预热：填充各种缓存、完成延迟导入
+    for _ in range(10):
+        request()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        peak = 0
+        for _ in range(5):
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+            request()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - start)
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    for _ in range(number):
+        request()
+    gc.collect()
+    return peak, sys.getallocatedblocks() - blocks
+
+
+@unittest.skipIf(tracemalloc.is_tracing(), 'tracemalloc is already tracing')
+@unittest.skipUnless(hasattr(tracemalloc, 'reset_peak'), 'requires Python 3.9+')
+class AllocationTestCase(unittest.TestCase):
+    """测试各场景每次请求的内存分配不超出预算"""
+
+    def test_budgets(self):
+        app = make_app()
+        for name, kwargs in SCENARIOS.items():
+            with self.subTest(name):
+                request, status = make_request(app, **kwargs)
+                peak, retained = measure(request)
+                self.assertLess(int(status['status'].split()[0]), 500)
+                peak_budget, retained_budget = BUDGETS[name]
+                self.assertLessEqual(peak, peak_budget, f'{name}: peak {peak} bytes')
+                self.assertLessEqual(retained, retained_budget, f'{name}: retained {retained} blocks')
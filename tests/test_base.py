@@ -1,5 +1,6 @@
 from flask import url_for
 
+from flask_apikit.decorators import api_cors, api_response, api_view
 from flask_apikit.exceptions import APIError
 from flask_apikit.responses import Pagination, APIResponse
 from flask_apikit.views import APIView
@@ -583,3 +584,190 @@ class BaseTestCase(AppTestCase):
         self.assertEqual(
             '*',
             headers.get('Access-Control-Allow-Origin'))  # 不会覆盖掉api_cors处理的头
+
+    def test_api_view_same_as_stacked_decorators(self):
+        """测试api_view与[api_response, api_cors]的结果相同"""
+
+        class MyError(APIError):
+            status_code = 403
+            headers = {'XXX': 'x'}
+
+        results = [
+            None, 'hi', ('hi', 511), ('hi', {'XXX': 'x'}), {'hi': 1}, [1, 2],
+            ({'hi': 1}, 511, [('XXX', 'x')]),
+            APIResponse({'hi': 1}, 511, {'XXX': 'x'}),
+            MyError
+        ]
+
+        for i, result in enumerate(results):
+            def view():
+                if result is MyError:
+                    raise MyError('message')
+                return result
+
+            self.app.add_url_rule(f'/stacked/{i}', f'stacked{i}', api_cors(api_response(view)),
+                                  methods=['GET', 'OPTIONS'])
+            self.app.add_url_rule(f'/fused/{i}', f'fused{i}', api_view(view),
+                                  methods=['GET', 'OPTIONS'])
+            for method in (self.get, self.options):
+                for headers in ({'Origin': 'https://example.com'}, {}):
+                    with self.subTest(result=result, method=method.__name__, headers=headers):
+                        stacked = method(url_for(f'stacked{i}'), headers=dict(headers))
+                        fused = method(url_for(f'fused{i}'), headers=dict(headers))
+                        self.assertEqual(stacked[0], fused[0])
+                        self.assertEqual(stacked[2], fused[2])
+                        self.assertEqual(sorted(stacked[1].items()), sorted(fused[1].items()))
+
+    def test_error_slots(self):
+        """测试APIError的附加message保存在slot中"""
+        class Err(APIError):
+            code = 1
+            message = 'Need Login'
+
+        e = Err('token expired')
+        self.assertEqual(e.message, 'Need Login: token expired')
+        self.assertEqual(Err('x', replace=True).message, 'x')
+        self.assertEqual(Err().message, 'Need Login')
+        self.assertEqual(vars(e), {})
+
+    def test_error_body_cache_threads(self):
+        """测试多个线程同时写入错误响应体缓存"""
+        import threading
+        from flask_apikit.exceptions import ERROR_CACHE_KEY
+
+        self.app.config['APIKIT_ERROR_CACHE_SIZE'] = 4
+        self.apikit.reload_config()
+        failures = []
+
+        def run(n):
+            with self.app.app_context():
+                for i in range(200):
+                    try:
+                        APIError(f'{n}-{i}').to_response()
+                    except Exception as e:
+                        failures.append(e)
+
+        threads = [threading.Thread(target=run, args=(n, )) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
+        self.assertLessEqual(len(self.app.extensions[ERROR_CACHE_KEY]), 4)
+
+    def test_error_body_cache(self):
+        """测试APIError响应体缓存"""
+        from flask_apikit.exceptions import ERROR_CACHE_KEY, ValidateError
+
+        class Err(APIError):
+            status_code = 401
+            message = 'Need Login'
+            headers = {'XXX': 'x'}
+
+        class Ret(APIView):
+            def get(self, name):
+                if name == 'validate':
+                    raise ValidateError({'name': ['error']}, replace=True)
+                raise Err(name if name != 'default' else None)
+
+        self.app.config['APIKIT_ERROR_CACHE_SIZE'] = 2
+        self.apikit.reload_config()
+        self.app.add_url_rule('/<name>', methods=['GET'], view_func=Ret.as_view('ret'))
+        for _ in range(2):
+            data, headers, status_code = self.get(url_for('ret', name='default'))
+            self.assertEqual(status_code, 401)
+            self.assertEqual(data, {'error': 'Err', 'code': 1, 'message': 'Need Login'})
+            self.assertEqual(headers.get('XXX'), 'x')
+            self.assertEqual(headers.get('Content-Type'), 'application/json')
+            self.assertEqual('*', headers.get('Access-Control-Allow-Origin'))
+        cache = self.app.extensions[ERROR_CACHE_KEY]
+        self.assertEqual(len(cache), 1)
+        # 缓存的响应头不会被CORS修改
+        self.assertNotIn('Access-Control-Allow-Origin', dict(list(cache.values())[0][1]))
+        # 不同的message分别缓存，超出大小时丢弃最早的
+        self.get(url_for('ret', name='a'))
+        self.get(url_for('ret', name='b'))
+        self.assertEqual(len(cache), 2)
+        data, headers, status_code = self.get(url_for('ret', name='b'))
+        self.assertEqual(data['message'], 'Need Login: b')
+        # 动态的message不缓存
+        data, headers, status_code = self.get(url_for('ret', name='validate'))
+        self.assertEqual(data['message'], {'name': ['error']})
+        self.assertEqual(len(cache), 2)
+        # 缓存大小为0时不缓存
+        cache.clear()
+        self.app.config['APIKIT_ERROR_CACHE_SIZE'] = 0
+        self.apikit.reload_config()
+        data, headers, status_code = self.get(url_for('ret', name='default'))
+        self.assertEqual(status_code, 401)
+        self.assertEqual(data['message'], 'Need Login')
+        self.assertEqual(len(self.app.extensions.get(ERROR_CACHE_KEY, {})), 0)
+
+    def test_return_error_instance(self):
+        """测试直接返回APIError实例（不抛出）"""
+
+        class Err(APIError):
+            status_code = 403
+            code = 1000
+            message = 'hi'
+
+        need_login = Err()
+
+        class Ret(APIView):
+            def get(self, name):
+                if name == 'raise':
+                    raise Err('detail')
+                if name == 'singleton':
+                    return need_login
+                return Err('detail')
+
+        self.app.add_url_rule('/<name>', methods=['GET'], view_func=Ret.as_view('ret'))
+        raised = self.get(url_for('ret', name='raise'))
+        returned = self.get(url_for('ret', name='return'))
+        self.assertEqual(raised[0], returned[0])
+        self.assertEqual(raised[2], returned[2])
+        self.assertEqual(returned[0], {'error': 'Err', 'code': 1000, 'message': 'hi: detail'})
+        for _ in range(2):
+            data, headers, status_code = self.get(url_for('ret', name='singleton'))
+            self.assertEqual(status_code, 403)
+            self.assertEqual(data['message'], 'hi')
+            self.assertEqual('*', headers.get('Access-Control-Allow-Origin'))
+
+    def test_error_message_lazy_format(self):
+        """测试附加message在读取时才格式化"""
+
+        class Err(APIError):
+            message = 'hi'
+
+        e = Err('detail')
+        self.assertNotIn('message', e.__dict__)
+        self.assertEqual(Err.message, 'hi')
+        self.assertEqual(e.message, 'hi: detail')
+        self.assertEqual(Err('detail', replace=True).message, 'detail')
+        self.assertEqual(Err().message, 'hi')
+        e.message = 'other'
+        self.assertEqual(e.message, 'other')
+
+    def test_error_handler_without_api_view(self):
+        """测试没有使用api_view的路由和蓝本抛出APIError"""
+        from flask import Blueprint
+
+        class Err(APIError):
+            status_code = 403
+            message = 'hi'
+
+        def view():
+            raise Err
+
+        blueprint = Blueprint('bp', __name__)
+        blueprint.add_url_rule('/bp', 'view', view)
+        self.app.register_blueprint(blueprint)
+        self.app.add_url_rule('/plain', 'plain', view)
+        for endpoint in ('plain', 'bp.view'):
+            data, headers, status_code = self.get(url_for(endpoint))
+            self.assertEqual(status_code, 403)
+            self.assertEqual(data, {'error': 'Err', 'code': 1, 'message': 'hi'})
+            self.assertEqual('*', headers.get('Access-Control-Allow-Origin'))
+            data, headers, status_code = self.get(url_for(endpoint), headers={})
+            self.assertEqual(status_code, 403)
+            self.assertNotIn('Access-Control-Allow-Origin', headers)
@@ -0,0 +1,155 @@
+import base64
+import threading
+
+from flask import Flask, Response, request
+
+from flask_apikit import APIKit
+from flask_apikit.batch import BATCH_EXECUTOR_KEY
+from flask_apikit.exceptions import APIError
+from flask_apikit.views import APIView
+from tests import AppTestCase
+
+
+class NotFound(APIError):
+    status_code = 404
+    code = 404
+    message = 'Not Found'
+
+
+class BatchTestCase(AppTestCase):
+    config = {'APIKIT_BATCH_ENABLED': True}
+
+    def setUp(self):
+        self.calls = []
+        self.barrier = threading.Barrier(2, timeout=5)
+        self.release = threading.Event()
+        super().setUp()
+
+    def setup_app(self, app):
+        executor = app.extensions.get(BATCH_EXECUTOR_KEY)
+        if executor is not None:
+            self.addCleanup(executor.shutdown)
+        # 先结束还在执行的子请求，再关闭线程池
+        self.addCleanup(self.release.set)
+        calls, barrier, release = self.calls, self.barrier, self.release
+
+        class Users(APIView):
+            def get(self, id=None):
+                calls.append(('GET', id))
+                if id is None:
+                    return self.get_query({'page': int})
+                if id == 404:
+                    raise NotFound
+                return {'id': id, 'auth': request.headers.get('Authorization'),
+                        'lang': request.headers.get('Accept-Language')}
+
+            def post(self):
+                calls.append(('POST', None))
+                return self.get_json(), 201
+
+        class Parallel(APIView):
+            def get(self):
+                barrier.wait()
+                return {}
+
+        class Download(APIView):
+            def get(self):
+                return Response(b'\xff\x00', mimetype='application/octet-stream')
+
+        class Slow(APIView):
+            def get(self):
+                release.wait(5)
+                return {}
+
+        app.add_url_rule('/users', methods=['GET', 'POST'], view_func=Users.as_view('users'))
+        app.add_url_rule('/users/<int:id>', view_func=Users.as_view('user'))
+        app.add_url_rule('/parallel', view_func=Parallel.as_view('parallel'))
+        app.add_url_rule('/slow', view_func=Slow.as_view('slow'))
+        app.add_url_rule('/download', view_func=Download.as_view('download'))
+
+    def batch(self, items, **kwargs):
+        return self.post('/batch', json=items, **kwargs)
+
+    def test_batch(self):
+        """测试按顺序返回每个子请求的结果"""
+        data, headers, status_code = self.batch([
+            {'path': '/users', 'query': {'page': '2'}},
+            {'method': 'post', 'path': '/users', 'body': {'name': 'apikit'}},
+            {'path': '/users/1', 'headers': {'Accept-Language': 'zh'}},
+            {'path': '/users/404'},
+            {'path': '/missing?x=1'},
+        ], headers={'Origin': 'https://example.com', 'Authorization': 'Bearer t'})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(headers['Access-Control-Allow-Origin'], '*')
+        self.assertEqual([r['status'] for r in data], [200, 201, 200, 404, 404])
+        self.assertEqual(data[0]['body'], {'page': 2})
+        self.assertEqual(data[1]['body'], {'name': 'apikit'})
+        # 继承批量请求的请求头，但不含Origin
+        self.assertEqual(data[2]['body'], {'id': 1, 'auth': 'Bearer t', 'lang': 'zh'})
+        self.assertEqual(data[2]['headers']['Content-Type'], 'application/json')
+        self.assertNotIn('Access-Control-Allow-Origin', data[2]['headers'])
+        self.assertEqual(data[3]['body'], {'error': 'NotFound', 'code': 404, 'message': 'Not Found'})
+        self.assertIn('Not Found', data[4]['body'])
+        self.assertNotIn('encoding', data[4])
+        # POST等待之前的GET完成后执行
+        self.assertEqual(self.calls[:2], [('GET', None), ('POST', None)])
+
+    def test_binary(self):
+        """测试不是UTF-8文本的响应体使用base64编码"""
+        data, headers, status_code = self.batch([{'path': '/download'}])
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data[0]['status'], 200)
+        self.assertEqual(data[0]['encoding'], 'base64')
+        self.assertEqual(base64.b64decode(data[0]['body']), b'\xff\x00')
+
+    def test_concurrent(self):
+        """测试连续的GET子请求并发执行"""
+        data, headers, status_code = self.batch([{'path': '/parallel'}, {'path': '/parallel'}])
+        self.assertEqual([r['status'] for r in data], [200, 200])
+
+    def test_sequential(self):
+        """测试APIKIT_BATCH_WORKERS为0时按顺序执行"""
+        app = self.create_app(APIKIT_BATCH_WORKERS=0)
+        self.client = app.test_client()
+        self.assertNotIn(BATCH_EXECUTOR_KEY, app.extensions)
+        data, headers, status_code = self.batch([{'path': '/users/2'}, {'path': '/users/3'}])
+        self.assertEqual([r['body']['id'] for r in data], [2, 3])
+        self.assertEqual(self.calls, [('GET', 2), ('GET', 3)])
+
+    def test_timeout(self):
+        """测试超出APIKIT_BATCH_TIMEOUT的子请求返回504"""
+        self.client = self.create_app(APIKIT_BATCH_TIMEOUT=0.2).test_client()
+        data, headers, status_code = self.batch([
+            {'path': '/users/1'}, {'path': '/slow'}, {'method': 'POST', 'path': '/users'}])
+        self.assertEqual(status_code, 200)
+        self.assertEqual([r['status'] for r in data], [200, 504, 504])
+        self.assertEqual(data[1]['body']['error'], 'BatchTimeout')
+        # 超时后不再执行之后的子请求
+        self.assertNotIn(('POST', None), self.calls)
+
+    def test_limits(self):
+        """测试子请求个数、请求体大小和格式的限制"""
+        self.client = self.create_app(APIKIT_BATCH_MAX_REQUESTS=2, APIKIT_BATCH_MAX_BYTES=200).test_client()
+        data, headers, status_code = self.batch([{'path': '/users'}] * 3)
+        self.assertEqual(status_code, 413)
+        data, headers, status_code = self.batch([{'path': '/users', 'body': 'x' * 200}])
+        self.assertEqual(status_code, 413)
+        data, headers, status_code = self.batch({'path': '/users'})
+        self.assertEqual(status_code, 400)
+        data, headers, status_code = self.batch([
+            {'path': 'users', 'method': 1}, {'path': '/users?page=1', 'query': 'page=2', 'x': 1}])
+        self.assertEqual(status_code, 400)
+        self.assertEqual(data['message'], {
+            '0': {'path': ['Not a valid path.'], 'method': ['Not a valid method.']},
+            '1': {'query': ['Query is already defined in the path.'], 'x': ['Unknown field.']},
+        })
+        self.assertEqual(self.calls, [])
+        # 不能嵌套批量请求
+        data, headers, status_code = self.batch([{'method': 'POST', 'path': '/batch', 'body': []}])
+        self.assertEqual(data[0]['status'], 400)
+
+    def test_disabled(self):
+        """测试默认不注册批量请求的路由"""
+        app = Flask(__name__)
+        APIKit(app)
+        self.assertNotIn('apikit_batch', app.view_functions)
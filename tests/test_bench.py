@@ -0,0 +1,65 @@
+import sys
+import unittest
+
+from flask import Flask
+
+from flask_apikit import APIKit
+from flask_apikit.bench import percentile, run_bench, synthetic_mix
+from flask_apikit.responses import Pagination
+from flask_apikit.views import APIView
+
+
+class Users(APIView):
+    def get(self):
+        return Pagination().set_data([], 0)
+
+    def post(self):
+        return self.get_json(), 201
+
+
+class Broken(APIView):
+    def get(self):
+        raise RuntimeError()
+
+
+def make_app() -> Flask:
+    app = Flask(__name__)
+    APIKit(app)
+    app.add_url_rule('/users', methods=['GET', 'POST', 'OPTIONS'], view_func=Users.as_view('users'))
+    app.add_url_rule('/users/<int:id>', view_func=Users.as_view('user'))
+    app.add_url_rule('/broken', view_func=Broken.as_view('broken'))
+    return app
+
+
+class BenchTestCase(unittest.TestCase):
+    def test_synthetic_mix(self):
+        """测试根据路由生成请求"""
+        mix = synthetic_mix(make_app(), size=30)
+        kinds = {(item['method'], item['path'].split('?')[0]) for item in mix}
+        self.assertEqual(kinds, {('GET', '/users'), ('POST', '/users'), ('OPTIONS', '/users'),
+                                 ('GET', '/broken')})
+        self.assertTrue(all('json' in item for item in mix if item['method'] == 'POST'))
+        self.assertTrue(all('Origin' in item['headers'] for item in mix
+                            if item['method'] == 'OPTIONS'))
+        self.assertTrue(any('page=' in item['path'] for item in mix if item['method'] == 'GET'))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 99), 0.0)
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'requires fork')
+    def test_run_bench(self):
+        """测试压测结果"""
+        mix = [
+            {'method': 'GET', 'path': '/users?page=2', 'headers': {'Origin': 'https://example.com'}},
+            {'method': 'POST', 'path': '/users', 'json': {'name': 'apikit'}},
+            {'method': 'GET', 'path': '/broken'},
+        ]
+        result = run_bench(make_app(), mix, workers=1, clients=1, duration=0.3, warmup=0.05)
+        self.assertGreater(result['requests'], 0)
+        self.assertGreater(result['rps'], 0)
+        self.assertLessEqual(result['p50'], result['p99'])
+        self.assertEqual(set(result['statuses']), {'200', '201', '500'})
+        self.assertAlmostEqual(result['error_rate'], 1 / 3, delta=0.05)
@@ -0,0 +1,22 @@
+import unittest
+from contextlib import ExitStack
+
+from benchmarks.suite import CASES, compare
+
+
+class BenchmarkSuiteTestCase(unittest.TestCase):
+    def test_cases(self):
+        """测试所有用例都可以运行"""
+        for name, setup in CASES.items():
+            with self.subTest(name), ExitStack() as stack:
+                setup(stack)()
+
+    def test_compare(self):
+        """测试超出threshold的用例"""
+        baseline = {'results': {'a': 100.0, 'b': 100.0, 'removed': 1.0}}
+        current = {'results': {'a': 105.0, 'b': 120.0, 'added': 1.0}}
+        rows = {row[0]: row for row in compare(baseline, current, threshold=10)}
+        self.assertEqual(set(rows), {'a', 'b'})
+        self.assertFalse(rows['a'][4])
+        self.assertTrue(rows['b'][4])
+        self.assertAlmostEqual(rows['b'][3], 20.0)
@@ -82,6 +82,7 @@ class CORSTestCase(AppTestCase):
     def test_max_age_none(self):
         """测试不设置MAX_AGE"""
         self.app.config['APIKIT_ACCESS_CONTROL_MAX_AGE'] = None
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -100,6 +101,7 @@ class CORSTestCase(AppTestCase):
     def test_max_age(self):
         """测试MAX_AGE设置"""
         self.app.config['APIKIT_ACCESS_CONTROL_MAX_AGE'] = 1
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -118,6 +120,7 @@ class CORSTestCase(AppTestCase):
     def test_allow_origin_wildcard(self):
         """测试ALLOW_ORIGIN设置为通配符（同时测试了ALLOW_CREDENTIALS的状况）"""
         self.app.config['APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN'] = '*'
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -148,6 +151,7 @@ class CORSTestCase(AppTestCase):
         """测试ALLOW_ORIGIN设置为通配符，同时允许携带证书"""
         self.app.config['APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN'] = '*'
         self.app.config['APIKIT_ACCESS_CONTROL_ALLOW_CREDENTIALS'] = True
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -177,6 +181,7 @@ class CORSTestCase(AppTestCase):
     def test_allow_origin_none(self):
         """测试不设置ALLOW_ORIGIN"""
         self.app.config['APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN'] = None
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -195,6 +200,7 @@ class CORSTestCase(AppTestCase):
     def test_allow_origin_str(self):
         """测试ALLOW_ORIGIN设置为字符串，直接返回"""
         self.app.config['APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN'] = 'https://example.com'
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -238,6 +244,7 @@ class CORSTestCase(AppTestCase):
             'http://1.example.com',
             'https://2.example.com'
         ]
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -296,6 +303,7 @@ class CORSTestCase(AppTestCase):
     def test_allow_headers_none(self):
         """测试不设置ALLOW_HEADERS"""
         self.app.config['APIKIT_ACCESS_CONTROL_ALLOW_HEADERS'] = None
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -314,6 +322,7 @@ class CORSTestCase(AppTestCase):
     def test_allow_headers(self):
         """测试ALLOW_HEADERS设置"""
         self.app.config['APIKIT_ACCESS_CONTROL_ALLOW_HEADERS'] = ['X-Aa', 'X-Ab']
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -335,6 +344,7 @@ class CORSTestCase(AppTestCase):
         self.app.config['APIKIT_PAGINATION_HEADER_LIMIT_KEY'] = 'X-Limit'
         self.app.config['APIKIT_PAGINATION_HEADER_COUNT_KEY'] = 'X-Count'
         self.app.config['APIKIT_PAGINATION_HEADER_PAGE_COUNT_KEY'] = 'X-Page-Count'
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -354,6 +364,7 @@ class CORSTestCase(AppTestCase):
     def test_expose_headers1(self):
         """自定义expose headers为空，自动插入分页expose headers"""
         self.app.config['APIKIT_ACCESS_CONTROL_EXPOSE_HEADERS'] = []
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -369,6 +380,7 @@ class CORSTestCase(AppTestCase):
     def test_expose_headers2(self):
         """自定义expose headers不为空，自动插入分页expose headers"""
         self.app.config['APIKIT_ACCESS_CONTROL_EXPOSE_HEADERS'] = ['X-Ea', 'X-Eb']
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -385,6 +397,7 @@ class CORSTestCase(AppTestCase):
     def test_expose_headers3(self):
         """自定义expose headers为空，不自动插入分页expose headers"""
         self.app.config['APIKIT_ACCESS_CONTROL_EXPOSE_HEADERS'] = []
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -399,6 +412,7 @@ class CORSTestCase(AppTestCase):
     def test_expose_headers4(self):
         """自定义expose headers不为空，不自动插入分页expose headers"""
         self.app.config['APIKIT_ACCESS_CONTROL_EXPOSE_HEADERS'] = ['X-Ea', 'X-Eb']
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -413,6 +427,7 @@ class CORSTestCase(AppTestCase):
     def test_expose_headers5(self):
         """测试Pagination设置了Access-Control-Expose-Headers头，不会被后两者覆盖"""
         self.app.config['APIKIT_ACCESS_CONTROL_EXPOSE_HEADERS'] = ['X-Ea', 'X-Eb']
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -429,6 +444,7 @@ class CORSTestCase(AppTestCase):
     def test_expose_headers6(self):
         """测试APIView设置了Access-Control-Expose-Headers头，不会被APIKIT_ACCESS_CONTROL_EXPOSE_HEADERS覆盖"""
         self.app.config['APIKIT_ACCESS_CONTROL_EXPOSE_HEADERS'] = ['X-Ea', 'X-Eb']
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
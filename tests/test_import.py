@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import unittest
+
+# import flask_apikit（不含flask本身）的耗时预算（微秒），实测约10ms，留出余量以适应较慢的机器
+IMPORT_BUDGET_US = 50000
+# import flask_apikit时不应导入的模块，只在用到相应功能时才导入
+LAZY_MODULES = (
+    'marshmallow', 'tracemalloc', 'cProfile', 'gzip', 'concurrent.futures',
+    'flask_apikit.views', 'flask_apikit.memory', 'flask_apikit.profiling', 'flask_apikit.tracing',
+    'flask_apikit.recording', 'flask_apikit.bench', 'flask_apikit.batch', 'flask_apikit.utils.bulk',
+    'flask_apikit.utils.upload'
+)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code: str, *options) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    return subprocess.run([sys.executable, *options, '-c', code], env=env, cwd=ROOT,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+
+class ImportTestCase(unittest.TestCase):
+    def test_lazy_modules(self):
+        """测试import flask_apikit时不导入可选功能"""
+        # 只看flask_apikit额外导入的模块
+        code = ('import sys, flask; before = set(sys.modules); import flask_apikit; '
+                'print(" ".join(sorted(set(sys.modules) - before)))')
+        modules = set(run_python(code).stdout.split())
+        self.assertIn('flask_apikit.decorators', modules)
+        self.assertEqual([m for m in LAZY_MODULES if m in modules], [])
+
+    def test_lazy_attributes(self):
+        """测试按需导入的属性和子模块"""
+        code = ('import flask_apikit; '
+                'print(flask_apikit.init_tracing.__module__, flask_apikit.views.__name__, '
+                '"Authorization" in flask_apikit.REDACT_HEADERS)')
+        self.assertEqual(run_python(code).stdout.split(),
+                         ['flask_apikit.tracing', 'flask_apikit.views', 'True'])
+
+    def test_import_time(self):
+        """测试import flask_apikit的耗时（python -X importtime）"""
+        # 先导入flask，只计算flask_apikit本身及其额外导入的模块
+        stderr = run_python('import flask; import flask_apikit', '-X', 'importtime').stderr
+        cumulative = None
+        for line in stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            parts = line.split('|')
+            if len(parts) == 3 and parts[2].rstrip() == ' flask_apikit':
+                cumulative = int(parts[1])
+        self.assertIsNotNone(cumulative, stderr)
+        self.assertLessEqual(cumulative, IMPORT_BUDGET_US)
@@ -0,0 +1,94 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+
+from flask_apikit.memory import main, MEMORY_STATS_KEY
+from flask_apikit.views import APIView
+from tests import AppTestCase
+
+LEAK = []
+
+
+class MemoryTestCase(AppTestCase):
+    config = {
+        'APIKIT_MEMORY_ENABLED': True,
+        'APIKIT_MEMORY_SAMPLE_RATE': 1,
+        'APIKIT_METRICS_PATH': '/metrics',
+    }
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(LEAK.clear)
+        self.config = dict(self.config, APIKIT_MEMORY_DUMP=os.path.join(self.tmp.name, 'memory-{pid}.json'))
+        self.entered, self.release = threading.Event(), threading.Event()
+        super().setUp()
+
+    def setup_app(self, app):
+        class Leak(APIView):
+            def get(self):
+                LEAK.append(bytearray(100000))
+                return {'size': len(LEAK)}
+
+        entered, release = self.entered, self.release
+
+        class Wait(APIView):
+            def get(self):
+                entered.set()
+                release.wait(5)
+                return {}
+
+        app.add_url_rule('/leak', methods=['GET'], view_func=Leak.as_view('leak'))
+        app.add_url_rule('/wait', methods=['GET'], view_func=Wait.as_view('wait'))
+
+    def test_stats(self):
+        """测试按endpoint统计未释放的内存"""
+        for _ in range(3):
+            self.client.get('/leak')
+        stats = self.app.extensions[MEMORY_STATS_KEY].to_dict()['endpoints']['leak']
+        self.assertEqual(stats['samples'], 3)
+        self.assertGreaterEqual(stats['size'], 300000)
+        self.assertGreaterEqual(stats['max_peak'], 100000)
+        self.assertEqual(stats['response_bytes'], len(self.client.get('/leak').data) * 3)
+        # 分配最多的位置是视图中的bytearray
+        site, size, count = stats['sites'][0]
+        self.assertIn(os.path.basename(__file__), site)
+        self.assertGreaterEqual(size, 300000)
+
+    def test_metrics(self):
+        """测试以Prometheus文本格式导出"""
+        self.client.get('/leak')
+        text = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('apikit_memory_samples_total{endpoint="leak"} 1', text)
+        self.assertIn('apikit_memory_retained_bytes_total{endpoint="leak"}', text)
+
+    def test_dump(self):
+        """测试写入json文件并用命令行查看"""
+        self.client.get('/leak')
+        path = os.path.join(self.tmp.name, f'memory-{os.getpid()}.json')
+        with open(path) as f:
+            self.assertEqual(json.load(f)['endpoints']['leak']['samples'], 1)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            main([path, path])
+        self.assertIn('leak  samples=2', out.getvalue())
+        self.assertIn(os.path.basename(__file__), out.getvalue())
+
+    def test_concurrent(self):
+        """测试有其它请求同时处理时不采样"""
+        t = threading.Thread(target=lambda: self.app.test_client().get('/wait'))
+        t.start()
+        self.addCleanup(t.join)
+        self.addCleanup(self.release.set)
+        self.assertTrue(self.entered.wait(5))
+        # /wait正在处理，不采样/leak；/wait的采样期间有其它请求，丢弃
+        self.client.get('/leak')
+        self.release.set()
+        t.join()
+        stats = self.app.extensions[MEMORY_STATS_KEY]
+        self.assertEqual(stats.to_dict()['endpoints'], {})
+        self.client.get('/leak')
+        self.assertEqual(stats.to_dict()['endpoints']['leak']['samples'], 1)
@@ -0,0 +1,136 @@
+import threading
+
+from flask import Flask, url_for
+from marshmallow import Schema, fields
+
+from flask_apikit import APIKit
+from flask_apikit.exceptions import APIError
+from flask_apikit.metrics import current_timings, METRICS_KEY, Metrics, timing
+from flask_apikit.views import APIView
+from tests import AppTestCase
+
+
+class MetricsTestCase(AppTestCase):
+    config = {
+        'APIKIT_METRICS_ENABLED': True,
+        'APIKIT_METRICS_PATH': '/metrics',
+    }
+
+    def setup_app(self, app):
+        class ItemSchema(Schema):
+            id = fields.Int(required=True)
+
+        class Ret(APIView):
+            def post(self):
+                self.get_query()
+                return self.get_json(ItemSchema())
+
+            def get(self):
+                raise APIError
+
+        class Fail(APIView):
+            def get(self):
+                raise ValueError()
+
+        app.add_url_rule('/', methods=['GET', 'POST'], view_func=Ret.as_view('ret'))
+        app.add_url_rule('/fail', methods=['GET'], view_func=Fail.as_view('fail'))
+
+    def test_phases(self):
+        """测试各阶段耗时统计"""
+        self.post(url_for('ret'), json={'id': 1})
+        self.post(url_for('ret'), json={'id': 'x'})
+        self.get(url_for('ret'))
+        histograms = self.app.extensions[METRICS_KEY].collect()
+        count = {key: sum(histogram[:-1]) for key, histogram in histograms.items()}
+        self.assertEqual(count[('ret', 'request')], 3)
+        self.assertEqual(count[('ret', 'parse')], 2)
+        self.assertEqual(count[('ret', 'validate')], 2)
+        self.assertEqual(count[('ret', 'handler')], 3)
+        self.assertEqual(count[('ret', 'serialize')], 3)
+        self.assertEqual(count[('ret', 'cors')], 3)
+
+    def test_prometheus(self):
+        """测试Prometheus文本格式"""
+        self.post(url_for('ret'), json={'id': 1})
+        data, headers, status_code = self.get('/metrics')
+        self.assertEqual(status_code, 200)
+        self.assertTrue(headers['Content-Type'].startswith('text/plain'))
+        self.assertIn('# TYPE apikit_phase_seconds histogram', data)
+        self.assertIn('apikit_phase_seconds_bucket{endpoint="ret",phase="handler",le="+Inf"} 1', data)
+        self.assertIn('apikit_phase_seconds_count{endpoint="ret",phase="validate"} 1', data)
+
+    def test_exception(self):
+        """测试请求抛出异常（没有执行after_request）时同样还原计时"""
+        self.app.testing = True
+        with self.assertRaises(ValueError):
+            self.client.get(url_for('fail'))
+        self.assertIsNone(current_timings.get())
+
+    def test_disabled(self):
+        """测试关闭时不注册任何钩子"""
+        app = Flask(__name__)
+        APIKit(app)
+        self.assertNotIn(METRICS_KEY, app.extensions)
+        self.assertEqual(app.before_request_funcs, {})
+        self.assertEqual(app.after_request_funcs, {})
+
+    def test_threads(self):
+        """测试多线程写入与已结束线程的数据合并"""
+        metrics = Metrics(buckets=(0.001, 0.01))
+
+        def observe():
+            for ns in (500_000, 5_000_000, 50_000_000):
+                metrics.observe('a', 'handler', ns)
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(metrics.collect(), {('a', 'handler'): [4, 4, 4, 4 * 55_500_000]})
+        # 再次导出时已结束线程的数据不会重复计算
+        self.assertEqual(metrics.collect(), {('a', 'handler'): [4, 4, 4, 4 * 55_500_000]})
+        # 不导出时，新线程写入也会合并已结束线程的分片
+        for _ in range(20):
+            thread = threading.Thread(target=observe)
+            thread.start()
+            thread.join()
+        self.assertLessEqual(len(metrics._shards), 1)
+        self.assertEqual(metrics.collect(), {('a', 'handler'): [24, 24, 24, 24 * 55_500_000]})
+
+
+class ServerTimingTestCase(AppTestCase):
+    config = {'APIKIT_SERVER_TIMING': True}
+
+    def setup_app(self, app):
+        class Ret(APIView):
+            def get(self):
+                with timing('db'):
+                    self.get_query()
+                return {}
+
+        app.add_url_rule('/', methods=['GET'], view_func=Ret.as_view('ret'))
+
+    def test_server_timing(self):
+        """测试Server-Timing响应头"""
+        app = self.create_app()
+        data, headers, status_code = self.get('http://test/', client=app.test_client())
+        self.assertEqual(status_code, 200)
+        phases = [item.split(';')[0] for item in headers['Server-Timing'].split(', ')]
+        self.assertCountEqual(['request', 'parse', 'db', 'handler', 'serialize', 'cors'], phases)
+        self.assertIn('SERVER-TIMING', headers['Access-Control-Expose-Headers'])
+        # 没有开启统计
+        self.assertNotIn(METRICS_KEY, app.extensions)
+
+    def test_sample_and_origins(self):
+        """测试采样和Origin限制"""
+        app = self.create_app(APIKIT_SERVER_TIMING_SAMPLE_RATE=0)
+        data, headers, status_code = self.get('http://test/', client=app.test_client())
+        self.assertNotIn('Server-Timing', headers)
+        self.assertNotIn('Access-Control-Expose-Headers', headers)
+        app = self.create_app(APIKIT_SERVER_TIMING_ORIGINS=['https://trusted.com'])
+        data, headers, status_code = self.get('http://test/', client=app.test_client())
+        self.assertNotIn('Server-Timing', headers)
+        data, headers, status_code = self.get('http://test/', client=app.test_client(),
+                                              headers={'Origin': 'https://TRUSTED.com'})
+        self.assertIn('Server-Timing', headers)
@@ -96,6 +96,7 @@ class PaginationTestCase(AppTestCase):
         """测试从Query中获取分页参数的自定义query中的key"""
         self.app.config['APIKIT_PAGINATION_PAGE_KEY'] = 'xpage'
         self.app.config['APIKIT_PAGINATION_LIMIT_KEY'] = 'xlimit'
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -158,6 +159,7 @@ class PaginationTestCase(AppTestCase):
     def test_get_pagination_custom_max_limit(self):
         """测试从Query中获取分页参数的自定义最大限制"""
         self.app.config['APIKIT_PAGINATION_MAX_LIMIT'] = 1000
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -203,6 +205,7 @@ class PaginationTestCase(AppTestCase):
     def test_get_pagination_custom_default_limit(self):
         """测试从Query中获取分页参数的自定义默认限制"""
         self.app.config['APIKIT_PAGINATION_DEFAULT_LIMIT'] = 20
+        self.apikit.reload_config()
 
         class Ret(APIView):
             def get(self):
@@ -229,3 +232,42 @@ class PaginationTestCase(AppTestCase):
         self.assertEqual(data['page'], 2)
         self.assertEqual(data['limit'], 20)
         self.assertEqual(data['skip'], 20)
+
+    def test_default_headers(self):
+        """测试共用的默认响应头：不能修改，读取headers时复制"""
+        from flask_apikit.responses import APIResponse
+        from flask_apikit.settings import FrozenDict
+
+        with self.app.test_request_context('/?page=2'):
+            p1, p2 = Pagination(), Pagination()
+            self.assertIs(p1._headers, p2._headers)
+            self.assertIsInstance(p1._headers, FrozenDict)
+            with self.assertRaises(TypeError):
+                p1._headers['X-Other'] = '1'
+            # 读取headers后可以修改，不影响其他实例
+            p1.headers['X-Other'] = '1'
+            self.assertNotIn('X-Other', p2._headers)
+            p1.set_data([], 30)
+            self.assertEqual(p1.headers['X-Other'], '1')
+            self.assertEqual(p1.headers['X-Pagination-Page-Count'], 3)
+            # set_data生成新的字典
+            p2.set_data([], 30)
+            self.assertIsNot(type(p2._headers), FrozenDict)
+            self.assertNotIn('X-Other', p2.headers)
+            # 传入的headers会被直接修改
+            headers = {'X-Custom': 'a'}
+            p3 = Pagination(headers=headers).set_data([], 30)
+            self.assertIs(p3.headers, headers)
+            self.assertEqual(headers['X-Pagination-Count'], 30)
+            # 使用__slots__，没有__dict__
+            for obj in (p1, APIResponse({})):
+                with self.subTest(obj=obj):
+                    self.assertFalse(hasattr(obj, '__dict__'))
+
+    def test_page_count(self):
+        """测试总页数使用整数计算"""
+        with self.app.test_request_context('/?limit=10'):
+            for count, page_count in ((0, 0), (1, 1), (10, 1), (11, 2), (10 ** 17 + 1, 10 ** 16 + 1)):
+                with self.subTest(count=count):
+                    p = Pagination().set_data([], count)
+                    self.assertEqual(p.headers['X-Pagination-Page-Count'], page_count)
@@ -0,0 +1,83 @@
+import os
+import pstats
+import tempfile
+
+from flask_apikit.profiling import PROFILE_HEADER, sign
+from flask_apikit.views import APIView
+from tests import AppTestCase
+
+
+class ProfilingTestCase(AppTestCase):
+    config = {'APIKIT_PROFILE_ENABLED': True}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.config = dict(self.config, APIKIT_PROFILE_DIR=self.tmp.name)
+        super().setUp()
+
+    def setup_app(self, app):
+        class Ret(APIView):
+            def get(self):
+                return {}
+
+        app.add_url_rule('/a', methods=['GET'], view_func=Ret.as_view('a'))
+        app.add_url_rule('/b', methods=['GET'], view_func=Ret.as_view('b'))
+
+    def files(self, suffix='.pstats'):
+        return sorted(f for f in os.listdir(self.tmp.name) if f.endswith(suffix))
+
+    def test_sample_rate(self):
+        """测试采样率"""
+        client = self.create_app(APIKIT_PROFILE_SAMPLE_RATE=1).test_client()
+        client.get('/a')
+        files = self.files()
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith('-a.pstats'))
+        # 可以被pstats读取
+        pstats.Stats(os.path.join(self.tmp.name, files[0]))
+
+        client = self.create_app(APIKIT_PROFILE_SAMPLE_RATE=0).test_client()
+        client.get('/a')
+        self.assertEqual(self.files(), files)
+
+    def test_endpoints(self):
+        """测试按endpoint设置采样率"""
+        client = self.create_app(APIKIT_PROFILE_ENDPOINTS={'b': 1}).test_client()
+        client.get('/a')
+        client.get('/b')
+        files = self.files()
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith('-b.pstats'))
+
+    def test_signed_header(self):
+        """测试通过签名的请求头触发"""
+        client = self.create_app(APIKIT_PROFILE_SECRET='secret').test_client()
+        client.get('/a', headers={PROFILE_HEADER: sign('wrong', 'GET', '/a')})
+        client.get('/a', headers={PROFILE_HEADER: sign('secret', 'GET', '/b')})
+        client.get('/a', headers={PROFILE_HEADER: sign('secret', 'GET', '/a', 0)})
+        self.assertEqual(self.files(), [])
+        client.get('/a', headers={PROFILE_HEADER: sign('secret', 'GET', '/a')})
+        self.assertEqual(len(self.files()), 1)
+
+    def test_tracemalloc(self):
+        """测试tracemalloc快照"""
+        client = self.create_app(APIKIT_PROFILE_SAMPLE_RATE=1,
+                                 APIKIT_PROFILE_TRACEMALLOC=True).test_client()
+        client.get('/a')
+        self.assertEqual(len(self.files()), 1)
+        self.assertEqual(len(self.files('.tracemalloc')), 1)
+
+    def test_rotate(self):
+        """测试目录大小限制，超出时删除最早的文件"""
+        client = self.create_app(APIKIT_PROFILE_SAMPLE_RATE=1).test_client()
+        client.get('/a')
+        size = os.path.getsize(os.path.join(self.tmp.name, self.files()[0]))
+
+        client = self.create_app(APIKIT_PROFILE_SAMPLE_RATE=1,
+                                 APIKIT_PROFILE_MAX_BYTES=int(size * 2.2)).test_client()
+        for _ in range(4):
+            client.get('/a')
+        total = sum(os.path.getsize(os.path.join(self.tmp.name, f)) for f in self.files())
+        self.assertLessEqual(total, int(size * 2.2))
+        self.assertEqual(len(self.files()), 2)
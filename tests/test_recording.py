@@ -0,0 +1,137 @@
+import os
+import tempfile
+import time
+import unittest
+
+from flask import request
+
+from flask_apikit.exceptions import APIError
+from flask_apikit.recording import client_sender, read_records, RECORDER_KEY, replay
+from flask_apikit.views import APIView
+from tests import AppTestCase
+
+
+class RecordingTestCase(AppTestCase):
+    config = {
+        'APIKIT_RECORD_ENABLED': True,
+        'APIKIT_RECORD_SAMPLE_RATE': 1,
+        'APIKIT_JSON_ZERO_COPY': True,
+    }
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'requests.jsonl.gz')
+        self.config = dict(self.config, APIKIT_RECORD_FILE=self.path)
+        super().setUp()
+        self.addCleanup(self.app.extensions[RECORDER_KEY].shutdown)
+
+    def setup_app(self, app):
+        class Users(APIView):
+            def get(self):
+                if self.get_query().get('fail'):
+                    raise APIError()
+                return {'page': self.get_query().get('page')}
+
+            def post(self):
+                return self.get_json(), 201
+
+        app.add_url_rule('/users', methods=['GET', 'POST'], view_func=Users.as_view('users'))
+
+    def record(self) -> list:
+        client = self.app.test_client()
+        resp = client.post('/users', json={'name': 'apikit'},
+                           headers={'Authorization': 'Bearer secret', 'Origin': 'https://a.com'})
+        # 录制时读取了请求体，不影响视图读取
+        self.assertEqual(resp.get_json(), {'name': 'apikit'})
+        client.get('/users?page=2')
+        client.get('/users?fail=1')
+        self.app.extensions[RECORDER_KEY].flush()
+        return read_records(self.path)
+
+    def test_record(self):
+        """测试录制请求"""
+        post, get, fail = self.record()
+        self.assertEqual(post['method'], 'POST')
+        self.assertEqual(post['path'], '/users')
+        self.assertEqual(post['body'], '{"name": "apikit"}')
+        self.assertEqual(post['status'], 201)
+        self.assertEqual(post['endpoint'], 'users')
+        self.assertEqual(post['headers']['Origin'], 'https://a.com')
+        self.assertNotIn('Authorization', post['headers'])
+        self.assertGreater(post['duration'], 0)
+        self.assertEqual(get['path'], '/users?page=2')
+        self.assertIsNone(get['body'])
+        self.assertEqual(fail['status'], 400)
+
+    def test_replay(self):
+        """测试重放并对比状态码"""
+        records = self.record()
+        # 重放到不录制的app
+        sender = client_sender(self.create_app(APIKIT_RECORD_ENABLED=False))
+        result = replay(records, sender, speed=0)
+        self.assertEqual(result['requests'], 3)
+        self.assertEqual(result['mismatches'], [])
+        self.assertEqual(set(result['durations']), {'users'})
+
+        # 状态码不同的请求
+        records[1]['status'] = 500
+        result = replay(records, sender, speed=0)
+        self.assertEqual(result['mismatches'], [('GET', '/users?page=2', 500, 200)])
+
+    def test_queue_full(self):
+        """测试队列满时丢弃请求"""
+        writer = self.app.extensions[RECORDER_KEY]
+        # 停止后台线程，避免在两次请求之间写入
+        writer.shutdown()
+        writer.queue.maxsize = 1
+        self.app.test_client().get('/users')
+        self.app.test_client().get('/users')
+        self.assertEqual(writer.dropped, 1)
+
+    def test_body_already_read(self):
+        """测试录制前请求体已被读取：有缓存时录制缓存，没有缓存时不录制该请求"""
+        @self.app.route('/echo', methods=['POST'])
+        def echo():
+            return request.get_data()
+
+        def read_body():
+            if request.args.get('cache'):
+                request.get_data()
+            else:
+                request.stream.read()
+
+        # 在录制之前执行
+        self.app.before_request_funcs.setdefault(None, []).insert(0, read_body)
+        client = self.app.test_client()
+        resp = client.post('/users?cache=1', json={'name': 'apikit'})
+        self.assertEqual(resp.get_json(), {'name': 'apikit'})
+        with self.assertLogs('flask_apikit.recording', 'WARNING'):
+            client.post('/echo', data=b'lost')
+        self.app.extensions[RECORDER_KEY].flush()
+        records = read_records(self.path)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['body'], '{"name": "apikit"}')
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_fork(self):
+        """测试fork出的子进程中重新启动写入线程，并写入子进程pid对应的文件"""
+        template = os.path.join(self.tmp.name, 'requests-{pid}.jsonl')
+        app = self.create_app(APIKIT_RECORD_FILE=template)
+        writer = app.extensions[RECORDER_KEY]
+        writer.interval = 0.01
+        self.addCleanup(writer.shutdown)
+        pid = os.fork()
+        if pid == 0:
+            # 子进程：不调用shutdown，由后台线程写入
+            path = template.format(pid=os.getpid())
+            try:
+                app.test_client().get('/users')
+                deadline = time.monotonic() + 5
+                while not os.path.exists(path) and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            finally:
+                os._exit(0 if os.path.exists(path) else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertFalse(os.path.exists(template.format(pid=os.getpid())))
@@ -0,0 +1,99 @@
+from flask import Blueprint, url_for
+
+from flask_apikit.decorators import PREFLIGHT_CACHE_KEY
+from flask_apikit.exceptions import APIError, ERROR_CACHE_KEY
+from flask_apikit.responses import Pagination
+from flask_apikit.settings import configure_blueprint, Settings, SETTINGS_KEY
+from flask_apikit.views import APIView
+from tests import AppTestCase
+
+
+class Ret(APIView):
+    def get(self):
+        p = Pagination()
+        return {'limit': p.limit}
+
+
+class SettingsTestCase(AppTestCase):
+    def test_snapshot(self):
+        """测试init_app生成的只读配置快照"""
+        settings = self.app.extensions[SETTINGS_KEY]
+        self.assertIsInstance(settings, Settings)
+        self.assertEqual(settings.pagination_default_limit, 10)
+        self.assertEqual(settings.access_control_allow_headers, ('Authorization', 'Content-Type'))
+        self.assertEqual(settings.allow_headers, 'AUTHORIZATION, CONTENT-TYPE')
+        with self.assertRaises(AttributeError):
+            settings.pagination_default_limit = 20
+        with self.assertRaises(AttributeError):
+            settings.other = 1
+        # 修改app.config后需要reload_config
+        self.app.config['APIKIT_PAGINATION_DEFAULT_LIMIT'] = 20
+        self.assertEqual(self.app.extensions[SETTINGS_KEY].pagination_default_limit, 10)
+        self.apikit.reload_config()
+        self.assertEqual(self.app.extensions[SETTINGS_KEY].pagination_default_limit, 20)
+
+    def test_reload_config_clears_caches(self):
+        """测试reload_config清空根据旧配置生成的Preflight响应头和错误响应体"""
+        class Err(APIError):
+            status_code = 401
+            code = 1
+            message = 'Need Login'
+
+        self.app.add_url_rule('/', methods=['GET', 'OPTIONS'], view_func=Ret.as_view('ret'))
+        data, headers, status_code = self.options(url_for('ret'))
+        self.assertEqual(headers['Access-Control-Max-Age'], '600')
+        Err().to_response()
+        self.assertIn(PREFLIGHT_CACHE_KEY, self.app.extensions)
+        self.assertIn(ERROR_CACHE_KEY, self.app.extensions)
+
+        self.app.config['APIKIT_ACCESS_CONTROL_MAX_AGE'] = 60
+        self.apikit.reload_config()
+        self.assertNotIn(PREFLIGHT_CACHE_KEY, self.app.extensions)
+        self.assertNotIn(ERROR_CACHE_KEY, self.app.extensions)
+        data, headers, status_code = self.options(url_for('ret'))
+        self.assertEqual(headers['Access-Control-Max-Age'], '60')
+
+    def test_blueprint(self):
+        """测试蓝本单独设置的配置"""
+        admin = Blueprint('admin', __name__, url_prefix='/admin')
+        configure_blueprint(admin, APIKIT_PAGINATION_DEFAULT_LIMIT=50,
+                            APIKIT_ACCESS_CONTROL_ALLOW_ORIGIN=['https://admin.example.com'])
+        admin.add_url_rule('/', view_func=Ret.as_view('ret'))
+        # 嵌套的蓝本继承外层蓝本的设置
+        nested = Blueprint('nested', __name__, url_prefix='/nested')
+        nested.add_url_rule('/', view_func=Ret.as_view('ret'))
+        admin.register_blueprint(nested)
+        reports = Blueprint('reports', __name__, url_prefix='/reports')
+        configure_blueprint(reports, APIKIT_PAGINATION_MAX_LIMIT=5)
+        reports.add_url_rule('/', view_func=Ret.as_view('ret'))
+        admin.register_blueprint(reports)
+        self.app.register_blueprint(admin)
+        # 以其它名字注册同一蓝本
+        self.app.register_blueprint(admin, name='admin2', url_prefix='/admin2')
+        self.app.add_url_rule('/', view_func=Ret.as_view('ret'))
+
+        data, headers, status_code = self.get(url_for('ret'))
+        self.assertEqual(data['limit'], 10)
+        self.assertEqual(headers['Access-Control-Allow-Origin'], '*')
+        for endpoint in ('admin.ret', 'admin2.ret', 'admin.nested.ret'):
+            with self.subTest(endpoint=endpoint):
+                data, headers, status_code = self.get(
+                    url_for(endpoint), headers={'Origin': 'https://admin.example.com'})
+                self.assertEqual(data['limit'], 50)
+                self.assertEqual(headers['Access-Control-Allow-Origin'], 'https://admin.example.com')
+        data, headers, status_code = self.get(url_for('admin.reports.ret'),
+                                              query_string={'limit': 20})
+        self.assertEqual(data['limit'], 5)
+        data, headers, status_code = self.get(url_for('admin.reports.ret'))
+        self.assertEqual(data['limit'], 5)
+
+        # reload_config同时重新生成蓝本的设置
+        self.app.config['APIKIT_PAGINATION_MAX_LIMIT'] = 30
+        self.apikit.reload_config()
+        data, headers, status_code = self.get(url_for('admin.ret'), query_string={'limit': 40})
+        self.assertEqual(data['limit'], 30)
+
+    def test_blueprint_unknown_key(self):
+        """测试蓝本不能覆盖处理请求时不读取的配置"""
+        with self.assertRaises(ValueError):
+            configure_blueprint(Blueprint('bp', __name__), APIKIT_METRICS_ENABLED=True)
@@ -0,0 +1,125 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from flask_apikit.tracing import current_trace_id, span, TRACING_KEY
+from flask_apikit.views import APIView
+from tests import AppTestCase
+
+
+@span('load', source='cache')
+def load():
+    with span('db.query') as s:
+        s.set('rows', 1)
+    return current_trace_id()
+
+
+class TracingTestCase(AppTestCase):
+    config = {
+        'APIKIT_TRACING_ENABLED': True,
+        'APIKIT_TRACING_INTERVAL': 3600,
+    }
+
+    def setUp(self):
+        self.exported = []
+        self.config = dict(self.config, APIKIT_TRACING_EXPORTER=self.exported.extend)
+        super().setUp()
+        self.processor = self.app.extensions[TRACING_KEY]
+        self.addCleanup(self.processor.shutdown)
+
+    def setup_app(self, app):
+        class Ret(APIView):
+            def get(self):
+                return {'trace_id': load()}
+
+        class Error(APIView):
+            def get(self):
+                with span('fail'):
+                    raise ValueError()
+
+        app.add_url_rule('/', methods=['GET'], view_func=Ret.as_view('index'))
+        app.add_url_rule('/error', methods=['GET'], view_func=Error.as_view('error'))
+
+    def spans(self) -> dict:
+        self.processor.flush()
+        return {s['name']: s for s in self.exported}
+
+    def test_spans(self):
+        """测试span的父子关系"""
+        resp = self.client.get('/')
+        trace_id = resp.headers['X-Trace-Id']
+        self.assertEqual(len(trace_id), 32)
+        self.assertEqual(resp.get_json()['trace_id'], trace_id)
+        spans = self.spans()
+        self.assertEqual(set(spans), {'index', 'load', 'db.query'})
+        self.assertTrue(all(s['trace_id'] == trace_id for s in spans.values()))
+        self.assertIsNone(spans['index']['parent_id'])
+        self.assertEqual(spans['load']['parent_id'], spans['index']['span_id'])
+        self.assertEqual(spans['db.query']['parent_id'], spans['load']['span_id'])
+        self.assertEqual(spans['load']['attrs'], {'source': 'cache'})
+        self.assertEqual(spans['db.query']['attrs'], {'rows': 1})
+        self.assertEqual(spans['index']['attrs'], {'method': 'GET', 'path': '/'})
+        self.assertLessEqual(spans['index']['start'], spans['load']['start'])
+        self.assertGreaterEqual(spans['index']['duration'], spans['load']['duration'])
+        # 请求结束后不再记录
+        self.assertIsNone(load())
+        self.assertEqual(len(self.spans()), 3)
+
+    def test_propagation(self):
+        """测试从请求头中获取trace id"""
+        parent = '00f067aa0ba902b7'
+        trace_id = '4bf92f3577b34da6a3ce929d0e0e4736'
+        resp = self.client.get('/', headers={'traceparent': f'00-{trace_id}-{parent}-01'})
+        self.assertEqual(resp.headers['X-Trace-Id'], trace_id)
+        self.assertEqual(self.spans()['index']['parent_id'], parent)
+        self.exported.clear()
+        resp = self.client.get('/', headers={'X-Trace-Id': 'abc-123-def'})
+        self.assertEqual(resp.headers['X-Trace-Id'], 'abc-123-def')
+        self.assertIsNone(self.spans()['index']['parent_id'])
+        # 格式不正确时生成新的trace id
+        resp = self.client.get('/', headers={'X-Trace-Id': 'bad id'})
+        self.assertEqual(len(resp.headers['X-Trace-Id']), 32)
+
+    def test_error(self):
+        """测试记录span中的异常"""
+        self.app.testing = False
+        self.assertEqual(self.client.get('/error').status_code, 500)
+        spans = self.spans()
+        self.assertEqual(spans['fail']['error'], 'ValueError')
+        self.assertEqual(spans['error']['error'], 'ValueError')
+
+    def test_jsonl_exporter(self):
+        """测试写入JSONL文件"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'traces.jsonl')
+        app = self.create_app(APIKIT_TRACING_EXPORTER=None, APIKIT_TRACING_FILE=path)
+        app.test_client().get('/')
+        app.extensions[TRACING_KEY].shutdown()
+        with open(path) as f:
+            names = [json.loads(line)['name'] for line in f]
+        self.assertEqual(names, ['db.query', 'load', 'index'])
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_fork(self):
+        """测试fork出的子进程中重新启动导出线程"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'traces.jsonl')
+        app = self.create_app(APIKIT_TRACING_EXPORTER=None, APIKIT_TRACING_FILE=path,
+                              APIKIT_TRACING_INTERVAL=0.01)
+        self.addCleanup(app.extensions[TRACING_KEY].shutdown)
+        pid = os.fork()
+        if pid == 0:
+            # 子进程：不调用shutdown，由后台线程导出
+            try:
+                app.test_client().get('/')
+                deadline = time.monotonic() + 5
+                while not os.path.exists(path) and time.monotonic() < deadline:
+                    time.sleep(0.01)
+            finally:
+                os._exit(0 if os.path.exists(path) else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
@@ -0,0 +1,106 @@
+import io
+
+from flask import url_for
+from marshmallow import Schema, fields
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
+
+from flask_apikit.views import APIView
+from tests import AppTestCase
+
+
+class UploadTestCase(AppTestCase):
+    def setUp(self):
+        super().setUp()
+
+        class FormSchema(Schema):
+            name = fields.Str(required=True)
+
+        class Ret(APIView):
+            def post(self):
+                data, files = self.get_files(FormSchema())
+                f = files['file']
+                return {
+                    'data': data,
+                    'filename': f.filename,
+                    'content': f.read().decode(),
+                    'rolled': f.stream._rolled,
+                    'same': files is self.get_files()[1]
+                }
+
+        class Twice(APIView):
+            def post(self):
+                self.get_files()
+                return self.get_files(allowed_types=['image/*'])[0]
+
+        self.app.add_url_rule('/', methods=['POST'], view_func=Ret.as_view('ret'))
+        self.app.add_url_rule('/twice', methods=['POST'], view_func=Twice.as_view('twice'))
+
+    def upload(self, content: bytes, content_type='text/plain', **form):
+        data = {'file': (io.BytesIO(content), 'a.txt', content_type), **form}
+        return self.post(url_for('ret'), data=data, content_type='multipart/form-data')
+
+    def test_upload(self):
+        """测试上传文件"""
+        data, headers, status_code = self.upload(b'hello', name='bob')
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data['data'], {'name': 'bob'})
+        self.assertEqual(data['filename'], 'a.txt')
+        self.assertEqual(data['content'], 'hello')
+        self.assertFalse(data['rolled'])
+        self.assertTrue(data['same'])
+        # 表单验证
+        data, headers, status_code = self.upload(b'hello')
+        self.assertEqual(status_code, 400)
+        self.assertEqual(data['code'], 2)
+
+    def test_memory_threshold(self):
+        """测试超过阈值的文件写入临时文件"""
+        self.app.config['APIKIT_UPLOAD_MEMORY_THRESHOLD'] = 4
+        self.apikit.reload_config()
+        data, headers, status_code = self.upload(b'hello', name='bob')
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data['content'], 'hello')
+        self.assertTrue(data['rolled'])
+
+    def test_limits(self):
+        """测试文件大小和类型限制"""
+        self.app.config['APIKIT_UPLOAD_MAX_FILE_BYTES'] = 4
+        self.apikit.reload_config()
+        data, headers, status_code = self.upload(b'hello', name='bob')
+        self.assertEqual(status_code, 413)
+        self.assertEqual(data['code'], 4)
+        self.app.config['APIKIT_UPLOAD_MAX_FILE_BYTES'] = 0
+        self.app.config['APIKIT_UPLOAD_MAX_BYTES'] = 16
+        self.apikit.reload_config()
+        data, headers, status_code = self.upload(b'hello', name='bob')
+        self.assertEqual(status_code, 413)
+        # 没有Content-Length的chunked请求在读取过程中检查
+        boundary, body = encode_multipart({
+            'name': 'bob', 'file': FileStorage(io.BytesIO(b'hello'), 'a.txt', content_type='text/plain')})
+        for max_bytes, expected in ((len(body) - 1, 413), (len(body), 200)):
+            self.app.config['APIKIT_UPLOAD_MAX_BYTES'] = max_bytes
+            self.apikit.reload_config()
+            data, headers, status_code = self.post(
+                url_for('ret'),
+                input_stream=io.BytesIO(body),
+                headers={'Content-Type': f'multipart/form-data; boundary={boundary}',
+                         'Transfer-Encoding': 'chunked'},
+                environ_overrides={'wsgi.input_terminated': True})
+            self.assertEqual(status_code, expected)
+        self.app.config['APIKIT_UPLOAD_MAX_BYTES'] = 0
+        self.app.config['APIKIT_UPLOAD_ALLOWED_TYPES'] = ['image/*']
+        self.apikit.reload_config()
+        data, headers, status_code = self.upload(b'hello', name='bob')
+        self.assertEqual(status_code, 415)
+        self.assertEqual(data['code'], 5)
+        data, headers, status_code = self.upload(b'hello', 'image/png', name='bob')
+        self.assertEqual(status_code, 200)
+
+    def test_different_limits(self):
+        """测试同一请求中以不同的限制再次调用get_files"""
+        data = {'file': (io.BytesIO(b'hello'), 'a.txt', 'text/plain')}
+        with self.assertLogs(self.app.logger, 'ERROR') as logs:
+            resp = self.client.post(url_for('twice'), data=data, content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 500)
+        self.assertIn('different max_file_bytes/allowed_types', logs.output[0])
@@ -1,9 +1,35 @@
-from flask import url_for
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import request, url_for
+from marshmallow import Schema, ValidationError, fields, post_load, validates_schema
+
 from flask_apikit.utils.query import QueryParser
 from flask_apikit.views import APIView
 from tests import AppTestCase
 
 
+class ItemSchema(Schema):
+    """verify_many所用，定义在模块顶层以便pickle"""
+    id = fields.Int(required=True)
+
+
+class UniqueItemSchema(ItemSchema):
+    """同一批数据中id不能重复"""
+
+    @validates_schema(pass_many=True)
+    def validate_unique(self, data, many, **kwargs):
+        if many and len({item['id'] for item in data}) < len(data):
+            raise ValidationError('Duplicate id.')
+
+
+class WrappedItemSchema(ItemSchema):
+    """验证通过的数据经过post_load处理"""
+
+    @post_load
+    def wrap(self, data, **kwargs):
+        return {'wrapped': data['id']}
+
+
 class ViewHelperTestCase(AppTestCase):
     """测试APIView中快捷方法"""
 
@@ -293,3 +319,221 @@ class ViewHelperTestCase(AppTestCase):
         )
         self.assertEqual(status_code, 200)
         self.assertEqual(data, {'true': False})
+
+    def test_memoize_request_data(self):
+        """测试同一请求内get_json/get_query结果缓存"""
+        from marshmallow import Schema, fields, validates
+
+        calls = []
+
+        class CountSchema(Schema):
+            a = fields.Int()
+
+            @validates('a')
+            def count(self, value):
+                calls.append(value)
+
+        schema = CountSchema()
+
+        class Ret(APIView):
+            def post(self):
+                first = self.get_json(schema)
+                second = self.get_json(schema)
+                other = self.get_json(schema, additional_data={'a': 2})
+                query = self.get_query({'b': QueryParser.int})
+                return {
+                    'same': first is second,
+                    'other': other,
+                    'query_same': query is self.get_query({'b': QueryParser.int}),
+                    'query_other': self.get_query({'b': [QueryParser.int]})
+                }
+
+        self.app.add_url_rule('/', methods=['POST'], view_func=Ret.as_view('ret'))
+        data, headers, status_code = self.post(url_for('ret', b=3), json={'a': 1})
+        self.assertEqual(status_code, 200)
+        self.assertTrue(data['same'])
+        self.assertEqual(data['other'], {'a': 2})
+        self.assertTrue(data['query_same'])
+        self.assertEqual(data['query_other'], {'b': [3]})
+        # 相同参数只验证一次，additional_data不同则重新验证
+        self.assertEqual(calls, [1, 2])
+
+        # 关闭缓存
+        calls.clear()
+        Ret.memoize_request_data = False
+        data, headers, status_code = self.post(url_for('ret'), json={'a': 1})
+        self.assertEqual(status_code, 200)
+        self.assertFalse(data['same'])
+        self.assertEqual(calls, [1, 1, 2])
+
+    def test_json_limits(self):
+        """测试get_json的请求体大小和嵌套深度限制"""
+        import io
+        import json
+
+        class Ret(APIView):
+            def post(self):
+                return self.get_json()
+
+        class Small(Ret):
+            max_json_bytes = 16
+
+        class Twice(APIView):
+            def post(self):
+                return {'first': self.get_json(), 'second': self.get_json(force=True)}
+
+        self.app.config['APIKIT_MAX_JSON_BYTES'] = 64
+        self.app.config['APIKIT_MAX_JSON_DEPTH'] = 3
+        self.apikit.reload_config()
+        self.app.add_url_rule('/', methods=['POST'], view_func=Ret.as_view('ret'))
+        self.app.add_url_rule('/small', methods=['POST'], view_func=Small.as_view('small'))
+        self.app.add_url_rule('/twice', methods=['POST'], view_func=Twice.as_view('twice'))
+
+        data, headers, status_code = self.post(url_for('ret'), json={'a': [1, {'b': 2}]})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data, {'a': [1, {'b': 2}]})
+        # 全局限制
+        data, headers, status_code = self.post(url_for('ret'), json={'a': 'x' * 64})
+        self.assertEqual(status_code, 413)
+        self.assertEqual(data['code'], 4)
+        # View的限制
+        data, headers, status_code = self.post(url_for('small'), json={'a': 'x' * 16})
+        self.assertEqual(status_code, 413)
+        # 嵌套深度
+        data, headers, status_code = self.post(url_for('ret'), json={'a': [[[1]]]})
+        self.assertEqual(status_code, 413)
+        self.assertEqual(data['code'], 4)
+        # 没有Content-Length的chunked请求
+        for body, expected in ((json.dumps({'a': 1}), 200), (json.dumps({'a': 'x' * 64}), 413)):
+            data, headers, status_code = self.post(
+                url_for('ret'),
+                input_stream=io.BytesIO(body.encode()),
+                headers={'Content-Type': 'application/json', 'Transfer-Encoding': 'chunked'},
+                environ_overrides={'wsgi.input_terminated': True}
+            )
+            self.assertEqual(status_code, expected)
+        # 没有Content-Length时读取的请求体同样缓存，参数不同的get_json也能读到
+        data, headers, status_code = self.post(
+            url_for('twice'),
+            input_stream=io.BytesIO(b'{"a": 1}'),
+            headers={'Content-Type': 'application/json', 'Transfer-Encoding': 'chunked'},
+            environ_overrides={'wsgi.input_terminated': True}
+        )
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data, {'first': {'a': 1}, 'second': {'a': 1}})
+
+    def test_json_decoders(self):
+        """测试get_json使用不同的json解码器"""
+        from flask_apikit.utils.body import JSON_DECODERS
+
+        class Ret(APIView):
+            def post(self):
+                return self.get_json()
+
+        self.app.add_url_rule('/', methods=['POST'], view_func=Ret.as_view('ret'))
+        request_data = {'str': '中文', 'list': [1, 1.5, True, None], 'dict': {'a': {}}}
+        for decoder in [None, 'auto', *JSON_DECODERS]:
+            for zero_copy in (False, True):
+                with self.subTest(decoder=decoder, zero_copy=zero_copy):
+                    self.app.config['APIKIT_JSON_DECODER'] = decoder
+                    self.app.config['APIKIT_JSON_ZERO_COPY'] = zero_copy
+                    self.apikit.reload_config()
+                    data, headers, status_code = self.post(url_for('ret'), json=request_data)
+                    self.assertEqual(status_code, 200)
+                    self.assertEqual(data, request_data)
+                    # 错误的json
+                    data, headers, status_code = self.post(
+                        url_for('ret'), data='{', headers={'Content-Type': 'application/json'})
+                    self.assertEqual(status_code, 400)
+
+    def test_zero_copy_fallback(self):
+        """测试zero-copy读取请求体时遵守MAX_CONTENT_LENGTH，且请求体已被读取时仍能解析"""
+        import json
+
+        class Ret(APIView):
+            def post(self):
+                return self.get_json()
+
+        class Twice(APIView):
+            def post(self):
+                return {'first': self.get_json(), 'second': self.get_json(force=True),
+                        'raw': len(request.get_data())}
+
+        self.app.add_url_rule('/', methods=['POST'], view_func=Ret.as_view('ret'))
+        self.app.add_url_rule('/twice', methods=['POST'], view_func=Twice.as_view('twice'))
+        self.app.config['APIKIT_JSON_ZERO_COPY'] = True
+        self.apikit.reload_config()
+        request_data = {'a': 'x' * 100}
+        # zero-copy读取的请求体同样缓存，参数不同的get_json也能读到
+        data, headers, status_code = self.post(url_for('twice'), json=request_data)
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data['first'], request_data)
+        self.assertEqual(data['second'], request_data)
+        self.assertEqual(data['raw'], len(json.dumps(request_data)))
+        self.app.config['MAX_CONTENT_LENGTH'] = 10
+        data, headers, status_code = self.post(url_for('ret'), json=request_data)
+        self.assertEqual(status_code, 413)
+        self.app.config['MAX_CONTENT_LENGTH'] = None
+        # before_request中已经读取了请求体
+        self.app.before_request(lambda: request.get_data() and None)
+        data, headers, status_code = self.post(url_for('ret'), json=request_data)
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data, request_data)
+
+    def test_verify_many(self):
+        """测试批量验证"""
+
+        class Ret(APIView):
+            def post(self):
+                data, errors = self.verify_many(self.get_json(), ItemSchema(), chunk_size=10)
+                return {'data': data, 'errors': errors}
+
+        class Unique(APIView):
+            def post(self):
+                data, errors = self.verify_many(self.get_json(), UniqueItemSchema(), chunk_size=2)
+                return {'data': data, 'errors': errors}
+
+        class Wrapped(APIView):
+            def post(self):
+                data, errors = self.verify_many(self.get_json(), WrappedItemSchema(), chunk_size=2)
+                return {'data': data, 'errors': errors}
+
+        self.app.add_url_rule('/', methods=['POST'], view_func=Ret.as_view('ret'))
+        request_data = [{'id': i} if i % 7 else {'id': 'x'} for i in range(30)]
+        expected = [{'id': i} for i in range(30) if i % 7]
+        with ProcessPoolExecutor(2) as executor:
+            for bulk_executor in (None, executor):
+                with self.subTest(executor=bulk_executor):
+                    self.app.config['APIKIT_BULK_EXECUTOR'] = bulk_executor
+                    self.app.config['APIKIT_BULK_OFFLOAD_MIN_ITEMS'] = 0
+                    self.apikit.reload_config()
+                    data, headers, status_code = self.post(url_for('ret'), json=request_data)
+                    self.assertEqual(status_code, 200)
+                    self.assertEqual(data['data'], expected)
+                    self.assertEqual(sorted(data['errors']), ['0', '14', '21', '28', '7'])
+        # 限制错误个数
+        self.app.config['APIKIT_BULK_EXECUTOR'] = None
+        self.app.config['APIKIT_BULK_MAX_ERRORS'] = 2
+        self.apikit.reload_config()
+        data, headers, status_code = self.post(url_for('ret'), json=request_data)
+        self.assertEqual(data['data'], expected)
+        self.assertEqual(sorted(data['errors']), ['0', '7'])
+        # 针对整批数据的错误
+        self.app.config['APIKIT_BULK_MAX_ERRORS'] = 0
+        self.apikit.reload_config()
+        self.app.add_url_rule('/unique', methods=['POST'], view_func=Unique.as_view('unique'))
+        data, headers, status_code = self.post(url_for('unique'), json=[
+            {'id': 1}, {'id': 2}, {'id': 3}, {'id': 3}, {'id': 5}, {'id': 5}, {'id': 7}])
+        self.assertEqual(status_code, 200)
+        self.assertEqual(data['data'], [{'id': 1}, {'id': 2}, {'id': 7}])
+        self.assertEqual(data['errors'], {'_schema': ['Duplicate id.']})
+        # 有错误的一批数据中验证通过的数据同样经过post_load
+        self.app.add_url_rule('/wrapped', methods=['POST'], view_func=Wrapped.as_view('wrapped'))
+        data, headers, status_code = self.post(url_for('wrapped'), json=[
+            {'id': 1}, {'id': 2}, {'id': 3}, {'id': 'x'}])
+        self.assertEqual(data['data'], [{'wrapped': 1}, {'wrapped': 2}, {'wrapped': 3}])
+        self.assertEqual(list(data['errors']), ['3'])
+        # 不是列表
+        data, headers, status_code = self.post(url_for('ret'), json={'id': 1})
+        self.assertEqual(status_code, 400)
+        self.assertEqual(data['code'], 2)
@@ -0,0 +1,75 @@
+import gc
+import unittest
+
+from flask import Flask
+
+from flask_apikit import APIKit
+from flask_apikit.decorators import PREFLIGHT_CACHE_KEY
+from flask_apikit.exceptions import APIError, ERROR_CACHE_KEY
+from flask_apikit.views import APIView
+
+
+class NotFound(APIError):
+    status_code = 404
+    code = 404
+    message = 'Not Found'
+
+
+class WarmupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.warmed = []
+        warmed = self.warmed
+        self.app = Flask(__name__)
+        self.apikit = APIKit(self.app)
+
+        class Users(APIView):
+            @classmethod
+            def warmup(cls, app):
+                warmed.append((cls, app))
+
+            def get(self, id=None):
+                return {'id': id}
+
+        class Items(APIView):
+            def get(self):
+                return []
+
+        self.Users = Users
+        self.app.add_url_rule('/users', methods=['GET', 'OPTIONS'], view_func=Users.as_view('users'))
+        self.app.add_url_rule('/users/<int:id>', methods=['GET', 'PATCH', 'OPTIONS'],
+                              view_func=Users.as_view('user'))
+        self.app.add_url_rule('/items', view_func=Items.as_view('items'))
+
+    def test_warmup(self):
+        """测试预先生成Preflight响应头、错误响应体并调用APIView.warmup"""
+        result = self.apikit.warmup()
+        # 包括Flask的static路由
+        self.assertEqual(result['preflight'], 3)
+        self.assertEqual(result['views'], 2)
+        self.assertGreaterEqual(result['errors'], 4)
+        self.assertEqual(self.warmed, [(self.Users, self.app)])
+        cache = self.app.extensions[PREFLIGHT_CACHE_KEY]
+        self.assertEqual(dict(cache[('/users/<int:id>', 'user')])['Access-Control-Allow-Methods'],
+                         'GET, HEAD, OPTIONS, PATCH')
+        self.assertIn((NotFound, 404, 'Not Found'), self.app.extensions[ERROR_CACHE_KEY])
+
+        # 与没有warmup时的响应相同
+        resp = self.app.test_client().options('/users/1', headers={'Origin': 'https://a.com'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Access-Control-Allow-Methods'], 'GET, HEAD, OPTIONS, PATCH')
+        self.assertEqual(resp.headers['Access-Control-Max-Age'], '600')
+
+    @unittest.skipUnless(hasattr(gc, 'freeze'), 'requires Python 3.7+')
+    def test_freeze(self):
+        """测试gc.freeze"""
+        self.addCleanup(gc.unfreeze)
+        self.apikit.warmup(freeze=True)
+        self.assertGreater(gc.get_freeze_count(), 0)
+
+    def test_preflight_overlapping_rules(self):
+        """测试多个路由匹配同一路径时不缓存Preflight响应头"""
+        self.app.add_url_rule('/items', 'items_post', lambda: {}, methods=['POST', 'OPTIONS'])
+        self.app.add_url_rule('/items', 'items_options', APIView.as_view('items_options'),
+                              methods=['OPTIONS'])
+        self.apikit.warmup()
+        self.assertNotIn(('/items', 'items_options'), self.app.extensions[PREFLIGHT_CACHE_KEY])
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+import unittest
+
+from flask import Blueprint
+
+from flask_apikit import watchdog
+from flask_apikit.views import APIView
+from tests import AppTestCase
+
+
+class WatchdogTestCase(AppTestCase):
+    config = {
+        'APIKIT_WATCHDOG_ENABLED': True,
+        'APIKIT_WATCHDOG_BUDGET': 0.01,
+        'APIKIT_WATCHDOG_BUDGETS': {'fast': 0, 'slow': 0.01, 'admin.slow': 0},
+        # 手动调用check，避免后台线程抢先记录
+        'APIKIT_WATCHDOG_INTERVAL': 3600,
+    }
+
+    def setUp(self):
+        self.release = threading.Event()
+        super().setUp()
+        self.addCleanup(watchdog.stop_watchdog)
+
+    def setup_app(self, app):
+        release = self.release
+
+        class Slow(APIView):
+            def get(self):
+                release.wait(5)
+                return {}
+
+        app.add_url_rule('/slow', methods=['GET'], view_func=Slow.as_view('slow'))
+        app.add_url_rule('/fast', methods=['GET'], view_func=Slow.as_view('fast'))
+        # 与app中的视图同名
+        bp = Blueprint('admin', __name__)
+        bp.add_url_rule('/slow', methods=['GET'], view_func=Slow.as_view('slow'))
+        app.register_blueprint(bp, url_prefix='/admin')
+
+    def request_in_thread(self, url):
+        t = threading.Thread(target=lambda: self.app.test_client().get(url))
+        t.start()
+        self.addCleanup(t.join)
+        self.addCleanup(self.release.set)
+        # 等待请求进入api_view
+        for _ in range(500):
+            if watchdog.inflight:
+                break
+            time.sleep(0.001)
+        return t
+
+    def test_report_slow_request(self):
+        """测试记录超出预算的请求的调用栈"""
+        t = self.request_in_thread('/slow')
+        time.sleep(0.02)
+        with self.assertLogs('flask_apikit.watchdog', 'WARNING') as logs:
+            reports = watchdog._watchdog.check()
+        self.assertEqual(len(reports), 1)
+        endpoint, elapsed, stack = reports[0]
+        self.assertEqual(endpoint, 'slow')
+        self.assertGreater(elapsed, 0.01)
+        # 调用栈停在视图函数中
+        self.assertIn('release.wait(5)', stack)
+        self.assertIn('slow', logs.output[0])
+        # 同一请求只记录一次
+        self.assertEqual(watchdog._watchdog.check(), [])
+        self.release.set()
+        t.join()
+        self.assertEqual(watchdog.inflight, {})
+
+    def test_budget_disabled(self):
+        """测试endpoint的预算为0时不检查"""
+        self.request_in_thread('/fast')
+        time.sleep(0.02)
+        self.assertEqual(len(watchdog.inflight), 1)
+        self.assertEqual(watchdog._watchdog.check(), [])
+
+    def test_blueprint_budget(self):
+        """测试按request.endpoint（含蓝本名）查找预算"""
+        self.request_in_thread('/admin/slow')
+        time.sleep(0.02)
+        self.assertEqual([v[1] for v in watchdog.inflight.values()], ['admin.slow'])
+        self.assertEqual(watchdog._watchdog.check(), [])
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_fork(self):
+        """测试fork出的子进程中重新启动watchdog"""
+        parent = watchdog._watchdog
+        pid = os.fork()
+        if pid == 0:
+            ok = False
+            try:
+                child = watchdog._watchdog
+                ok = (child is not parent and child.is_alive() and child.requests is watchdog.inflight
+                      and child.budgets == parent.budgets)
+            finally:
+                os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertIs(watchdog._watchdog, parent)
+
+    def test_disabled(self):
+        """测试没有开启watchdog时不记录请求"""
+        watchdog.stop_watchdog()
+        self.assertIsNone(watchdog.inflight)
+        self.release.set()
+        self.assertEqual(self.app.test_client().get('/slow').status_code, 200)